@@ -1,29 +1,55 @@
-from typing import List
+import importlib
+import time
+from dataclasses import dataclass
+from typing import Dict, List
 
 import streamlit as st
-from chatgpt_app.const import SessionKey
+from chatgpt_app.const import PageId, SessionKey
+from chatgpt_app.logger import get_logger
 from chatgpt_app.pages.base import BasePage
 from chatgpt_app.session import StreamlistSessionManager
 
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class PageSpec:
+    """A page declared by id and title; ``module`` is imported only when the page is first selected."""
+
+    page_id: PageId
+    title: str
+    module: str
+    class_name: str
+
 
 class MultiPageApp:
-    def __init__(self, sm: StreamlistSessionManager, pages: List[BasePage], nav_label: str = "ページ一覧") -> None:
+    def __init__(self, sm: StreamlistSessionManager, pages: List[PageSpec], nav_label: str = "ページ一覧") -> None:
         self.sm = sm
-        self.pages = {page.page_id: page for page in pages}
+        self.specs = {spec.page_id: spec for spec in pages}
         self.nav_label = nav_label
+        self._pages: Dict[PageId, BasePage] = {}
 
-    def init_session(self) -> None:
-        self.sm = StreamlistSessionManager()
+    def get_page(self, page_id: PageId) -> BasePage:
+        page = self._pages.get(page_id)
+        if page is None:
+            spec = self.specs[page_id]
+            started_at = time.perf_counter()
+            with st.spinner(f"Loading {spec.title} ..."):
+                page_class = getattr(importlib.import_module(spec.module), spec.class_name)
+            logger.info(f"imported {spec.module} in {(time.perf_counter() - started_at) * 1000:.1f} ms")
+            page = page_class(page_id=spec.page_id, title=spec.title, sm=self.sm)
+            self._pages[page_id] = page
+        return page
 
     def render(self) -> None:
         # ページ選択ボックス
         page_id = st.sidebar.selectbox(
             self.nav_label,
-            list(self.pages.keys()),
-            format_func=lambda page_id: self.pages[page_id].title,
+            list(self.specs.keys()),
+            format_func=lambda page_id: self.specs[page_id].title,
+            # ページを切り替えても会話・コスト・実行中のジョブはそのまま引き継ぐ
             key=SessionKey.PAGE_ID.name,
-            on_change=self.init_session,
         )
 
-        # ページ描画
-        self.pages[page_id].render()
+        # ページ描画 (モジュールは初めて選ばれたときに読み込む)
+        self.get_page(page_id).render()
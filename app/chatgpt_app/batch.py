@@ -0,0 +1,202 @@
+"""Summarize the web pages and YouTube videos listed in a JSON Lines file, without the Streamlit UI.
+
+    cd app && python -m chatgpt_app.batch jobs.jsonl --output summaries.jsonl
+
+Each input line is ``{"url": ..., "type": "web" | "youtube", "id": ..., "length": ...}``; only ``url`` is
+required (the type is guessed from the URL and the id defaults to the URL). Each result is appended to
+the output as soon as its item finishes, so the output is also the checkpoint: running the same command
+again skips the items that already succeeded and retries the failed ones.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from chatgpt_app.const import MODEL_NAMES
+from chatgpt_app.langchain_wrapper.tokenizer import tokenizer_registry
+from chatgpt_app.logger import get_logger
+from chatgpt_app.resource_pool import get_resource_pool
+from chatgpt_app.settings import TIKTOKEN_CACHE_DIR, WEB_BATCH_MAX_PER_HOST, WEB_BATCH_SUMMARIZE_CONCURRENCY
+from chatgpt_app.summarize import WebSummarizer, YouTubeSummarizer, is_youtube_url
+from chatgpt_app.web import HostLimiter
+
+logger = get_logger(__name__)
+
+JOB_TYPES = ("web", "youtube")
+
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    url: str
+    type: str
+    length: int
+
+
+def read_jobs(path: Path, default_length: int) -> List[Job]:
+    jobs: Dict[str, Job] = {}
+    with path.open(encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                url = data["url"]
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}:{line_number}: expected a JSON object with a url ({e!r})") from e
+            job_type = data.get("type") or ("youtube" if is_youtube_url(url) else "web")
+            if job_type not in JOB_TYPES:
+                raise ValueError(f"{path}:{line_number}: unknown type {job_type!r} (expected one of {JOB_TYPES})")
+            job = Job(str(data.get("id") or url), url, job_type, int(data.get("length") or default_length))
+            if job.id in jobs:
+                logger.warning(f"{path}:{line_number}: duplicate id {job.id!r} is skipped")
+                continue
+            jobs[job.id] = job
+    return list(jobs.values())
+
+
+def read_checkpoint(path: Path) -> Set[str]:
+    """Return the ids that already succeeded; a line cut off by an interrupted run is dropped from the file."""
+    if not path.exists():
+        return set()
+    with path.open("rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            # 書き込み途中で止まった最後の行を捨てる (追記すると次の行とつながってしまう)
+            f.truncate(data.rfind(b"\n") + 1)
+            logger.warning(f"{path}: dropped an incomplete last line")
+    done = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get("status") == "ok":
+            done.add(record["id"])
+    return done
+
+
+class ResultWriter:
+    """Append one JSON line per finished item and flush it to disk right away."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BatchRunner:
+    """Fetch and summarize jobs on a thread pool (at most ``max_per_host`` fetches per host at once)."""
+
+    def __init__(self, web: WebSummarizer, youtube: YouTubeSummarizer, max_per_host: int) -> None:
+        self.web = web
+        self.youtube = youtube
+        self.host_limiter = HostLimiter(max_per_host)
+
+    def run_job(self, job: Job) -> Dict[str, Any]:
+        started_at = time.perf_counter()
+        record: Dict[str, Any] = {"id": job.id, "url": job.url, "type": job.type}
+        try:
+            if job.type == "youtube":
+                with self.host_limiter.limit(job.url):
+                    documents = self.youtube.get_documents(job.url)
+                if not documents:
+                    raise ValueError("no transcript to summarize")
+                result = self.youtube.summarize_documents(job.url, documents)
+            else:
+                with self.host_limiter.limit(job.url):
+                    content = self.web.fetch_content(job.url)
+                if not content:
+                    raise ValueError("no content to summarize")
+                result = self.web.summarize_content(job.url, content, job.length)
+            record.update(status="ok", summary=result.answer, cost=result.cost)
+        except Exception as e:
+            logger.warning(f"{job.id} failed: {e!r}")
+            record.update(status="error", error=str(e) or repr(e))
+        record["seconds"] = round(time.perf_counter() - started_at, 3)
+        return record
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m chatgpt_app.batch", description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", type=Path, help="JSON Lines file of jobs")
+    parser.add_argument("--output", type=Path, required=True, help="JSON Lines file the results are appended to")
+    parser.add_argument("--model", default=MODEL_NAMES[0], help="model name (default: %(default)s)")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--length", type=int, default=300, help="summary length of web pages in characters")
+    parser.add_argument("--chunk-size", type=int, default=300, help="tokens per transcript part of YouTube videos")
+    parser.add_argument("--workers", type=int, default=WEB_BATCH_SUMMARIZE_CONCURRENCY, help="items run at once")
+    parser.add_argument("--max-per-host", type=int, default=WEB_BATCH_MAX_PER_HOST)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    tokenizer_registry.set_cache_dir(TIKTOKEN_CACHE_DIR)
+
+    jobs = read_jobs(args.input, args.length)
+    done = read_checkpoint(args.output)
+    pending = [job for job in jobs if job.id not in done]
+    logger.info(f"{len(jobs)} jobs: {len(jobs) - len(pending)} already done, {len(pending)} to run")
+    if not pending:
+        return 0
+
+    llm = get_resource_pool().chat_model(args.model, args.temperature, streaming=False)
+    runner = BatchRunner(
+        WebSummarizer(llm), YouTubeSummarizer(llm, chunk_size=args.chunk_size), max_per_host=args.max_per_host
+    )
+    writer = ResultWriter(args.output)
+    counts = {"ok": 0, "error": 0}
+    total_cost = 0.0
+
+    def record_result(future: "Future[Dict[str, Any]]") -> None:
+        nonlocal total_cost
+        record = future.result()
+        writer.write(record)
+        counts[record["status"]] += 1
+        total_cost += record.get("cost", 0.0)
+        logger.info(
+            f"[{counts['ok'] + counts['error']}/{len(pending)}] {record['status']} {record['id']} "
+            f"({record['seconds']:.1f}s, ${record.get('cost', 0.0):.5f})"
+        )
+
+    interrupted = False
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch")
+    futures = [executor.submit(runner.run_job, job) for job in pending]
+    recorded: Set["Future[Dict[str, Any]]"] = set()
+    try:
+        for future in as_completed(futures):
+            record_result(future)
+            recorded.add(future)
+    except KeyboardInterrupt:
+        # 始まっていない項目は捨て、実行中の項目は書き出してから終える (次回はその続きから)
+        interrupted = True
+        logger.warning("interrupted; finishing the running items")
+        for future in futures:
+            future.cancel()
+        for future in as_completed([future for future in futures if not future.cancelled() and future not in recorded]):
+            record_result(future)
+    finally:
+        executor.shutdown(wait=True)
+        writer.close()
+
+    logger.info(f"{counts['ok']} succeeded, {counts['error']} failed, total cost ${total_cost:.5f}")
+    if interrupted:
+        return 130
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,12 +4,22 @@ from enum import Enum, auto
 class SessionKey(Enum):
     # all pages
     PAGE_ID = auto()
+    CONVERSATION_ID = auto()
     MESSAGES = auto()
+    MESSAGE_COUNT = auto()
     COSTS = auto()
     CLEAR_BUTTON = auto()
     MODEL_NAME = auto()
+    GENERATION = auto()
+    # chatbot page
+    CHAT_CONTEXT = auto()
+    HISTORY_WINDOW = auto()
     # web summarize page
     URL_INPUT = auto()
+    URL_LIST_INPUT = auto()
+    BATCH_JOB = auto()
+    # web / youtube summarize pages
+    FOLLOWUPS = auto()
     # youtube summarize page
     MAX_TOKEN = auto()
 
@@ -18,3 +28,7 @@ class PageId(Enum):
     CHATBOT = auto()
     WEB_SUMMARIZE = auto()
     YOUTUBE_SUMMARIZE = auto()
+
+
+# サイドバーで選択できるモデル
+MODEL_NAMES = ("gpt-3.5-turbo", "gpt-3.5-turbo-16k-0613", "gpt-4")
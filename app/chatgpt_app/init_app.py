@@ -1,27 +1,76 @@
-from chatgpt_app.app import MultiPageApp
-from chatgpt_app.const import PageId
-from chatgpt_app.pages.base import BasePage
+import sys
+import threading
+
+import streamlit as st
+from chatgpt_app.app import MultiPageApp, PageSpec
+from chatgpt_app.const import MODEL_NAMES, PageId
+from chatgpt_app.langchain_wrapper import tokenizer_registry
+from chatgpt_app.logger import get_logger
 from chatgpt_app.session import StreamlistSessionManager
+from chatgpt_app.settings import TIKTOKEN_CACHE_DIR
+
+logger = get_logger(__name__)
+
+# 使うページが選ばれるまで読み込まないはずの重い依存
+DEFERRED_MODULES = (
+    "langchain",
+    "openai",
+    "aiohttp",
+    "requests",
+    "tiktoken",
+    "streamlit_extras",
+    "bs4",
+    "lxml",
+    "youtube_transcript_api",
+    "pytube",
+)
+
+
+def init_tokenizers() -> None:
+    # BPE ファイルの読み込みを最初のリクエストより前に済ませておく (最初の描画は待たせない)
+    tokenizer_registry.set_cache_dir(TIKTOKEN_CACHE_DIR)
+
+    def warm_up() -> None:
+        try:
+            tokenizer_registry.warm_up(MODEL_NAMES)
+        except Exception as e:
+            logger.warning(f"failed to warm up tokenizers: {e}")
+
+    threading.Thread(target=warm_up, name="tokenizer-warm-up", daemon=True).start()
+
+
+def report_startup_imports(import_seconds: float) -> None:
+    """Log how long the startup imports took and warn about heavy modules that were loaded too early."""
+    logger.info(f"startup imports took {import_seconds * 1000:.1f} ms ({len(sys.modules)} modules loaded)")
+    loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+    if loaded:
+        logger.warning(f"deferred modules were imported at startup: {', '.join(loaded)}")
 
 
 def init_session() -> StreamlistSessionManager:
-    session_manager = StreamlistSessionManager()
+    # ?conversation=<id> で保存済みの会話を再開できる
+    conversation_id = st.experimental_get_query_params().get("conversation", [None])[0]
+    session_manager = StreamlistSessionManager(conversation_id)
     return session_manager
 
 
-def init_pages(sm: StreamlistSessionManager) -> list[BasePage]:
-    from chatgpt_app.pages.chatgpt.chatbot import ChatBotPage
-    from chatgpt_app.pages.chatgpt.web_summarize import WebSummarizePage
-    from chatgpt_app.pages.chatgpt.youtube_summrize import YouTubeSummarizePage
-
+def init_pages() -> list[PageSpec]:
+    # ページのモジュールは選択されたときに読み込む
     pages = [
-        ChatBotPage(page_id=PageId.CHATBOT, title="Chat Bot", sm=sm),
-        WebSummarizePage(page_id=PageId.WEB_SUMMARIZE, title="Website Summarizer", sm=sm),
-        YouTubeSummarizePage(page_id=PageId.YOUTUBE_SUMMARIZE, title="YouTube Summarizer", sm=sm),
+        PageSpec(PageId.CHATBOT, "Chat Bot", "chatgpt_app.pages.chatgpt.chatbot", "ChatBotPage"),
+        PageSpec(
+            PageId.WEB_SUMMARIZE, "Website Summarizer", "chatgpt_app.pages.chatgpt.web_summarize", "WebSummarizePage"
+        ),
+        PageSpec(
+            PageId.YOUTUBE_SUMMARIZE,
+            "YouTube Summarizer",
+            "chatgpt_app.pages.chatgpt.youtube_summrize",
+            "YouTubeSummarizePage",
+        ),
     ]
     return pages
 
 
-def init_app(sm: StreamlistSessionManager, pages: list[BasePage]) -> MultiPageApp:
+def init_app(sm: StreamlistSessionManager, pages: list[PageSpec]) -> MultiPageApp:
     app = MultiPageApp(sm, pages)
     return app
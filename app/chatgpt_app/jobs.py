@@ -0,0 +1,217 @@
+import atexit
+import contextvars
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from chatgpt_app.logger import get_logger
+from chatgpt_app.settings import JOB_MAX_FINISHED, JOB_MAX_WORKERS
+
+logger = get_logger(__name__)
+
+
+class JobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    # Stop で止めた (result は途中までの結果か None)
+    STOPPED = "stopped"
+
+
+class Job:
+    """State of one background job. The worker updates it; any session may read it while it runs."""
+
+    def __init__(self, key: Hashable, title: str, owner: Optional[str]) -> None:
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.title = title
+        # 投入したセッション (会話 ID)。コストはこのセッションにだけ計上する
+        self.owner = owner
+        self.status = JobStatus.PENDING
+        # 0.0〜1.0 (分からなければ None)
+        self.progress: Optional[float] = None
+        self.message = "Queued"
+        # 途中経過 (部分要約・バッチの各 URL の結果など) と、ストリーミング中の回答
+        self.details: List[Any] = []
+        self.partial_answer = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # ジョブの関数はこれを GenerationBudget に渡して、Stop で打ち切れるようにする
+        self.cancel_event = threading.Event()
+        # このジョブを待っているセッション -> Stop を押したか
+        self._sessions: Dict[Optional[str], bool] = {owner: False}
+        self._claimed = False
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED, JobStatus.STOPPED)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def attach(self, session: Optional[str]) -> None:
+        """Register another session waiting for this job; the job then runs until it stops it too."""
+        with self._lock:
+            self._sessions.setdefault(session, False)
+
+    def attached(self, session: Optional[str]) -> bool:
+        with self._lock:
+            return session in self._sessions
+
+    def cancel(self, session: Optional[str] = None) -> None:
+        """Stop the job for ``session`` (for everyone if None).
+
+        The job is asked to stop only once every attached session has stopped it: a pending job then
+        never starts and a running one ends at its next check.
+        """
+        with self._lock:
+            if session is None:
+                self._sessions = dict.fromkeys(self._sessions, True)
+            elif session in self._sessions:
+                self._sessions[session] = True
+            if all(self._sessions.values()):
+                self.cancel_event.set()
+
+    def update(self, progress: Optional[float] = None, message: Optional[str] = None) -> None:
+        with self._lock:
+            if progress is not None:
+                self.progress = min(max(progress, 0.0), 1.0)
+            if message is not None:
+                self.message = message
+
+    def add_detail(self, detail: Any) -> None:
+        with self._lock:
+            self.details.append(detail)
+
+    def append_answer(self, token: str) -> None:
+        with self._lock:
+            self.partial_answer += token
+
+    def claim(self, owner: str) -> bool:
+        """True exactly once, for the owner, once the job has a result (to add its cost to that session)."""
+        with self._lock:
+            if self._claimed or self.owner != owner or self.status not in (JobStatus.DONE, JobStatus.STOPPED):
+                return False
+            if self.result is None:
+                return False
+            self._claimed = True
+            return True
+
+
+class JobExecutor:
+    """Runs long jobs (summaries) on a worker pool shared by every session.
+
+    Jobs are keyed by their inputs: submitting a key that is pending, running or done attaches to the
+    existing job, so a rerun, a page switch or another session does not start the work again. Failed
+    jobs are replaced on the next submit; stopped ones are kept for the sessions that waited for them until
+    ``discard()``, and replaced when any other session submits them. At most ``max_finished`` finished jobs
+    are kept.
+    """
+
+    def __init__(self, max_workers: int = JOB_MAX_WORKERS, max_finished: int = JOB_MAX_FINISHED) -> None:
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[Hashable, Job]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key: Hashable, title: str, func: Callable[[Job], Any], owner: Optional[str] = None) -> Job:
+        """Return the job for ``key``, starting ``func(job)`` in the background if there is none yet."""
+        with self._lock:
+            job = self._jobs.get(key)
+            # 止めたときに待っていなかったセッションには、途中までの結果を渡さずにやり直す
+            stopped_by_other = job is not None and job.status is JobStatus.STOPPED and not job.attached(owner)
+            if job is not None and job.status is not JobStatus.FAILED and not stopped_by_other:
+                job.attach(owner)
+                self._jobs.move_to_end(key)
+                return job
+            job = Job(key, title, owner)
+            self._jobs[key] = job
+        # 呼び出し元のコンテキスト (レート制限のセッションなど) を引き継ぐ
+        self._executor.submit(contextvars.copy_context().run, self._run, job, func)
+        return job
+
+    def jobs(self, owner: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if owner is None or job.owner == owner]
+
+    def cancel(self, session: str) -> int:
+        """Stop the unfinished jobs ``session`` waits for; return how many it stopped.
+
+        A job shared with other sessions keeps running until all of them have stopped it.
+        """
+        jobs = [job for job in self.jobs() if not job.done and job.attached(session)]
+        for job in jobs:
+            job.cancel(session)
+        return len(jobs)
+
+    def discard(self, key: Hashable) -> None:
+        """Forget the finished job for ``key`` so that the next submit runs it again."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.done:
+                del self._jobs[key]
+
+    def _run(self, job: Job, func: Callable[[Job], Any]) -> None:
+        job.started_at = time.time()
+        try:
+            # 始まる前に止められたジョブは実行しない
+            if not job.cancelled:
+                job.status = JobStatus.RUNNING
+                job.update(message="Running")
+                job.result = func(job)
+            if job.cancelled:
+                job.status = JobStatus.STOPPED
+                job.update(message="Stopped")
+            else:
+                job.status = JobStatus.DONE
+                job.update(progress=1.0, message="Done")
+        except Exception as e:
+            if job.cancelled:
+                job.status = JobStatus.STOPPED
+                job.update(message="Stopped")
+            else:
+                logger.warning(f"job {job.title!r} failed: {e!r}")
+                job.error = str(e) or repr(e)
+                job.status = JobStatus.FAILED
+                job.update(message="Failed")
+        finally:
+            job.finished_at = time.time()
+            logger.info(f"job {job.title!r} {job.status.value} in {job.finished_at - job.started_at:.1f} s")
+            self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            finished = [key for key, job in self._jobs.items() if job.done]
+            for key in finished[: max(len(finished) - self.max_finished, 0)]:
+                del self._jobs[key]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_job_executor: Optional[JobExecutor] = None
+_job_executor_lock = threading.Lock()
+
+
+def get_job_executor() -> JobExecutor:
+    """Return the process-wide job executor; pending jobs are dropped when the process exits."""
+    global _job_executor
+    with _job_executor_lock:
+        if _job_executor is None:
+            _job_executor = JobExecutor()
+            atexit.register(_job_executor.shutdown)
+        return _job_executor
@@ -1,4 +1,45 @@
-from chatgpt_app.langchain_wrapper.callbacks.streamlit.streamlit_callback_handler import StreamlitCostCalcHandler
-from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
+import importlib
+from typing import Any, Dict
 
-__all__ = [StreamlitCostCalcHandler, TokenCostProcess]
+# 名前 -> 定義しているモジュール。
+# openai / aiohttp / streamlit などを起動時に読み込まないよう、使われたときに import する
+_EXPORTS: Dict[str, str] = {
+    "StreamlitCostCalcHandler": "callbacks.streamlit.streamlit_callback_handler",
+    "TokenCostHandler": "callbacks.token_cost_handler",
+    "LLMTimingHandler": "callbacks.llm_timing_handler",
+    "GenerationBudgetHandler": "callbacks.generation_budget_handler",
+    "ConversationContext": "conversation_context",
+    "GenerationAborted": "generation_budget",
+    "GenerationBudget": "generation_budget",
+    "MapReduceSummarizer": "map_reduce",
+    "RateLimitScheduler": "rate_limit_scheduler",
+    "ScheduledChatCompletion": "rate_limit_scheduler",
+    "get_rate_limit_scheduler": "rate_limit_scheduler",
+    "set_rate_limit_session": "rate_limit_scheduler",
+    "ResponseCache": "response_cache",
+    "get_response_cache": "response_cache",
+    "TokenChunk": "token_chunker",
+    "TokenChunker": "token_chunker",
+    "TokenCostProcess": "token_cost_process",
+    "TokenizerRegistry": "tokenizer",
+    "tokenizer_registry": "tokenizer",
+    "UsageLedger": "usage_ledger",
+    "UsageRecord": "usage_ledger",
+    "UsageTotals": "usage_ledger",
+    "get_usage_ledger": "usage_ledger",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted([*globals(), *_EXPORTS])
@@ -0,0 +1,38 @@
+from typing import Any, Dict, List, Union
+
+from chatgpt_app.langchain_wrapper.generation_budget import GenerationBudget
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import LLMResult
+from langchain.schema.messages import BaseMessage
+
+
+class GenerationBudgetHandler(BaseCallbackHandler):
+    """Stop a streaming call by raising GenerationAborted once its budget is used up or cancelled.
+
+    Put it after the handlers that count tokens: the callback manager stops at the handler that raises,
+    and the LLM then reports the abort to every handler through ``on_llm_error``.
+    """
+
+    # 例外を握りつぶさずに LLM の呼び出しまで伝える
+    raise_error = True
+
+    def __init__(self, budget: GenerationBudget) -> None:
+        self.budget = budget
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[BaseMessage]],
+        **kwargs: Any,
+    ) -> None:
+        self.budget.add_prompt(messages[0])
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.budget.add_streamed_token(kwargs.get("run_id"))
+        self.budget.check()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self.budget.end_run(kwargs.get("run_id"), response)
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        self.budget.end_run(kwargs.get("run_id"))
@@ -0,0 +1,62 @@
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from chatgpt_app.tracing import Span
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import LLMResult
+from langchain.schema.messages import BaseMessage
+
+
+class LLMTimingHandler(BaseCallbackHandler):
+    """Record the latency of one LLM call into ``span``.
+
+    Sets time to first token, the mean/max gap between streamed tokens, tokens per second
+    and the total duration as span attributes. Use one handler per call.
+    """
+
+    def __init__(self, span: Span) -> None:
+        self.span = span
+        self._started_at: Optional[float] = None
+        self._first_token_at: Optional[float] = None
+        self._last_token_at: Optional[float] = None
+        self._tokens = 0
+        self._max_gap = 0.0
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[BaseMessage]],
+        **kwargs: Any,
+    ) -> None:
+        self._started_at = time.time()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self._started_at = time.time()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        now = time.time()
+        if self._last_token_at is None:
+            self._first_token_at = now
+        else:
+            self._max_gap = max(self._max_gap, now - self._last_token_at)
+        self._last_token_at = now
+        self._tokens += 1
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self._finish()
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        self._finish()
+
+    def _finish(self) -> None:
+        end = time.time()
+        started_at = self._started_at if self._started_at is not None else self.span.start
+        attributes: Dict[str, Any] = {"duration_ms": (end - started_at) * 1000, "tokens": self._tokens}
+        if self._first_token_at is not None and self._last_token_at is not None:
+            attributes["ttft_ms"] = (self._first_token_at - started_at) * 1000
+            streaming_time = self._last_token_at - self._first_token_at
+            if self._tokens > 1 and streaming_time > 0:
+                attributes["tokens_per_second"] = (self._tokens - 1) / streaming_time
+                attributes["mean_gap_ms"] = streaming_time / (self._tokens - 1) * 1000
+                attributes["max_gap_ms"] = self._max_gap * 1000
+        self.span.set(**attributes)
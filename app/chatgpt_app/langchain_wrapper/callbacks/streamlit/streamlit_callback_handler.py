@@ -1,16 +1,43 @@
-from typing import Any, Dict, List, Optional
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
 
+from chatgpt_app.langchain_wrapper.callbacks.generation_budget_handler import GenerationBudgetHandler
+from chatgpt_app.langchain_wrapper.callbacks.token_cost_handler import TokenCostHandler
+from chatgpt_app.langchain_wrapper.generation_budget import GenerationAborted, GenerationBudget
 from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
 from chatgpt_app.logger import get_logger
+from chatgpt_app.settings import STREAM_FLUSH_GROWTH, STREAM_FLUSH_INTERVAL, STREAM_FLUSH_TOKENS
 from langchain.callbacks.streamlit.streamlit_callback_handler import LLMThoughtLabeler, StreamlitCallbackHandler
-from langchain.schema import LLMResult
-from langchain.schema.messages import BaseMessage
+from langchain.schema import ChatGeneration, LLMResult
+from langchain.schema.messages import AIMessage, BaseMessage, get_buffer_string
 from streamlit.delta_generator import DeltaGenerator
+from streamlit.runtime.scriptrunner import RerunException, StopException
 
 logger = get_logger()
 
 
 class StreamlitCostCalcHandler(StreamlitCallbackHandler):
+    """StreamlitCallbackHandler that counts tokens and redraws the streamed answer in batches.
+
+    Every redraw sends the whole answer so far, so tokens are buffered and flushed when
+    ``flush_interval`` seconds have passed or ``flush_tokens`` tokens are pending, and only once the
+    pending text is at least ``flush_growth`` times the text already shown. The drawn text grows
+    geometrically, which keeps the total redraw cost linear in the answer length.
+
+    With a ``budget``, the stream is aborted (GenerationAborted) as soon as the budget is used up or
+    cancelled; the tokens received until then are still counted and kept in ``partial_answer``.
+
+    Streamlit stops a running script (Stop or any other widget) by raising RerunException/StopException
+    from the next ``st`` call, i.e. from a redraw here. Those are BaseExceptions, which langchain does not
+    report to ``on_llm_error``, so they are turned into GenerationAborted and the original exception is
+    kept in ``interrupted`` for the caller to re-raise once it has recorded the partial answer.
+    """
+
+    # 打ち切り (GenerationAborted) を握りつぶさずに LLM の呼び出しまで伝える
+    raise_error = True
+
     def __init__(
         self,
         parent_container: DeltaGenerator,
@@ -20,8 +47,20 @@ class StreamlitCostCalcHandler(StreamlitCallbackHandler):
         expand_new_thoughts: bool = True,
         collapse_completed_thoughts: bool = True,
         thought_labeler: Optional[LLMThoughtLabeler] = None,
+        flush_interval: float = STREAM_FLUSH_INTERVAL,
+        flush_tokens: int = STREAM_FLUSH_TOKENS,
+        flush_growth: float = STREAM_FLUSH_GROWTH,
+        budget: Optional[GenerationBudget] = None,
     ):
         self.token_cost_process = token_cost_process
+        self._token_cost_handler = TokenCostHandler(token_cost_process)
+        self._budget_handler = GenerationBudgetHandler(budget) if budget is not None else None
+        self._answer_tokens: List[str] = []
+        self.interrupted: Optional[BaseException] = None
+        self.flush_interval = flush_interval
+        self.flush_tokens = flush_tokens
+        self.flush_growth = flush_growth
+        self._reset_stream_buffer()
         super().__init__(
             parent_container,
             max_thought_containers=max_thought_containers,
@@ -38,20 +77,106 @@ class StreamlitCostCalcHandler(StreamlitCallbackHandler):
     ) -> None:
         """Run when a chat model starts running."""
         # logger.info(messages)
-        token_num = self.token_cost_process.tokens_from_base_messages(messages[0])
-        self.token_cost_process.sum_prompt_tokens(token_num)
-        super().on_chat_model_start(serialized, messages, **kwargs)
+        self._answer_tokens = []
+        self._reset_stream_buffer()
+        # 先に描く (ここで中断されたらリクエストは送られないので、トークンも数えない)
+        with self._drawing():
+            super().on_chat_model_start(serialized, messages, **kwargs)
+        self._token_cost_handler.on_chat_model_start(serialized, messages, **kwargs)
+        if self._budget_handler is not None:
+            self._budget_handler.on_chat_model_start(serialized, messages, **kwargs)
 
     def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
         # logger.info(token)
-        token_num = self.token_cost_process.tokens_from_string(token)
-        self.token_cost_process.sum_completion_tokens(token_num)
-        super().on_llm_new_token(token, **kwargs)
+        self._token_cost_handler.on_llm_new_token(token, **kwargs)
+        self._answer_tokens.append(token)
+        if self._budget_handler is not None:
+            try:
+                # 描画より先に確かめる (Stop で止めたスクリプトにはもう描けない)
+                self._budget_handler.on_llm_new_token(token, **kwargs)
+            except GenerationAborted as e:
+                if not e.cancelled:
+                    self._pending_tokens.append(token)
+                    self._pending_chars += len(token)
+                raise
+        self._buffer_token(token, **kwargs)
 
     def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
         # logger.info("llm end")
-        self.token_cost_process.sum_successful_requests(1)
-        super().on_llm_end(response, **kwargs)
+        self._token_cost_handler.on_llm_end(response, **kwargs)
+        if self._budget_handler is not None:
+            self._budget_handler.on_llm_end(response, **kwargs)
+        with self._drawing():
+            self._flush_tokens(**kwargs)
+            super().on_llm_end(response, **kwargs)
+            self._complete_label()
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        self._token_cost_handler.on_llm_error(error, **kwargs)
+        if self._budget_handler is not None:
+            self._budget_handler.on_llm_error(error, **kwargs)
+        if self.interrupted is not None or (isinstance(error, GenerationAborted) and error.cancelled):
+            # 止められたスクリプトにはもう描けない
+            return
+        with self._drawing():
+            self._flush_tokens(**kwargs)
+            if isinstance(error, GenerationAborted):
+                # 上限で打ち切った回答は、そこまでを表示して完了扱いにする
+                self._complete_label()
+            else:
+                super().on_llm_error(error, **kwargs)
+
+    @property
+    def partial_answer(self) -> str:
+        """Text streamed by the current call so far (the whole answer once it has finished)."""
+        return "".join(self._answer_tokens)
+
+    def replay(self, messages: List[BaseMessage], answer: str) -> None:
+        """Stream an already known answer (e.g. a cache hit) into the UI without counting any tokens."""
+        self._reset_stream_buffer()
+        with self._drawing():
+            super().on_llm_start({}, [get_buffer_string(messages)])
+            for token in re.findall(r"\s*\S+\s*", answer):
+                self._buffer_token(token)
+            self._flush_tokens()
+            super().on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content=answer))]]))
+            self._complete_label()
+
+    def _reset_stream_buffer(self) -> None:
+        self._pending_tokens: List[str] = []
+        self._pending_chars = 0
+        self._rendered_chars = 0
+        self._last_flush_at = time.monotonic()
+
+    def _buffer_token(self, token: str, **kwargs: Any) -> None:
+        self._pending_tokens.append(token)
+        self._pending_chars += len(token)
+        due = (
+            len(self._pending_tokens) >= self.flush_tokens
+            or time.monotonic() - self._last_flush_at >= self.flush_interval
+        )
+        if due and self._pending_chars >= self.flush_growth * self._rendered_chars:
+            self._flush_tokens(**kwargs)
+
+    @contextmanager
+    def _drawing(self) -> Iterator[None]:
+        try:
+            yield
+        except (RerunException, StopException) as e:
+            self.interrupted = e
+            raise GenerationAborted("Interrupted by a rerun", cancelled=True) from e
+
+    def _flush_tokens(self, **kwargs: Any) -> None:
+        if not self._pending_tokens:
+            return
+        with self._drawing():
+            super().on_llm_new_token("".join(self._pending_tokens), **kwargs)
+        self._rendered_chars += self._pending_chars
+        self._pending_tokens = []
+        self._pending_chars = 0
+        self._last_flush_at = time.monotonic()
+
+    def _complete_label(self) -> None:
         super()._require_current_thought()._container.update(
             new_label=self._thought_labeler.get_final_agent_thought_label()
         )
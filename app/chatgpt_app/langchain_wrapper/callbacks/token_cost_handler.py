@@ -0,0 +1,80 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from uuid import UUID
+
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess, cost_per_1k_tokens
+from chatgpt_app.langchain_wrapper.usage_ledger import UsageLedger, UsageRecord, get_usage_ledger
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import LLMResult
+from langchain.schema.messages import BaseMessage
+
+
+class TokenCostHandler(BaseCallbackHandler):
+    """Count prompt/completion tokens into a TokenCostProcess without drawing anything.
+
+    Safe to share between concurrent LLM calls: streamed tokens are buffered per run_id and the
+    assembled completion is encoded once when the run ends. Every finished request is also
+    recorded in the usage ledger.
+    """
+
+    def __init__(self, token_cost_process: TokenCostProcess, usage_ledger: Optional[UsageLedger] = None) -> None:
+        self.token_cost_process = token_cost_process
+        self.usage_ledger = usage_ledger if usage_ledger is not None else get_usage_ledger()
+        # run_id ごとのストリーミング済みトークン。on_llm_end でまとめて一度だけ encode する
+        self._completion_buffers: Dict[Optional[UUID], List[str]] = {}
+        # run_id ごとの (開始時刻, プロンプトのトークン数)
+        self._started: Dict[Optional[UUID], Tuple[float, int]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[BaseMessage]],
+        **kwargs: Any,
+    ) -> None:
+        token_num = self.token_cost_process.tokens_from_base_messages(messages[0])
+        self.token_cost_process.sum_prompt_tokens(token_num)
+        self._started[kwargs.get("run_id")] = (time.time(), token_num)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._completion_buffers.setdefault(kwargs.get("run_id"), []).append(token)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        completion_tokens = self._sum_completion_tokens(kwargs.get("run_id"), response)
+        self.token_cost_process.sum_successful_requests(1)
+        self._record_usage(kwargs.get("run_id"), completion_tokens, error=False)
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        # 途中まで生成されたトークンも課金されるので計上しておく
+        completion_tokens = self._sum_completion_tokens(kwargs.get("run_id"))
+        self._record_usage(kwargs.get("run_id"), completion_tokens, error=True)
+
+    def _sum_completion_tokens(self, run_id: Optional[UUID], response: Optional[LLMResult] = None) -> int:
+        tokens = self._completion_buffers.pop(run_id, None)
+        if tokens is not None:
+            completion = "".join(tokens)
+        elif response is not None:
+            # streaming でない呼び出しは生成結果から数える
+            completion = "".join(g.text for generations in response.generations for g in generations)
+        else:
+            return 0
+        token_num = self.token_cost_process.tokens_from_string(completion)
+        self.token_cost_process.sum_completion_tokens(token_num)
+        return token_num
+
+    def _record_usage(self, run_id: Optional[UUID], completion_tokens: int, error: bool) -> None:
+        now = time.time()
+        started_at, prompt_tokens = self._started.pop(run_id, (now, 0))
+        model = self.token_cost_process.model
+        self.usage_ledger.record(
+            UsageRecord(
+                model=model,
+                page=self.token_cost_process.page,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                prompt_cost=cost_per_1k_tokens(model) * prompt_tokens / 1000,
+                completion_cost=cost_per_1k_tokens(model, is_completion=True) * completion_tokens / 1000,
+                started_at=started_at,
+                finished_at=now,
+                error=error,
+            )
+        )
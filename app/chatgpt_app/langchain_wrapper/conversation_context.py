@@ -0,0 +1,109 @@
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from chatgpt_app.langchain_wrapper.token_cost_process import REPLY_PRIMING_TOKENS, TokenCostProcess
+from chatgpt_app.logger import get_logger
+from langchain.schema.messages import BaseMessage, SystemMessage
+
+logger = get_logger(__name__)
+
+# (これまでの要約, 要約に畳み込むメッセージ) -> 新しい要約
+Summarizer = Callable[[str, List[BaseMessage]], str]
+
+
+class ConversationContext:
+    """Token-budgeted view of a chat history that is sent to the model.
+
+    The system message and the most recent messages are always kept. When the total exceeds
+    ``token_budget``, the oldest recent messages are moved out (each message is counted once, so this is
+    O(1) amortized per turn) and later folded into a running summary by :meth:`fold`.
+    """
+
+    def __init__(self, model: str, token_budget: int, min_recent_messages: int = 2) -> None:
+        self.model = model
+        self.token_budget = token_budget
+        self.min_recent_messages = min_recent_messages
+        self._token_cost_process = TokenCostProcess(model)
+        self.reset()
+
+    def reset(self) -> None:
+        self.summary = ""
+        self._system: Optional[Tuple[BaseMessage, int]] = None
+        self._summary_tokens = 0
+        self._recent: Deque[Tuple[BaseMessage, int]] = deque()
+        self._recent_tokens = 0
+        self._evicted: List[BaseMessage] = []
+        self._num_messages = 0
+
+    @property
+    def total_tokens(self) -> int:
+        system_tokens = self._system[1] if self._system is not None else 0
+        return system_tokens + self._summary_tokens + self._recent_tokens + REPLY_PRIMING_TOKENS
+
+    @property
+    def has_evicted(self) -> bool:
+        return len(self._evicted) > 0
+
+    @property
+    def num_messages(self) -> int:
+        """Number of messages of the conversation taken in so far."""
+        return self._num_messages
+
+    def extend(self, messages: List[BaseMessage]) -> None:
+        """Take in the messages appended to the conversation since the last call."""
+        for message in messages:
+            tokens = self._token_cost_process.tokens_from_base_message(message)
+            if isinstance(message, SystemMessage) and self._system is None and not self._recent:
+                self._system = (message, tokens)
+            else:
+                self._recent.append((message, tokens))
+                self._recent_tokens += tokens
+        self._num_messages += len(messages)
+        self._trim()
+
+    def rebudget(self, model: str, token_budget: int) -> None:
+        """Switch to another model (and budget), keeping the summary."""
+        if model == self.model and token_budget == self.token_budget:
+            return
+        self.model = model
+        self.token_budget = token_budget
+        self._token_cost_process = TokenCostProcess(model)
+        if self._system is not None:
+            self._system = (self._system[0], self._token_cost_process.tokens_from_base_message(self._system[0]))
+        self._recent = deque((m, self._token_cost_process.tokens_from_base_message(m)) for m, _ in self._recent)
+        self._recent_tokens = sum(tokens for _, tokens in self._recent)
+        self._set_summary(self.summary)
+        self._trim()
+
+    def fold(self, summarize: Summarizer) -> None:
+        """Fold the evicted messages into the running summary."""
+        if not self._evicted:
+            return
+        logger.info(f"folding {len(self._evicted)} messages into the conversation summary")
+        self._set_summary(summarize(self.summary, self._evicted))
+        self._evicted = []
+        self._trim()
+
+    def build_messages(self) -> List[BaseMessage]:
+        messages = []
+        if self._system is not None:
+            messages.append(self._system[0])
+        if self.summary:
+            messages.append(self._summary_message())
+        messages.extend(message for message, _ in self._recent)
+        return messages
+
+    def _summary_message(self) -> SystemMessage:
+        return SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}")
+
+    def _set_summary(self, summary: str) -> None:
+        self.summary = summary
+        self._summary_tokens = (
+            self._token_cost_process.tokens_from_base_message(self._summary_message()) if summary else 0
+        )
+
+    def _trim(self) -> None:
+        while self.total_tokens > self.token_budget and len(self._recent) > self.min_recent_messages:
+            message, tokens = self._recent.popleft()
+            self._recent_tokens -= tokens
+            self._evicted.append(message)
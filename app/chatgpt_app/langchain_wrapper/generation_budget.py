@@ -0,0 +1,98 @@
+import threading
+from typing import List, Optional, Set
+from uuid import UUID
+
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess, cost_per_1k_tokens
+from langchain.schema import LLMResult
+from langchain.schema.messages import BaseMessage
+
+
+class GenerationAborted(Exception):
+    """A generation was stopped before the model finished: the user pressed Stop or a cap was reached.
+
+    ``partial_answer`` is the text streamed so far (filled in by whoever collected the tokens).
+    """
+
+    def __init__(self, reason: str, cancelled: bool = False, partial_answer: str = "") -> None:
+        super().__init__(reason)
+        self.reason = reason
+        # True なら Stop による中断、False なら上限に達した
+        self.cancelled = cancelled
+        self.partial_answer = partial_answer
+
+
+class GenerationBudget:
+    """Caps on the completion tokens and cost of one answer, and the switch that stops it.
+
+    One budget covers every LLM call of the answer (the map calls of a summary as well as the final
+    call), possibly from several threads. ``0`` or ``None`` means no cap. Streamed tokens are counted
+    one per chunk as they arrive, so the caps are enforced while the answer streams.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_completion_tokens: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> None:
+        self.max_completion_tokens = max_completion_tokens or None
+        self.max_cost = max_cost or None
+        self._usage = TokenCostProcess(model)
+        self._cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self._closed = threading.Event()
+        self._streamed_runs: Set[Optional[UUID]] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+
+    @property
+    def completion_tokens(self) -> int:
+        return self._usage.completion_tokens
+
+    @property
+    def cost(self) -> float:
+        return self._usage.total_cost
+
+    def check(self, messages: Optional[List[BaseMessage]] = None) -> None:
+        """Raise GenerationAborted if the answer has to stop (before sending ``messages``, if given)."""
+        if self.cancelled:
+            raise GenerationAborted("Stopped by the user", cancelled=True)
+        if self.max_completion_tokens is not None and self.completion_tokens >= self.max_completion_tokens:
+            raise GenerationAborted(f"Reached the limit of {self.max_completion_tokens} completion tokens")
+        if self.max_cost is not None:
+            cost = self.cost
+            if messages is not None:
+                # 送る前に、プロンプトだけで上限を超えないか確かめる
+                cost += cost_per_1k_tokens(self._usage.model) * self._usage.tokens_from_base_messages(messages) / 1000
+            if cost >= self.max_cost:
+                raise GenerationAborted(f"Reached the cost limit of ${self.max_cost:.5f}")
+
+    def add_prompt(self, messages: List[BaseMessage]) -> None:
+        self._usage.sum_prompt_tokens(self._usage.tokens_from_base_messages(messages))
+
+    def add_streamed_token(self, run_id: Optional[UUID]) -> None:
+        with self._lock:
+            self._streamed_runs.add(run_id)
+        self._usage.sum_completion_tokens(1)
+
+    def end_run(self, run_id: Optional[UUID], response: Optional[LLMResult] = None) -> None:
+        with self._lock:
+            streamed = run_id in self._streamed_runs
+            self._streamed_runs.discard(run_id)
+        if not streamed and response is not None:
+            # streaming でない呼び出しは終わってから数える
+            completion = "".join(g.text for generations in response.generations for g in generations)
+            self._usage.sum_completion_tokens(self._usage.tokens_from_string(completion))
+
+    def close(self) -> None:
+        """Mark the answer as recorded; ``wait_closed()`` returns from then on."""
+        self._closed.set()
+
+    def wait_closed(self, timeout: float) -> bool:
+        return self._closed.wait(timeout)
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional
+
+import aiohttp
+import openai
+from chatgpt_app.langchain_wrapper.callbacks.generation_budget_handler import GenerationBudgetHandler
+from chatgpt_app.langchain_wrapper.callbacks.llm_timing_handler import LLMTimingHandler
+from chatgpt_app.langchain_wrapper.callbacks.token_cost_handler import TokenCostHandler
+from chatgpt_app.langchain_wrapper.generation_budget import GenerationAborted, GenerationBudget
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
+from chatgpt_app.logger import get_logger
+from chatgpt_app.tracing import tracer
+from langchain.chat_models import ChatOpenAI
+from langchain.schema.messages import BaseMessage
+
+logger = get_logger(__name__)
+
+PromptBuilder = Callable[[str], List[BaseMessage]]
+# (入力の順番, 要約結果) を受け取る。完了した順に、map を呼んだスレッドで呼ばれる (Streamlit には描画しないこと)
+ResultCallback = Callable[[int, str], None]
+
+
+class MapReduceSummarizer:
+    """Run the map (and collapse) calls of a map-reduce summary concurrently.
+
+    At most ``max_concurrency`` requests are in flight at once. Tokens of every call are counted into
+    ``token_cost_process``; the final reduce call is left to the caller so that it can be streamed.
+    With a ``budget``, calls still waiting for a slot are skipped and running ones are aborted once it
+    is used up or cancelled, and the map raises GenerationAborted.
+    """
+
+    def __init__(
+        self,
+        llm: ChatOpenAI,
+        token_cost_process: TokenCostProcess,
+        max_concurrency: int = 4,
+        budget: Optional[GenerationBudget] = None,
+    ) -> None:
+        self.llm = llm
+        self.token_cost_process = token_cost_process
+        self.max_concurrency = max_concurrency
+        self.budget = budget
+        self._callbacks = [TokenCostHandler(token_cost_process)]
+        if budget is not None:
+            self._callbacks.append(GenerationBudgetHandler(budget))
+
+    async def _acall(
+        self,
+        semaphore: asyncio.Semaphore,
+        index: int,
+        messages: List[BaseMessage],
+        on_result: Optional[ResultCallback],
+    ) -> str:
+        queued_at = time.time()
+        async with semaphore:
+            if self.budget is not None:
+                self.budget.check(messages)
+            with tracer.span("llm", model=self.llm.model_name, index=index) as span:
+                span.set(queue_ms=(span.start - queued_at) * 1000)
+                result = await self.llm.agenerate([messages], callbacks=[*self._callbacks, LLMTimingHandler(span)])
+        text = result.generations[0][0].text
+        if on_result is not None:
+            # 要約は JobExecutor のワーカースレッドで動くので、ここから Streamlit に描画してはいけない。
+            # 途中経過はジョブに記録し、ページのスクリプトがそれを描く
+            on_result(index, text)
+        return text
+
+    async def amap(self, prompts: List[List[BaseMessage]], on_result: Optional[ResultCallback] = None) -> List[str]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # openai は既定では非同期リクエストごとに接続を張るので、この map の間は接続を使い回す
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_concurrency)) as session:
+            token = openai.aiosession.set(session)
+            try:
+                return await self._gather(
+                    [self._acall(semaphore, index, messages, on_result) for index, messages in enumerate(prompts)]
+                )
+            finally:
+                openai.aiosession.reset(token)
+
+    async def _gather(self, calls: List[Awaitable[str]]) -> List[str]:
+        tasks = [asyncio.ensure_future(call) for call in calls]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        errors = [task.exception() for task in tasks if task.done() and task.exception() is not None]
+        if not errors:
+            return [task.result() for task in tasks]
+        if not isinstance(errors[0], GenerationAborted):
+            for task in tasks:
+                task.cancel()
+        # 打ち切りなら予算を共有する残りの呼び出しもすぐに止まるので、途中までのトークンを数え終えるのを待つ
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise errors[0]
+
+    def map(
+        self,
+        texts: List[str],
+        build_prompt: PromptBuilder,
+        on_result: Optional[ResultCallback] = None,
+        step: str = "map",
+    ) -> List[str]:
+        """Summarize every text in parallel and return the results in input order."""
+        logger.info(f"running {len(texts)} {step} calls (concurrency: {self.max_concurrency})")
+        with tracer.span(step, parts=len(texts), concurrency=self.max_concurrency):
+            return asyncio.run(self.amap([build_prompt(text) for text in texts], on_result))
+
+    def collapse(self, summaries: List[str], build_prompt: PromptBuilder, token_max: int) -> List[str]:
+        """Merge summaries group by group until they fit in ``token_max`` tokens together.
+
+        Summaries too long to be grouped are truncated so that they merge pairwise, and a single
+        summary still over ``token_max`` is truncated to it, so the result always fits.
+        """
+        while self._count_tokens(summaries) > token_max:
+            if len(summaries) == 1:
+                return [self._truncate(summaries[0], token_max)]
+            groups = self._group_by_tokens(summaries, token_max)
+            if len(groups) == len(summaries):
+                # 1件ずつしか入らないので、2件ずつまとめられるよう切り詰める
+                logger.warning(f"truncating {len(summaries)} summaries to collapse them into {token_max} tokens")
+                summaries = [self._truncate(summary, token_max // 2) for summary in summaries]
+                groups = [summaries[i : i + 2] for i in range(0, len(summaries), 2)]
+            summaries = self.map(["\n\n".join(group) for group in groups], build_prompt, step="collapse")
+        return summaries
+
+    def _count_tokens(self, texts: List[str]) -> int:
+        return sum(self.token_cost_process.tokens_from_string(text) for text in texts)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        encoding = self.token_cost_process.encoding
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+
+    def _group_by_tokens(self, texts: List[str], token_max: int) -> List[List[str]]:
+        groups: List[List[str]] = [[]]
+        group_tokens = 0
+        for text in texts:
+            tokens = self.token_cost_process.tokens_from_string(text)
+            if groups[-1] and group_tokens + tokens > token_max:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(text)
+            group_tokens += tokens
+        return groups
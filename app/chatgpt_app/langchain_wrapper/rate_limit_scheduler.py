@@ -0,0 +1,323 @@
+import asyncio
+import contextvars
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import openai
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
+from chatgpt_app.logger import get_logger
+from chatgpt_app.settings import (
+    RATE_LIMIT_BACKOFF_BASE,
+    RATE_LIMIT_BACKOFF_MAX,
+    RATE_LIMIT_EXPECTED_COMPLETION_TOKENS,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMITS,
+)
+from chatgpt_app.tracing import tracer
+
+logger = get_logger(__name__)
+
+# モデル名の先頭一致で引く (requests/分, tokens/分)。長い名前ほど優先し、0 以下は無制限
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "": (0, 0),
+    "gpt-3.5-turbo": (3500, 90_000),
+    "gpt-3.5-turbo-16k": (3500, 180_000),
+    "gpt-4": (200, 40_000),
+    "gpt-4-32k": (20, 80_000),
+}
+
+# 1 回で再試行する一時的なエラー (429 はスケジューラー全体で待つので別扱い)
+TRANSIENT_ERRORS = (
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
+# 公平に順番を回す単位 (Streamlit のセッションごとの会話 ID など)
+_current_session: contextvars.ContextVar[str] = contextvars.ContextVar("rate_limit_session", default="")
+
+
+def set_rate_limit_session(session: str) -> None:
+    """Set the fairness key for LLM calls made from the current thread or task."""
+    _current_session.set(session)
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """Parse ``"gpt-4=200:40000,gpt-3.5-turbo=3500:90000"`` into ``{model: (rpm, tpm)}``."""
+    limits = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        model, _, limit = part.partition("=")
+        rpm, _, tpm = limit.partition(":")
+        limits[model.strip()] = (float(rpm), float(tpm))
+    return limits
+
+
+class TokenBucket:
+    """Refills ``rate_per_minute`` units per minute up to one minute's worth (unlimited when not positive)."""
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.unlimited = rate_per_minute <= 0
+        self.rate = rate_per_minute / 60.0
+        self.capacity = math.inf if self.unlimited else rate_per_minute
+        self.level = self.capacity
+        self._updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level -= amount
+
+    def drain(self) -> None:
+        if not self.unlimited:
+            self.level = min(self.level, 0.0)
+
+    def time_until(self, amount: float) -> float:
+        if self.unlimited:
+            return 0.0
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class _Ticket:
+    __slots__ = ("session", "tokens", "granted", "_notify")
+
+    def __init__(self, session: str, tokens: float, notify: Callable[[], None]) -> None:
+        self.session = session
+        self.tokens = tokens
+        self.granted = False
+        self._notify = notify
+
+    def grant(self) -> None:
+        self.granted = True
+        self._notify()
+
+
+class _ModelLimiter:
+    def __init__(self, rpm: float, tpm: float) -> None:
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # セッションごとの待ち行列。先頭のセッションから順番に 1 件ずつ通す
+        self.queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self.cooldown_until = 0.0
+        self.consecutive_rate_limits = 0
+
+
+class RateLimitScheduler:
+    """Process-wide admission control for OpenAI requests.
+
+    Every request takes one unit from the model's request bucket and its estimated tokens (prompt plus
+    expected completion) from the token bucket. Waiting requests are served round-robin across sessions,
+    so a map-reduce fan-out cannot starve the chat of other users. A 429 pauses the whole model for a
+    jittered, exponentially growing time instead of letting every caller retry on its own.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        backoff_base: float = RATE_LIMIT_BACKOFF_BASE,
+        backoff_max: float = RATE_LIMIT_BACKOFF_MAX,
+    ) -> None:
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        self.limits.update(limits or {})
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, _ModelLimiter] = {}
+
+    def _get_limiter(self, model: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            prefix = max((prefix for prefix in self.limits if model.startswith(prefix)), key=len, default="")
+            rpm, tpm = self.limits.get(prefix, (0, 0))
+            limiter = self._limiters.setdefault(model, _ModelLimiter(rpm, tpm))
+        return limiter
+
+    def acquire(self, model: str, tokens: float) -> float:
+        """Block until the request may be sent; return the seconds spent waiting."""
+        started_at = time.monotonic()
+        event = threading.Event()
+        ticket = self._enqueue(model, tokens, event.set)
+        while not ticket.granted:
+            event.wait(self._dispatch(model))
+        return time.monotonic() - started_at
+
+    async def aacquire(self, model: str, tokens: float) -> float:
+        started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        ticket = self._enqueue(model, tokens, lambda: loop.call_soon_threadsafe(event.set))
+        while not ticket.granted:
+            try:
+                await asyncio.wait_for(event.wait(), self._dispatch(model))
+            except asyncio.TimeoutError:
+                pass
+        return time.monotonic() - started_at
+
+    def _enqueue(self, model: str, tokens: float, notify: Callable[[], None]) -> _Ticket:
+        with self._lock:
+            limiter = self._get_limiter(model)
+            # 1 分の上限を超えるリクエストは、バケツが満杯になれば通す
+            ticket = _Ticket(_current_session.get(), min(tokens, limiter.tokens.capacity), notify)
+            limiter.queues.setdefault(ticket.session, deque()).append(ticket)
+        self._dispatch(model)
+        return ticket
+
+    def _dispatch(self, model: str) -> float:
+        """Grant as many queued requests as the buckets allow; return how long until the next one can go."""
+        with self._lock:
+            limiter = self._limiters[model]
+            now = time.monotonic()
+            limiter.requests.refill(now)
+            limiter.tokens.refill(now)
+            while limiter.queues:
+                if now < limiter.cooldown_until:
+                    return limiter.cooldown_until - now
+                session, queue = next(iter(limiter.queues.items()))
+                ticket = queue[0]
+                wait = max(limiter.requests.time_until(1), limiter.tokens.time_until(ticket.tokens))
+                if wait > 0:
+                    return wait
+                limiter.requests.take(1)
+                limiter.tokens.take(ticket.tokens)
+                queue.popleft()
+                # 通したセッションは列の最後に回す
+                del limiter.queues[session]
+                if queue:
+                    limiter.queues[session] = queue
+                ticket.grant()
+            return 0.0
+
+    def report_rate_limited(self, model: str, retry_after: Optional[float] = None) -> float:
+        """Pause ``model`` after a 429 and return the pause in seconds."""
+        with self._lock:
+            limiter = self._get_limiter(model)
+            self.rate_limited += 1
+            now = time.monotonic()
+            if now < limiter.cooldown_until:
+                # 同じ待ちの間に返ってきた 429 (並列に送っていた分) では待ち時間を延ばさない
+                backoff = max(limiter.cooldown_until - now, retry_after or 0.0)
+            else:
+                limiter.consecutive_rate_limits += 1
+                backoff = self._backoff(limiter.consecutive_rate_limits, retry_after)
+            limiter.cooldown_until = max(limiter.cooldown_until, now + backoff)
+            # API 側の残量は分からないので、バケツも空にしてから再開する
+            limiter.requests.drain()
+            limiter.tokens.drain()
+        logger.warning(f"rate limited on {model}; pausing for {backoff:.2f} s")
+        return backoff
+
+    def report_success(self, model: str) -> None:
+        limiter = self._limiters.get(model)
+        if limiter is not None and limiter.consecutive_rate_limits:
+            with self._lock:
+                limiter.consecutive_rate_limits = 0
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # full jitter: 全員が同じ時刻に再試行しないよう [0, 上限) から選ぶ
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        return max(backoff, retry_after or 0.0)
+
+    def transient_backoff(self, attempt: int) -> float:
+        return self._backoff(attempt)
+
+
+def _retry_after(error: openai.error.OpenAIError) -> Optional[float]:
+    try:
+        return float(error.headers.get("retry-after", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+class ScheduledChatCompletion:
+    """Drop-in for ``openai.ChatCompletion`` (``ChatOpenAI.client``) that sends every call through the scheduler.
+
+    Rate limits and transient errors are retried here with jittered backoff, so the ``ChatOpenAI``
+    using it should not retry on its own (``max_retries=1``).
+    """
+
+    def __init__(
+        self,
+        scheduler: RateLimitScheduler,
+        client: Any = openai.ChatCompletion,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES,
+        expected_completion_tokens: int = RATE_LIMIT_EXPECTED_COMPLETION_TOKENS,
+    ) -> None:
+        self.scheduler = scheduler
+        self.client = client
+        self.max_retries = max(max_retries, 1)
+        self.expected_completion_tokens = expected_completion_tokens
+
+    def estimate_tokens(self, **kwargs: Any) -> int:
+        prompt_tokens = TokenCostProcess(kwargs["model"]).tokens_from_message_dicts(kwargs.get("messages", []))
+        return prompt_tokens + (kwargs.get("max_tokens") or self.expected_completion_tokens)
+
+    def create(self, **kwargs: Any) -> Any:
+        model = kwargs["model"]
+        tokens = self.estimate_tokens(**kwargs)
+        for attempt in range(1, self.max_retries + 1):
+            self._record_wait(self.scheduler.acquire(model, tokens))
+            try:
+                response = self.client.create(**kwargs)
+                self.scheduler.report_success(model)
+                return response
+            except openai.error.RateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                self.scheduler.report_rate_limited(model, _retry_after(e))
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                backoff = self.scheduler.transient_backoff(attempt)
+                logger.warning(f"{model} request failed ({e!r}); retrying in {backoff:.2f} s")
+                time.sleep(backoff)
+
+    async def acreate(self, **kwargs: Any) -> Any:
+        model = kwargs["model"]
+        tokens = self.estimate_tokens(**kwargs)
+        for attempt in range(1, self.max_retries + 1):
+            self._record_wait(await self.scheduler.aacquire(model, tokens))
+            try:
+                response = await self.client.acreate(**kwargs)
+                self.scheduler.report_success(model)
+                return response
+            except openai.error.RateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                self.scheduler.report_rate_limited(model, _retry_after(e))
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                backoff = self.scheduler.transient_backoff(attempt)
+                logger.warning(f"{model} request failed ({e!r}); retrying in {backoff:.2f} s")
+                await asyncio.sleep(backoff)
+
+    @staticmethod
+    def _record_wait(seconds: float) -> None:
+        span = tracer.current_span()
+        if span is not None:
+            span.set(rate_wait_ms=span.attributes.get("rate_wait_ms", 0.0) + seconds * 1000)
+
+
+_rate_limit_scheduler: Optional[RateLimitScheduler] = None
+_rate_limit_scheduler_lock = threading.Lock()
+
+
+def get_rate_limit_scheduler() -> RateLimitScheduler:
+    """Return the scheduler shared by every session."""
+    global _rate_limit_scheduler
+    with _rate_limit_scheduler_lock:
+        if _rate_limit_scheduler is None:
+            _rate_limit_scheduler = RateLimitScheduler(parse_rate_limits(RATE_LIMITS))
+        return _rate_limit_scheduler
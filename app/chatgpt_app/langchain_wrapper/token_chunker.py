@@ -0,0 +1,131 @@
+from array import array
+from itertools import accumulate
+from typing import TYPE_CHECKING, Iterable, List, NamedTuple, Optional, Sequence
+
+from langchain.docstore.document import Document
+
+if TYPE_CHECKING:
+    import tiktoken
+
+try:
+    import numpy as np
+except ImportError:  # numpy が無ければ array で代用する
+    np = None
+
+# ここで文が終わるとみなすトークン末尾
+SENTENCE_ENDINGS = tuple(ending.encode("utf-8") for ending in (".", "!", "?", "\n", "。", "！", "？", "」"))
+
+
+class TokenChunk(NamedTuple):
+    text: str
+    token_count: int
+    start_index: int
+    end_index: int
+
+
+class TokenChunker:
+    """Split text into chunks of at most ``chunk_size`` tokens by encoding it only once.
+
+    The token array is cut preferably right after a sentence ending, then before a word boundary,
+    looking back at most ``boundary_window`` (ratio of ``chunk_size``) tokens from the hard limit.
+    Each chunk keeps its token count and its character offsets in the original text.
+    """
+
+    def __init__(
+        self,
+        encoding: "tiktoken.Encoding",
+        chunk_size: int,
+        chunk_overlap: int = 0,
+        boundary_window: float = 0.25,
+    ) -> None:
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.boundary_window = max(1, int(chunk_size * boundary_window))
+
+    def split_text(self, text: str) -> List[TokenChunk]:
+        tokens = self.encoding.encode_ordinary(text)
+        if not tokens:
+            return []
+
+        token_bytes = self.encoding.decode_tokens_bytes(tokens)
+        byte_offsets = _cumsum(len(b) for b in token_bytes)
+        char_offsets = _char_offsets(text)
+        sentence_ends = [b.endswith(SENTENCE_ENDINGS) for b in token_bytes]
+        word_starts = [b[:1].isspace() for b in token_bytes]
+
+        chunks = []
+        start = 0
+        while start < len(tokens):
+            end = min(start + self.chunk_size, len(tokens))
+            if end < len(tokens):
+                end = self._find_boundary(start, end, sentence_ends, word_starts)
+            # トークン境界が文字の途中にあるときは、その文字を前のチャンクに含める
+            start_char = int(char_offsets[byte_offsets[start]])
+            end_char = int(char_offsets[byte_offsets[end]])
+            chunks.append(
+                TokenChunk(
+                    text=text[start_char:end_char],
+                    token_count=end - start,
+                    start_index=start_char,
+                    end_index=end_char,
+                )
+            )
+            if end >= len(tokens):
+                break
+            start = max(end - self.chunk_overlap, start + 1)
+        return chunks
+
+    def _find_boundary(self, start: int, end: int, sentence_ends: List[bool], word_starts: List[bool]) -> int:
+        lowest = max(start + 1, end - self.boundary_window)
+        for i in range(end, lowest - 1, -1):
+            if sentence_ends[i - 1]:
+                return i
+        for i in range(end, lowest - 1, -1):
+            if word_starts[i]:
+                return i
+        return end
+
+    def create_documents(self, texts: Iterable[str], metadatas: Optional[Sequence[dict]] = None) -> List[Document]:
+        documents = []
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas is not None else {}
+            for chunk in self.split_text(text):
+                documents.append(
+                    Document(
+                        page_content=chunk.text,
+                        metadata={
+                            **metadata,
+                            "token_count": chunk.token_count,
+                            "start_index": chunk.start_index,
+                            "end_index": chunk.end_index,
+                        },
+                    )
+                )
+        return documents
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        documents = list(documents)
+        return self.create_documents([doc.page_content for doc in documents], [doc.metadata for doc in documents])
+
+
+def _cumsum(values: Iterable[int]) -> Sequence[int]:
+    """Return ``[0, v0, v0 + v1, ...]``."""
+    if np is not None:
+        lengths = np.fromiter(values, dtype=np.int64)
+        return np.concatenate(([0], np.cumsum(lengths)))
+    return array("q", accumulate(values, initial=0))
+
+
+def _char_offsets(text: str) -> Sequence[int]:
+    """Map every UTF-8 byte offset of ``text`` (0..len inclusive) to the number of characters starting before it."""
+    encoded = text.encode("utf-8")
+    if len(encoded) == len(text):
+        # ASCII だけならバイト位置 = 文字位置
+        return range(len(text) + 1)
+    if np is not None:
+        is_char_start = (np.frombuffer(encoded, dtype=np.uint8) & 0xC0) != 0x80
+        return np.concatenate(([0], np.cumsum(is_char_start)))
+    return array("q", accumulate(((b & 0xC0) != 0x80 for b in encoded), initial=0))
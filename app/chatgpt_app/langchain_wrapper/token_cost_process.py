@@ -1,23 +1,40 @@
-from typing import Dict, List
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
-import tiktoken
+from chatgpt_app.langchain_wrapper.tokenizer import tokenizer_registry
 from chatgpt_app.logger import get_logger
 from langchain.chat_models.openai import _convert_message_to_dict
 from langchain.schema.messages import BaseMessage
 
+if TYPE_CHECKING:
+    import tiktoken
+
 logger = get_logger(__name__)
 
+# "<model>-completion" は回答トークンの単価 (無ければプロンプトと同じ単価)
 MODEL_COST_PER_1K_TOKENS = {
     "gpt-4": 0.03,
     "gpt-4-0314": 0.03,
+    "gpt-4-0613": 0.03,
     "gpt-4-completion": 0.06,
     "gpt-4-0314-completion": 0.06,
+    "gpt-4-0613-completion": 0.06,
     "gpt-4-32k": 0.06,
     "gpt-4-32k-0314": 0.06,
+    "gpt-4-32k-0613": 0.06,
     "gpt-4-32k-completion": 0.12,
     "gpt-4-32k-0314-completion": 0.12,
-    "gpt-3.5-turbo": 0.002,
+    "gpt-4-32k-0613-completion": 0.12,
+    "gpt-3.5-turbo": 0.0015,
     "gpt-3.5-turbo-0301": 0.002,
+    "gpt-3.5-turbo-0613": 0.0015,
+    "gpt-3.5-turbo-completion": 0.002,
+    "gpt-3.5-turbo-0613-completion": 0.002,
+    "gpt-3.5-turbo-16k": 0.003,
+    "gpt-3.5-turbo-16k-0613": 0.003,
+    "gpt-3.5-turbo-16k-completion": 0.004,
+    "gpt-3.5-turbo-16k-0613-completion": 0.004,
     "text-ada-001": 0.0004,
     "ada": 0.0004,
     "text-babbage-001": 0.0005,
@@ -30,13 +47,46 @@ MODEL_COST_PER_1K_TOKENS = {
 }
 
 
+def cost_per_1k_tokens(model: str, is_completion: bool = False) -> float:
+    """Return the USD price of 1k prompt (or completion) tokens of ``model``."""
+    if model not in MODEL_COST_PER_1K_TOKENS:
+        raise ValueError(
+            f"Unknown model: {model}. Please provide a valid OpenAI model name. "
+            f"Known models are: {', '.join(MODEL_COST_PER_1K_TOKENS.keys())}"
+        )
+    if is_completion:
+        return MODEL_COST_PER_1K_TOKENS.get(f"{model}-completion", MODEL_COST_PER_1K_TOKENS[model])
+    return MODEL_COST_PER_1K_TOKENS[model]
+
+
+# モデルごとのコンテキスト長 (プロンプト + 回答のトークン数の上限)
+MODEL_CONTEXT_WINDOW = {
+    "gpt-4": 8192,
+    "gpt-4-0314": 8192,
+    "gpt-4-0613": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-32k-0314": 32768,
+    "gpt-4-32k-0613": 32768,
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-0301": 4096,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-3.5-turbo-16k-0613": 16384,
+}
+
+
+def context_window(model: str) -> int:
+    """Return the context window of ``model``, falling back to the smallest one for unknown models."""
+    return MODEL_CONTEXT_WINDOW.get(model, min(MODEL_CONTEXT_WINDOW.values()))
+
+
+REPLY_PRIMING_TOKENS = 3  # every reply is primed with <|start|>assistant<|message|>
+
+
 def num_tokens_from_messages(messages: List[Dict[str, str]], model: str = "gpt-3.5-turbo-0613") -> int:
     """Return the number of tokens used by a list of messages."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.warning("model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+    model = tokenizer_registry.resolve_model(model)
+    encoding = tokenizer_registry.get_encoding(model)
 
     if model in {
         "gpt-3.5-turbo-0613",
@@ -51,12 +101,6 @@ def num_tokens_from_messages(messages: List[Dict[str, str]], model: str = "gpt-3
     elif model == "gpt-3.5-turbo-0301":
         tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
         tokens_per_name = -1  # if there's a name, the role is omitted
-    elif "gpt-3.5-turbo" in model:
-        logger.warning("gpt-3.5-turbo may update over time. " "Returning num tokens assuming gpt-3.5-turbo-0613.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo-0613")
-    elif "gpt-4" in model:
-        logger.warning("gpt-4 may update over time. " "Returning num tokens assuming gpt-4-0613.")
-        return num_tokens_from_messages(messages, model="gpt-4-0613")
     else:
         raise NotImplementedError(
             f"num_tokens_from_messages() is not implemented for model {model}. "
@@ -66,12 +110,29 @@ def num_tokens_from_messages(messages: List[Dict[str, str]], model: str = "gpt-3
 
     num_tokens = 0
     for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+        num_tokens += _num_tokens_from_message(
+            encoding, tuple(message.items()), tokens_per_message=tokens_per_message, tokens_per_name=tokens_per_name
+        )
+    num_tokens += REPLY_PRIMING_TOKENS
+    return num_tokens
+
+
+@lru_cache(maxsize=8192)
+def _num_tokens_from_message(
+    encoding: "tiktoken.Encoding",
+    message_items: Tuple[Tuple[str, str], ...],
+    tokens_per_message: int,
+    tokens_per_name: int,
+) -> int:
+    """Return the number of tokens used by a single message.
+
+    Cached per (encoding, message content), so each message in a growing chat history is encoded only once.
+    """
+    num_tokens = tokens_per_message
+    for key, value in message_items:
+        num_tokens += len(encoding.encode(value))
+        if key == "name":
+            num_tokens += tokens_per_name
     return num_tokens
 
 
@@ -81,24 +142,39 @@ class TokenCostProcess:
     completion_tokens: int = 0
     successful_requests: int = 0
 
-    def __init__(self, model: str) -> None:
+    def __init__(self, model: str, page: str = "") -> None:
         self.model = model
-        self.encoding = tiktoken.encoding_for_model(self.model)
+        # 使用量台帳に記録するときの呼び出し元ページ
+        self.page = page
+        self.encoding = tokenizer_registry.get_encoding(self.model)
+        # map-reduce の並列呼び出しから同時に加算されるのでロックする
+        self._lock = threading.Lock()
 
     def sum_prompt_tokens(self, tokens: int) -> None:
-        self.prompt_tokens = self.prompt_tokens + tokens
-        self.total_tokens = self.total_tokens + tokens
+        with self._lock:
+            self.prompt_tokens = self.prompt_tokens + tokens
+            self.total_tokens = self.total_tokens + tokens
 
     def sum_completion_tokens(self, tokens: int) -> None:
-        self.completion_tokens = self.completion_tokens + tokens
-        self.total_tokens = self.total_tokens + tokens
+        with self._lock:
+            self.completion_tokens = self.completion_tokens + tokens
+            self.total_tokens = self.total_tokens + tokens
 
     def sum_successful_requests(self, requests: int) -> None:
-        self.successful_requests = self.successful_requests + requests
+        with self._lock:
+            self.successful_requests = self.successful_requests + requests
+
+    @property
+    def prompt_cost(self) -> float:
+        return cost_per_1k_tokens(self.model) * self.prompt_tokens / 1000
+
+    @property
+    def completion_cost(self) -> float:
+        return cost_per_1k_tokens(self.model, is_completion=True) * self.completion_tokens / 1000
 
     @property
     def total_cost(self) -> float:
-        return MODEL_COST_PER_1K_TOKENS[self.model] * self.total_tokens / 1000
+        return self.prompt_cost + self.completion_cost
 
     @property
     def cost_summary(self) -> str:
@@ -112,8 +188,16 @@ class TokenCostProcess:
 
     def tokens_from_base_messages(self, messages: List[BaseMessage]) -> int:
         msg_dicts = list(map(_convert_message_to_dict, messages))
+        return self.tokens_from_message_dicts(msg_dicts)
+
+    def tokens_from_message_dicts(self, msg_dicts: List[Dict[str, str]]) -> int:
+        """Count the prompt tokens of messages already in the API format (``{"role": ..., "content": ...}``)."""
         token_num = num_tokens_from_messages(msg_dicts, self.model)
         return token_num
 
+    def tokens_from_base_message(self, message: BaseMessage) -> int:
+        """Return the tokens of a single message in a chat request (without the reply priming)."""
+        return self.tokens_from_base_messages([message]) - REPLY_PRIMING_TOKENS
+
     def tokens_from_string(self, string: str) -> int:
         return len(self.encoding.encode(string))
@@ -0,0 +1,89 @@
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from chatgpt_app.logger import get_logger
+
+if TYPE_CHECKING:
+    import tiktoken
+
+logger = get_logger(__name__)
+
+# トークン数の計算方法が確定しているモデル
+PINNED_MODELS = {
+    "gpt-3.5-turbo-0301",
+    "gpt-3.5-turbo-0613",
+    "gpt-3.5-turbo-16k-0613",
+    "gpt-4-0314",
+    "gpt-4-32k-0314",
+    "gpt-4-0613",
+    "gpt-4-32k-0613",
+}
+
+
+class TokenizerRegistry:
+    """Process-wide, thread-safe cache of tiktoken encodings and model aliases.
+
+    Every model name is resolved and its encoding loaded once; afterwards lookups are plain dict reads.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        self._lock = threading.Lock()
+        self._resolved_models: Dict[str, str] = {}
+        self._encodings: Dict[str, "tiktoken.Encoding"] = {}
+        if cache_dir is not None:
+            self.set_cache_dir(cache_dir)
+
+    def set_cache_dir(self, cache_dir: Path) -> None:
+        # tiktoken は TIKTOKEN_CACHE_DIR にある BPE ファイルを優先して読む
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        os.environ["TIKTOKEN_CACHE_DIR"] = str(cache_dir)
+
+    def resolve_model(self, model: str) -> str:
+        """Return the pinned model whose token counting rules apply to ``model``."""
+        resolved = self._resolved_models.get(model)
+        if resolved is not None:
+            return resolved
+
+        if model in PINNED_MODELS:
+            resolved = model
+        elif "gpt-3.5-turbo" in model:
+            logger.warning(f"{model} may update over time. Assuming gpt-3.5-turbo-0613 for token counting.")
+            resolved = "gpt-3.5-turbo-0613"
+        elif "gpt-4" in model:
+            logger.warning(f"{model} may update over time. Assuming gpt-4-0613 for token counting.")
+            resolved = "gpt-4-0613"
+        else:
+            resolved = model
+        with self._lock:
+            self._resolved_models[model] = resolved
+        return resolved
+
+    def get_encoding(self, model: str) -> "tiktoken.Encoding":
+        encoding = self._encodings.get(model)
+        if encoding is not None:
+            return encoding
+
+        with self._lock:
+            # 他スレッドが先にロードしていればそれを使う
+            encoding = self._encodings.get(model)
+            if encoding is None:
+                import tiktoken  # 使うときまで読み込まない
+
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    logger.warning(f"{model} not found. Using cl100k_base encoding.")
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                self._encodings[model] = encoding
+        return encoding
+
+    def warm_up(self, models: Iterable[str]) -> None:
+        """Resolve aliases and load the BPE files for ``models`` ahead of the first request."""
+        for model in models:
+            self.get_encoding(self.resolve_model(model))
+            self.get_encoding(model)
+
+
+tokenizer_registry = TokenizerRegistry()
@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from chatgpt_app.logger import get_logger
+from chatgpt_app.settings import USAGE_LEDGER_PATH, USAGE_METRICS_PATH
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class UsageRecord:
+    """Usage of a single LLM request."""
+
+    model: str
+    page: str
+    prompt_tokens: int
+    completion_tokens: int
+    prompt_cost: float
+    completion_cost: float
+    started_at: float
+    finished_at: float
+    error: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost(self) -> float:
+        return self.prompt_cost + self.completion_cost
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class UsageTotals:
+    """Running sums over usage records."""
+
+    requests: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    prompt_cost: float = 0.0
+    completion_cost: float = 0.0
+    duration: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost(self) -> float:
+        return self.prompt_cost + self.completion_cost
+
+    def add(self, record: UsageRecord) -> None:
+        self.requests += 1
+        self.errors += int(record.error)
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.prompt_cost += record.prompt_cost
+        self.completion_cost += record.completion_cost
+        self.duration += record.duration
+
+
+# (メトリクス名, UsageTotals の属性, 種類, 説明)
+_PROMETHEUS_METRICS = (
+    ("chatgpt_app_llm_requests_total", "requests", "counter", "LLM requests."),
+    ("chatgpt_app_llm_request_errors_total", "errors", "counter", "LLM requests that failed."),
+    ("chatgpt_app_llm_prompt_tokens_total", "prompt_tokens", "counter", "Prompt tokens sent."),
+    ("chatgpt_app_llm_completion_tokens_total", "completion_tokens", "counter", "Completion tokens received."),
+    ("chatgpt_app_llm_prompt_cost_usd_total", "prompt_cost", "counter", "Cost of prompt tokens in USD."),
+    ("chatgpt_app_llm_completion_cost_usd_total", "completion_cost", "counter", "Cost of completion tokens in USD."),
+    ("chatgpt_app_llm_request_duration_seconds_total", "duration", "counter", "Time spent in LLM requests."),
+)
+
+
+class UsageLedger:
+    """Process-wide record of every LLM request.
+
+    Totals per (model, page) are updated as records arrive, so reading them is O(1).
+    Records are appended to ``jsonl_path`` and the totals are rewritten to ``metrics_path``
+    in the Prometheus text format (for the node_exporter textfile collector) when set.
+    """
+
+    def __init__(
+        self,
+        jsonl_path: Optional[Path] = None,
+        metrics_path: Optional[Path] = None,
+        max_recent_records: int = 100,
+    ) -> None:
+        self.jsonl_path = jsonl_path
+        self.metrics_path = metrics_path
+        self.totals = UsageTotals()
+        self._totals_by_key: Dict[Tuple[str, str], UsageTotals] = {}
+        self._recent: Deque[UsageRecord] = deque(maxlen=max_recent_records)
+        self._lock = threading.Lock()
+        for path in (jsonl_path, metrics_path):
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+
+    def record(self, record: UsageRecord) -> None:
+        with self._lock:
+            self.totals.add(record)
+            self._totals_by_key.setdefault((record.model, record.page), UsageTotals()).add(record)
+            self._recent.append(record)
+            try:
+                if self.jsonl_path is not None:
+                    with self.jsonl_path.open("a", encoding="utf-8") as f:
+                        f.write(self._to_json(record) + "\n")
+                if self.metrics_path is not None:
+                    self._write_metrics(self.metrics_path)
+            except OSError as e:
+                logger.warning(f"failed to export usage: {e}")
+
+    def totals_by_key(self) -> Dict[Tuple[str, str], UsageTotals]:
+        """Return a snapshot of the totals per (model, page)."""
+        with self._lock:
+            return {key: UsageTotals(**asdict(totals)) for key, totals in self._totals_by_key.items()}
+
+    def recent_records(self) -> List[UsageRecord]:
+        with self._lock:
+            return list(self._recent)
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            return self._to_prometheus()
+
+    def to_jsonl(self) -> str:
+        """Return the records kept in memory as JSON lines."""
+        with self._lock:
+            return "".join(self._to_json(record) + "\n" for record in self._recent)
+
+    def _to_prometheus(self) -> str:
+        lines = []
+        for name, attribute, metric_type, description in _PROMETHEUS_METRICS:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (model, page), totals in sorted(self._totals_by_key.items()):
+                lines.append(f'{name}{{model="{model}",page="{page}"}} {getattr(totals, attribute)}')
+        return "\n".join(lines) + "\n"
+
+    def _write_metrics(self, path: Path) -> None:
+        # 読み手が書きかけのファイルを見ないよう、一時ファイルに書いてから置き換える
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self._to_prometheus(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _to_json(record: UsageRecord) -> str:
+        return json.dumps({**asdict(record), "cost": record.cost}, ensure_ascii=False)
+
+
+_usage_ledger: Optional[UsageLedger] = None
+_usage_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Return the process-wide usage ledger."""
+    global _usage_ledger
+    with _usage_ledger_lock:
+        if _usage_ledger is None:
+            _usage_ledger = UsageLedger(USAGE_LEDGER_PATH, USAGE_METRICS_PATH)
+        return _usage_ledger
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from chatgpt_app.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class _InFlight(Generic[T]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.succeeded = False
+
+
+class SingleFlightCache(Generic[T]):
+    """Process-wide LRU cache shared by every Streamlit session.
+
+    Concurrent misses on the same key are coalesced: the first caller computes the value
+    and the others wait for it instead of issuing the same request again.
+    """
+
+    def __init__(self, max_entries: int = 128) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[Hashable, T]" = OrderedDict()
+        self._in_flight: Dict[Hashable, _InFlight[T]] = {}
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            if key not in self._results:
+                return None
+            self._results.move_to_end(key)
+            return self._results[key]
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Optional[T]]) -> Tuple[Optional[T], bool]:
+        """Return ``(value, computed)``.
+
+        ``computed`` is True only for the caller that actually ran ``compute``.
+        ``None`` results and failures are not cached, so the next caller retries.
+        """
+        while True:
+            with self._lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    return self._results[key], False
+                call = self._in_flight.get(key)
+                if call is None:
+                    call = _InFlight()
+                    self._in_flight[key] = call
+                    break
+            # 他のセッションが計算中なので完了を待つ
+            call.done.wait()
+            if call.succeeded:
+                return call.result, False
+            # 計算に失敗した(rerunで中断された等)場合は自分が計算し直す
+
+        try:
+            result = compute()
+            call.result = result
+            call.succeeded = result is not None
+            return result, True
+        finally:
+            with self._lock:
+                if call.succeeded:
+                    self._results[key] = call.result  # type: ignore
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+                del self._in_flight[key]
+            call.done.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
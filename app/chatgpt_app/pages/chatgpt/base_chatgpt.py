@@ -1,15 +1,47 @@
-from typing import List, Optional, Tuple
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
 
 import streamlit as st
-from chatgpt_app.const import PageId
-from chatgpt_app.langchain_wrapper import StreamlitCostCalcHandler, TokenCostProcess
+from chatgpt_app.const import MODEL_NAMES, PageId
+from chatgpt_app.jobs import Job, JobStatus, get_job_executor
+from chatgpt_app.langchain_wrapper import (
+    GenerationAborted,
+    GenerationBudget,
+    GenerationBudgetHandler,
+    LLMTimingHandler,
+    StreamlitCostCalcHandler,
+    TokenCostHandler,
+    TokenCostProcess,
+    get_response_cache,
+    get_usage_ledger,
+    set_rate_limit_session,
+)
+from chatgpt_app.memoize import SingleFlightCache
 from chatgpt_app.pages.base import BasePage
 from chatgpt_app.prompts import PromptsLoader
+from chatgpt_app.resource_pool import get_resource_pool
 from chatgpt_app.session import SessionKey, StreamlistSessionManager
+from chatgpt_app.settings import (
+    GENERATION_MAX_COMPLETION_TOKENS,
+    GENERATION_MAX_COST,
+    GENERATION_STOP_WAIT,
+    JOB_POLL_INTERVAL,
+    RESPONSE_CACHE_MAX_TEMPERATURE,
+    TRACE_DEBUG_PANEL,
+)
+from chatgpt_app.summarize import SYSTEM_PROMPT, Summarizer, SummaryResult
+from chatgpt_app.tracing import Span, set_trace_session, tracer
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import BaseMessage, SystemMessage
 from streamlit.delta_generator import DeltaGenerator
 
+# 要約結果はセッションをまたいで共有する (キーは summary_key)。URL 1件・一括・YouTube のどの要約もここを通す。
+# 途中で止まった要約は入れない
+summary_cache: SingleFlightCache[SummaryResult] = SingleFlightCache(max_entries=256)
+
 
 class BaseChatGPTPage(BasePage):
     def __init__(self, page_id: PageId, title: str, sm: StreamlistSessionManager) -> None:
@@ -17,49 +49,355 @@ class BaseChatGPTPage(BasePage):
         self.sidebar: Optional[DeltaGenerator] = None
         self.clear_button: Optional[bool] = None
         self.prompts_loader: PromptsLoader = PromptsLoader()
+        self.max_completion_tokens = GENERATION_MAX_COMPLETION_TOKENS
+        self.max_cost = GENERATION_MAX_COST
 
     def init_page(self) -> None:
         st.header(f"{self.title}  🤗")
         self.sidebar = st.sidebar
         self.sidebar.title("Options")
         self.clear_button = self.sidebar.button("Clear Conversation", key=SessionKey.CLEAR_BUTTON.name)
+        self.sidebar.button("Stop", on_click=self.stop_generations, help="Stop the answers and summaries in progress")
 
     def select_model(self) -> ChatOpenAI:
-        model_name = st.sidebar.radio("Choose a model:", ("gpt-3.5-turbo", "gpt-3.5-turbo-16k-0613", "gpt-4"))
+        model_name = st.sidebar.radio("Choose a model:", MODEL_NAMES)
         self.sm.register_model_name(model_name)
 
         # スライダーを追加し、temperatureを0から2までの範囲で選択可能にする
         # 初期値は0.0、刻み幅は0.1とする
         temperature = st.sidebar.slider("Temperature:", min_value=0.0, max_value=2.0, value=0.0, step=0.01)
 
-        llm = ChatOpenAI(  # type: ignore
-            temperature=temperature,
-            model_name=self.sm.get_model_name(),
-            streaming=True,
-        )
+        # クライアントは設定ごとに全セッションで共有する
+        llm = get_resource_pool().chat_model(self.sm.get_model_name(), temperature)
         return llm
 
+    def select_budget(self) -> None:
+        # 上限はページごとに持つ (0 は上限なし)
+        self.max_completion_tokens = int(
+            st.sidebar.number_input(
+                "Max completion tokens per answer (0: no limit):",
+                min_value=0,
+                value=GENERATION_MAX_COMPLETION_TOKENS,
+                step=100,
+                key=f"{self.page_id.name}_max_completion_tokens",
+            )
+        )
+        self.max_cost = float(
+            st.sidebar.number_input(
+                "Max cost per answer in USD (0: no limit):",
+                min_value=0.0,
+                value=GENERATION_MAX_COST,
+                step=0.01,
+                format="%.3f",
+                key=f"{self.page_id.name}_max_cost",
+            )
+        )
+
+    def new_budget(self, model_name: str, cancel_event: Optional[threading.Event] = None) -> GenerationBudget:
+        return GenerationBudget(model_name, self.max_completion_tokens, self.max_cost, cancel_event)
+
+    def budget_key(self) -> Tuple[int, float]:
+        """Caps to put in a job key: a job run under other caps may stop at a different point."""
+        return (self.max_completion_tokens, self.max_cost)
+
+    def summary_key(self, url: str, llm: ChatOpenAI, length: int) -> Hashable:
+        # ページ, URL, モデル, temperature, 長さ (YouTube は分割するトークン数)
+        return (self.page_id, url, llm.model_name, llm.temperature, length)
+
+    def cached_summary(self, key: Hashable, compute: Callable[[], SummaryResult]) -> Tuple[SummaryResult, bool]:
+        """Return ``(result, computed)`` from ``summary_cache``, computing it once across sessions on a miss.
+
+        A result cut short by Stop or a limit goes back to this caller only: it is neither cached nor handed
+        to the sessions waiting on the same key, which then compute it themselves.
+        """
+        stopped: List[SummaryResult] = []
+
+        def complete() -> Optional[SummaryResult]:
+            result = compute()
+            if result.stopped:
+                stopped.append(result)
+                return None
+            return result
+
+        result, computed = summary_cache.get_or_compute(key, complete)
+        if stopped:
+            return stopped[0], True
+        return result, computed  # type: ignore
+
+    def stop_generations(self) -> None:
+        """Stop button callback: cancel the answer this session is streaming and its background jobs."""
+        budget = self.sm.get_generation()
+        if budget is not None:
+            budget.cancel()
+        get_job_executor().cancel(self.sm.get_conversation_id())
+
+    @contextmanager
+    def generation(self, llm: ChatOpenAI) -> Iterator[GenerationBudget]:
+        """Budget of an answer streamed by this script run, which the Stop button can cancel.
+
+        Record the answer through ``get_streaming_answer``'s ``record``: a stopped run can no longer draw,
+        and the next run waits for the block to exit before it renders the history.
+        """
+        budget = self.new_budget(llm.model_name)
+        self.sm.register_generation(budget)
+        try:
+            yield budget
+        finally:
+            budget.close()
+
+    def system_message(self) -> SystemMessage:
+        return SystemMessage(content=SYSTEM_PROMPT)
+
     def init_messages(self, sm: StreamlistSessionManager) -> None:
         sm.clear_messages()
         sm.clear_costs()
-        sm.add_message(SystemMessage(content="You are a helpful assistant."))
+        sm.add_message(self.system_message())
 
     def base_components(self) -> ChatOpenAI:
+        # レート制限の待ち行列はセッション (会話) ごとに順番を回し、トレースもセッションごとに分ける
+        set_rate_limit_session(self.sm.get_conversation_id())
+        set_trace_session(self.sm.get_conversation_id())
         self.init_page()
         llm = self.select_model()
+        self.select_budget()
+        budget = self.sm.get_generation()
+        if budget is not None:
+            # 前の実行が止められた回答を記録し終えてから履歴を描く
+            budget.wait_closed(GENERATION_STOP_WAIT)
         if self.clear_button:
             self.init_messages(self.sm)
         return llm
 
     def total_cost_component(self) -> None:
-        costs = self.sm.get_costs()
         if self.sidebar is not None:
             self.sidebar.markdown("## Costs")
-            self.sidebar.markdown(f"**Total cost: ${sum(costs):.5f}**")
-
-    def get_streaming_answer(self, llm: ChatOpenAI, messages: List[BaseMessage]) -> Tuple[str, float]:
-        token_cost_process = TokenCostProcess(llm.model_name)
-        st_callback = StreamlitCostCalcHandler(st.container(), token_cost_process)
-        answer = llm(messages, callbacks=[st_callback]).content
-        cost = token_cost_process.total_cost
-        return answer, cost
+            self.sidebar.markdown(f"**Total cost: ${self.sm.get_total_cost():.5f}**")
+            # 全セッションの合計 (使用量台帳の集計値)
+            usage = get_usage_ledger().totals
+            self.sidebar.markdown(
+                f"All sessions: ${usage.cost:.5f} / {usage.requests} requests / "
+                f"{usage.prompt_tokens} prompt + {usage.completion_tokens} completion tokens"
+            )
+            response_cache = get_response_cache()
+            self.sidebar.markdown(f"Response cache: {response_cache.hits} hits / {response_cache.misses} misses")
+            pool = get_resource_pool()
+            self.sidebar.markdown(f"LLM clients: {pool.num_clients} pooled / {pool.hits} reused")
+
+    def get_streaming_answer(
+        self,
+        llm: ChatOpenAI,
+        messages: List[BaseMessage],
+        record: Callable[[str, float], None],
+        budget: Optional[GenerationBudget] = None,
+    ) -> Tuple[str, float]:
+        """Stream the answer, pass it with its cost to ``record`` and return them.
+
+        If ``budget`` stops the answer, the partial answer is recorded and returned. If Streamlit stops
+        the script while the answer streams (Stop or any other widget), the partial answer is recorded
+        before the interrupt is re-raised, so ``record`` must not draw anything.
+        """
+        with tracer.span("llm", model=llm.model_name, page=self.page_id.name) as span:
+            token_cost_process = TokenCostProcess(llm.model_name, page=self.page_id.name)
+            st_callback = StreamlitCostCalcHandler(st.container(), token_cost_process, budget=budget)
+
+            # 同一リクエストはキャッシュから再生する (コストは発生しない)
+            use_cache = llm.temperature <= RESPONSE_CACHE_MAX_TEMPERATURE
+            if use_cache:
+                response_cache = get_response_cache()
+                key = response_cache.make_key(llm.model_name, llm.temperature, messages)
+                cached_answer = response_cache.get(key)
+                if cached_answer is not None:
+                    span.set(cached=True)
+                    try:
+                        st_callback.replay(messages, cached_answer)
+                    except GenerationAborted:
+                        pass
+                    record(cached_answer, 0.0)
+                    if st_callback.interrupted is not None:
+                        raise st_callback.interrupted
+                    return cached_answer, 0.0
+
+            stopped: Optional[GenerationAborted] = None
+            try:
+                if budget is not None:
+                    budget.check(messages)
+                answer = llm(messages, callbacks=[st_callback, LLMTimingHandler(span)]).content
+            except GenerationAborted as e:
+                # 途中までの回答とそのコストを返す (キャッシュはしない)
+                answer = st_callback.partial_answer
+                stopped = e
+                span.set(stopped=e.reason)
+            else:
+                if use_cache:
+                    response_cache.put(key, llm.model_name, answer)
+            cost = token_cost_process.total_cost
+            span.set(
+                prompt_tokens=token_cost_process.prompt_tokens, completion_tokens=token_cost_process.completion_tokens
+            )
+            # 描画の前に記録する (止められたスクリプトは次の描画で打ち切られる)
+            record(answer, cost)
+            if st_callback.interrupted is not None:
+                raise st_callback.interrupted
+            if stopped is not None and not stopped.cancelled:
+                st.warning(f"Stopped: {stopped.reason}")
+            return answer, cost
+
+    def complete(
+        self,
+        llm: ChatOpenAI,
+        messages: List[BaseMessage],
+        token_cost_process: TokenCostProcess,
+        budget: Optional[GenerationBudget] = None,
+    ) -> str:
+        """Run a call whose answer is not shown (e.g. summarizing the history) under the same cache and budget.
+
+        Raises GenerationAborted when ``budget`` is used up or cancelled before or during the call.
+        """
+        with tracer.span("llm", model=llm.model_name, page=self.page_id.name) as span:
+            use_cache = llm.temperature <= RESPONSE_CACHE_MAX_TEMPERATURE
+            if use_cache:
+                response_cache = get_response_cache()
+                key = response_cache.make_key(llm.model_name, llm.temperature, messages)
+                cached_answer = response_cache.get(key)
+                if cached_answer is not None:
+                    span.set(cached=True)
+                    return cached_answer
+
+            callbacks: List[BaseCallbackHandler] = [TokenCostHandler(token_cost_process), LLMTimingHandler(span)]
+            if budget is not None:
+                budget.check(messages)
+                callbacks.append(GenerationBudgetHandler(budget))
+            try:
+                answer = llm(messages, callbacks=callbacks).content
+            except GenerationAborted as e:
+                span.set(stopped=e.reason)
+                raise
+            if use_cache:
+                response_cache.put(key, llm.model_name, answer)
+            return answer
+
+    def job_component(self, job: Job, render_detail: Optional[Callable[[Any], None]] = None) -> None:
+        """Draw a background job's progress, details and streamed answer until it finishes.
+
+        Leaving the page or rerunning only stops this loop; the job keeps running and the next run
+        attaches to it again.
+        """
+        status = st.empty()
+        details = st.container()
+        answer = st.empty()
+        shown = 0
+        while True:
+            # 先に完了を確認してから描くことで、最後の更新を取りこぼさない
+            done = job.done
+            if render_detail is not None:
+                new_details = job.details[shown:]
+                shown += len(new_details)
+                with details:
+                    for detail in new_details:
+                        render_detail(detail)
+            if done:
+                break
+            status.progress(job.progress or 0.0, text=job.message)
+            if job.partial_answer:
+                answer.markdown(job.partial_answer)
+            time.sleep(JOB_POLL_INTERVAL)
+        status.empty()
+        answer.empty()
+        if job.status is JobStatus.FAILED:
+            st.error(f"{job.title} failed: {job.error}")
+        elif job.status is JobStatus.STOPPED and job.result is None:
+            st.warning(f"{job.title} was stopped before it produced a result.")
+            self.run_again_component(job.key)
+
+    def stopped_component(self, key: Hashable, reason: str) -> None:
+        """Notice for a summary cut short by Stop or a limit, with a button to run it again."""
+        st.warning(f"Stopped: {reason}. The summary above is partial.")
+        self.run_again_component(key)
+
+    def run_again_component(self, key: Hashable) -> None:
+        # 止めたジョブは自動では再実行しない。ボタンで捨てると次の実行で投入し直される
+        st.button("Run again", on_click=get_job_executor().discard, args=(key,))
+
+    def jobs_component(self) -> None:
+        """Sidebar list of the background jobs started by this session."""
+        if self.sidebar is None:
+            return
+        jobs = get_job_executor().jobs(owner=self.sm.get_conversation_id())
+        if not jobs:
+            return
+        with self.sidebar.expander(f"Jobs ({len(jobs)})", expanded=False):
+            for job in reversed(jobs):
+                progress = f" {job.progress:.0%}" if job.progress is not None and not job.done else ""
+                st.text(f"{job.status.value}{progress}  {job.title}")
+
+    def followup_component(self, llm: ChatOpenAI, summarizer: Summarizer, url: str, source: Any) -> None:
+        """Questions about a summarized page, answered from the indexed chunks closest to each question."""
+        st.markdown("## Follow-up questions")
+        for question, answer in self.sm.get_followups(url):
+            st.chat_message("user").markdown(question)
+            st.chat_message("assistant").markdown(answer)
+        with st.form(key="followup_form", clear_on_submit=True):
+            question = st.text_input("Ask about this content:")
+            submitted = st.form_submit_button("Ask")
+        if submitted and question:
+            st.chat_message("user").markdown(question)
+            with st.chat_message("assistant"), tracer.span("followup", url=url, model=llm.model_name), self.generation(
+                llm
+            ) as budget:
+                messages, hits = summarizer.followup_prompt(url, source, question)
+
+                def record(answer: str, cost: float) -> None:
+                    self.sm.add_cost(cost)
+                    self.sm.add_followup(url, question, answer)
+
+                _, cost = self.get_streaming_answer(llm, messages, record, budget)
+                st.markdown(f"cost: ${cost:.5f}")
+                with st.expander(f"{len(hits)} passages used", expanded=False):
+                    for hit in hits:
+                        st.markdown(f"**Part {hit.position + 1}** (score: {hit.score:.2f})")
+                        st.text(hit.text)
+
+    def trace_component(self) -> None:
+        """Debug panel with this session's latest traces, shown when ``TRACE_DEBUG_PANEL`` is on."""
+        if self.sidebar is None or not TRACE_DEBUG_PANEL:
+            return
+        session = self.sm.get_conversation_id()
+        traces = tracer.traces(session)
+        with self.sidebar.expander(f"Traces ({len(traces)})", expanded=False):
+            if not traces:
+                st.write("No traces yet.")
+                return
+            for spans in traces[:5]:
+                st.text(format_trace(spans))
+            st.download_button("Download traces (JSON)", tracer.to_json(session), file_name="traces.json")
+            st.download_button("Download Chrome trace", tracer.to_chrome_trace(session), file_name="chrome_trace.json")
+
+
+# デバッグパネルに出す属性
+_TRACE_ATTRIBUTES = (
+    "ttft_ms",
+    "tokens_per_second",
+    "max_gap_ms",
+    "queue_ms",
+    "rate_wait_ms",
+    "cached",
+    "parts",
+    "indexed",
+    "stopped",
+    "error",
+)
+
+
+def format_trace(spans: List[Span]) -> str:
+    """Render a trace as an indented tree of spans with their durations."""
+    depths: Dict[Optional[str], int] = {None: -1}
+    lines = []
+    for span in spans:
+        depths[span.span_id] = depths.get(span.parent_id, 0) + 1
+        attributes = " ".join(
+            f"{name}={value:.1f}" if isinstance(value, float) else f"{name}={value}"
+            for name, value in span.attributes.items()
+            if name in _TRACE_ATTRIBUTES
+        )
+        lines.append(f"{'  ' * depths[span.span_id]}{span.name} {span.duration * 1000:.0f} ms {attributes}".rstrip())
+    return "\n".join(lines)
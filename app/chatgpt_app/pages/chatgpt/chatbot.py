@@ -1,24 +1,68 @@
-from copy import deepcopy
-from typing import List
+from typing import List, Optional, Tuple
 
 import streamlit as st
+from chatgpt_app.langchain_wrapper import ConversationContext, GenerationAborted, GenerationBudget, TokenCostProcess
+from chatgpt_app.langchain_wrapper.token_cost_process import context_window
+from chatgpt_app.logger import get_logger
 from chatgpt_app.pages.chatgpt.base_chatgpt import BaseChatGPTPage
-from langchain.schema import AIMessage, BaseMessage, HumanMessage
+from chatgpt_app.settings import CHAT_COMPLETION_TOKENS, CHAT_CONTEXT_MAX_TOKENS
+from chatgpt_app.tracing import tracer
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, get_buffer_string
+
+logger = get_logger(__name__)
 
 
 class ChatBotPage(BaseChatGPTPage):
-    def message_history(self, messages: List[BaseMessage], costs: List[float]) -> None:
-        for message in messages:
-            if isinstance(message, AIMessage):
-                with st.chat_message("assistant"):
-                    st.markdown(message.content)
-                    # コスト表示
-                    st.markdown(f"cost: ${costs.pop(0):.5f}")
-            elif isinstance(message, HumanMessage):
-                with st.chat_message("user"):
-                    st.markdown(message.content)
+    def message_history(self) -> None:
+        """Render only the latest messages; older ones are loaded on demand."""
+        num_messages = self.sm.count_messages()
+        start = max(num_messages - self.sm.get_history_window(), 0)
+        if start > 0 and st.button(f"Load older messages ({start} hidden)"):
+            self.sm.extend_history_window()
+            start = max(num_messages - self.sm.get_history_window(), 0)
+
+        for record in self.sm.get_records(start):
+            if isinstance(record.message, AIMessage):
+                st.chat_message("assistant").markdown(record.markdown)
+            elif isinstance(record.message, HumanMessage):
+                st.chat_message("user").markdown(record.markdown)
             else:  # isinstance(message, SystemMessage):
-                st.write(f"System message: {message.content}")
+                st.write(record.markdown)
+
+    def context_token_budget(self, model_name: str) -> int:
+        return min(context_window(model_name) - CHAT_COMPLETION_TOKENS, CHAT_CONTEXT_MAX_TOKENS)
+
+    def build_context(
+        self, llm: ChatOpenAI, budget: Optional[GenerationBudget] = None
+    ) -> Tuple[List[BaseMessage], float]:
+        """Return the messages to send for this turn and the cost of updating the running summary.
+
+        The summary call counts against ``budget`` like the answer. If the budget stops it, the evicted
+        messages are left out of this turn and folded on the next one.
+        """
+        token_budget = self.context_token_budget(llm.model_name)
+        context = self.sm.get_chat_context()
+        if context is None:
+            context = ConversationContext(llm.model_name, token_budget)
+            self.sm.register_chat_context(context)
+        context.rebudget(llm.model_name, token_budget)
+        context.extend(self.sm.get_messages(context.num_messages))
+
+        # 予算からあふれた古い発言は要約に畳み込む
+        token_cost_process = TokenCostProcess(llm.model_name, page=self.page_id.name)
+        if context.has_evicted:
+            with st.spinner("Summarizing earlier conversation ..."), tracer.span("summarize_history"):
+
+                def summarize(summary: str, messages: List[BaseMessage]) -> str:
+                    prompt = self.prompts_loader.chat_summary(summary, get_buffer_string(messages))
+                    return self.complete(llm, [HumanMessage(content=prompt)], token_cost_process, budget)
+
+                try:
+                    context.fold(summarize)
+                except GenerationAborted as e:
+                    logger.info(f"skipped summarizing the history: {e.reason}")
+        return context.build_messages(), token_cost_process.total_cost
 
     def render(self) -> None:
         llm = self.base_components()
@@ -27,9 +71,7 @@ class ChatBotPage(BaseChatGPTPage):
         container = st.container()
 
         # チャット履歴の表示
-        costs = deepcopy(self.sm.get_costs())
-        messages = self.sm.get_messages()
-        self.message_history(messages, costs)
+        self.message_history()
 
         # ユーザーの入力を監視
         with container:
@@ -43,12 +85,20 @@ class ChatBotPage(BaseChatGPTPage):
             self.sm.add_message(HumanMessage(content=user_input))
             # streaming表示
             st.chat_message("user").markdown(user_input)
-            with st.chat_message("assistant"):
-                answer, cost = self.get_streaming_answer(llm, messages)
+            with st.chat_message("assistant"), tracer.span("chat", model=llm.model_name), self.generation(
+                llm
+            ) as budget:
+                context_messages, summary_cost = self.build_context(llm, budget)
+
+                def record(answer: str, cost: float) -> None:
+                    # Stop で止めたときも途中までの回答を残す
+                    self.sm.add_message(AIMessage(content=answer), cost + summary_cost)
+                    self.sm.add_cost(cost + summary_cost)
+
+                _, cost = self.get_streaming_answer(llm, context_messages, record, budget)
                 # コスト表示
-                st.markdown(f"cost: ${cost:.5f}")
-                self.sm.add_message(AIMessage(content=answer))
-                self.sm.add_cost(cost)
+                st.markdown(f"cost: ${cost + summary_cost:.5f}")
 
         # 合計コストの再取得、表示
         self.total_cost_component()
+        self.trace_component()
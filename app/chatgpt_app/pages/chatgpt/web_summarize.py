@@ -1,18 +1,29 @@
-from typing import Optional
+from dataclasses import replace
+from typing import List, Tuple, Union
 from urllib.parse import urlparse
 
-import requests
 import streamlit as st
-from bs4 import BeautifulSoup
 from chatgpt_app.const import SessionKey
+from chatgpt_app.jobs import Job, JobStatus, get_job_executor
 from chatgpt_app.logger import get_logger
-from chatgpt_app.pages.chatgpt.base_chatgpt import BaseChatGPTPage
+from chatgpt_app.pages.chatgpt.base_chatgpt import BaseChatGPTPage, SummaryResult, summary_cache
 from chatgpt_app.session import StreamlistSessionManager
-from langchain.schema import HumanMessage
-from streamlit_extras.stoggle import stoggle
+from chatgpt_app.settings import (
+    WEB_BATCH_FETCH_CONCURRENCY,
+    WEB_BATCH_MAX_PER_HOST,
+    WEB_BATCH_MAX_URLS,
+    WEB_BATCH_SUMMARIZE_CONCURRENCY,
+)
+from chatgpt_app.summarize import WebSummarizer
+from chatgpt_app.tracing import tracer
+from chatgpt_app.web import BatchItem, expand_sitemap, get_http_fetcher, is_sitemap_url, run_batch
+from langchain.chat_models import ChatOpenAI
 
 logger = get_logger(__name__)
 
+SINGLE_MODE = "Single URL"
+BATCH_MODE = "Batch (URL list / sitemap)"
+
 
 class WebSummarizePage(BaseChatGPTPage):
     def init_messages(self, sm: StreamlistSessionManager) -> None:
@@ -30,49 +41,218 @@ class WebSummarizePage(BaseChatGPTPage):
         except ValueError:
             return False
 
-    def get_content(self, url: str) -> Optional[str]:
-        try:
-            with st.spinner("Fetching Content ..."):
-                response = requests.get(url)
-                soup = BeautifulSoup(response.text, "html.parser")
-                # fetch text from main (change the below code to filter page)
-                if soup.main:
-                    return soup.main.get_text()
-                elif soup.article:
-                    return soup.article.get_text()
-                else:
-                    return soup.body.get_text()
-        except Exception:
-            st.write("something wrong")
-            return None
+    def summarizer(self, llm: ChatOpenAI) -> WebSummarizer:
+        return WebSummarizer(llm, self.prompts_loader)
+
+    def summarize_url(self, job: Job, summarizer: WebSummarizer, url: str, summarize_length: int) -> SummaryResult:
+        """Background job: fetch and summarize ``url``, reporting progress and the streamed answer to ``job``.
+
+        The summary is shared through ``summary_cache`` with batch mode and other sessions; a cached one costs 0.
+        """
+
+        def compute() -> SummaryResult:
+            job.update(message="Fetching content ...")
+            content = summarizer.fetch_content(url)
+            if not content:
+                raise ValueError("no content to summarize")
+            job.update(message="Summarizing ...")
+
+            def on_result(index: int, text: str) -> None:
+                job.add_detail(text)
+                job.update(message=f"Summarized {len(job.details)} parts ...")
+
+            budget = self.new_budget(summarizer.llm.model_name, job.cancel_event)
+            return summarizer.summarize_content(
+                url, content, summarize_length, on_result=on_result, on_token=job.append_answer, budget=budget
+            )
+
+        result, computed = self.cached_summary(self.summary_key(url, summarizer.llm, summarize_length), compute)
+        return result if computed else replace(result, cost=0.0)
+
+    # -----------------------
+    # batch mode
+    # -----------------------
+    def get_url_list_input(self) -> str:
+        return st.text_area(
+            f"URLs (one per line, up to {WEB_BATCH_MAX_URLS}) or a sitemap URL:",
+            key=SessionKey.URL_LIST_INPUT.name,
+            height=200,
+        )
+
+    def parse_url_list(self, text: str) -> List[str]:
+        urls: List[str] = []
+        for line in text.splitlines():
+            url = line.strip()
+            if not url:
+                continue
+            if not self.validate_url(url):
+                st.warning(f"Skipping invalid URL: {url}")
+            elif is_sitemap_url(url):
+                try:
+                    urls.extend(expand_sitemap(get_http_fetcher(), url, WEB_BATCH_MAX_URLS))
+                except Exception as e:
+                    st.warning(f"Failed to read the sitemap {url}: {e}")
+            else:
+                urls.append(url)
+        # 重複を除き、上限で打ち切る
+        urls = list(dict.fromkeys(urls))
+        if len(urls) > WEB_BATCH_MAX_URLS:
+            st.warning(f"Only the first {WEB_BATCH_MAX_URLS} of {len(urls)} URLs are summarized.")
+        return urls[:WEB_BATCH_MAX_URLS]
+
+    def summarize_batch(
+        self, job: Job, summarizer: WebSummarizer, urls: List[str], summarize_length: int
+    ) -> List[BatchItem]:
+        """Background job: fetch and summarize ``urls`` concurrently, adding every item to ``job`` when it is ready."""
+        llm = summarizer.llm
+        # 上限は一括要約全体にかける
+        budget = self.new_budget(llm.model_name, job.cancel_event)
+
+        def fetch(url: str) -> Union[str, SummaryResult]:
+            # 要約済みなら取得もしない
+            cached = summary_cache.get(self.summary_key(url, llm, summarize_length))
+            if cached is not None:
+                return cached
+            # 止めたあとはまだ始まっていない URL を取得しない
+            budget.check()
+            return summarizer.fetch_content(url)
+
+        def summarize(url: str, fetched: Union[str, SummaryResult]) -> Tuple[SummaryResult, bool]:
+            if isinstance(fetched, SummaryResult):
+                return fetched, False
+            if not fetched:
+                raise ValueError("no content to summarize")
+            return self.cached_summary(
+                self.summary_key(url, llm, summarize_length),
+                lambda: summarizer.summarize_content(url, fetched, summarize_length, budget=budget),
+            )
+
+        job.update(progress=0.0, message=f"Summarizing {len(urls)} pages ...")
+        items: List[BatchItem] = []
+        with tracer.span("web_batch", urls=len(urls), model=llm.model_name):
+            for item in run_batch(
+                urls,
+                fetch,
+                summarize,
+                fetch_concurrency=WEB_BATCH_FETCH_CONCURRENCY,
+                max_per_host=WEB_BATCH_MAX_PER_HOST,
+                process_concurrency=WEB_BATCH_SUMMARIZE_CONCURRENCY,
+            ):
+                items.append(item)
+                job.add_detail(item)
+                job.update(progress=len(items) / len(urls), message=f"{len(items)} / {len(urls)} pages done")
+        return items
+
+    def batch_item_component(self, item: BatchItem) -> None:
+        if item.result is None:
+            with st.expander(f"❌ {item.url}", expanded=False):
+                st.error(item.error)
+            return
+        result, computed = item.result
+        label = f"${result.cost:.5f}" if computed else "cached"
+        if result.stopped:
+            with st.expander(f"⏹️ {item.url} ({label}, stopped)", expanded=False):
+                st.markdown(result.answer)
+                st.warning(f"Stopped: {result.stopped}")
+            return
+        with st.expander(f"✅ {item.url} ({label})", expanded=False):
+            st.markdown(result.answer)
+
+    def batch_summary_component(self, items: List[BatchItem]) -> None:
+        """Per-URL cost breakdown in input order."""
+        rows = []
+        for item in sorted(items, key=lambda item: item.index):
+            result, computed = item.result if item.result is not None else (None, False)
+            rows.append(
+                {
+                    "URL": item.url,
+                    "Status": "error"
+                    if result is None
+                    else ("stopped" if result.stopped else ("done" if computed else "cached")),
+                    "Cost (USD)": result.cost if result is not None and computed else 0.0,
+                    "Seconds": round(item.seconds, 2),
+                }
+            )
+        st.markdown(f"**Batch cost: ${sum(row['Cost (USD)'] for row in rows):.5f}**")
+        st.dataframe(rows, use_container_width=True)
+
+    def render_batch(self, llm: ChatOpenAI, summarize_length: int) -> None:
+        text = self.get_url_list_input()
+        if st.button("Summarize all"):
+            urls = self.parse_url_list(text)
+            if not urls:
+                st.write("Please input valid urls")
+                return
+            summarizer = self.summarizer(llm)
+            key = (self.page_id, tuple(urls), llm.model_name, llm.temperature, summarize_length, *self.budget_key())
+            job = get_job_executor().submit(
+                key,
+                f"Summarize {len(urls)} pages",
+                lambda job: self.summarize_batch(job, summarizer, urls, summarize_length),
+                owner=self.sm.get_conversation_id(),
+            )
+            self.sm.register_batch_job(key)
+        else:
+            # rerun やページの切り替えのあとは、前回のジョブ (実行中でもよい) を描き直す
+            key = self.sm.get_batch_job()
+            job = get_job_executor().get(key) if key is not None else None
+        if job is None:
+            return
+
+        st.markdown("## Summaries")
+        self.job_component(job, render_detail=self.batch_item_component)
+        if job.status in (JobStatus.DONE, JobStatus.STOPPED) and job.result is not None:
+            items: List[BatchItem] = job.result
+            if job.claim(self.sm.get_conversation_id()):
+                self.sm.add_cost(
+                    sum(item.result[0].cost for item in items if item.result is not None and item.result[1])
+                )
+            self.batch_summary_component(items)
+            if job.status is JobStatus.STOPPED:
+                st.warning("Stopped: the remaining pages were not summarized.")
+                self.run_again_component(job.key)
 
     def render(self) -> None:
         llm = self.base_components()
 
-        url_container = st.container()
-        response_container = st.container()
         summarize_length = self.sidebar.slider("Summarize Length:", min_value=50, max_value=1000, value=300, step=1)
+        mode = self.sidebar.radio("Mode:", (SINGLE_MODE, BATCH_MODE))
+        if mode == BATCH_MODE:
+            self.render_batch(llm, summarize_length)
+            self.jobs_component()
+            self.total_cost_component()
+            self.trace_component()
+            return
 
-        content = None
-        with url_container:
-            url = self.get_url_input()
-            is_valid_url = self.validate_url(url)
-            if not is_valid_url:
-                st.write("Please input valid url")
-            else:
-                content = self.get_content(url)
-                if content:
-                    prompt = self.prompts_loader.web_summarize(content, summarize_length)
-                    self.sm.add_message(HumanMessage(content=prompt))
-
-        if content:
-            with response_container:
-                st.markdown("## Summary")
-                answer, cost = self.get_streaming_answer(llm, self.sm.get_messages())
-                self.sm.add_cost(cost)
+        url = self.get_url_input()
+        if not self.validate_url(url):
+            st.write("Please input valid url")
+        else:
+            st.markdown("## Summary")
+            # 要約はバックグラウンドのジョブで実行し、入力が同じなら実行中・完了済みのジョブにつなぎ直す
+            summarizer = self.summarizer(llm)
+            job = get_job_executor().submit(
+                (self.page_id, url, llm.model_name, llm.temperature, summarize_length, *self.budget_key()),
+                f"Summarize {url}",
+                lambda job: self.summarize_url(job, summarizer, url, summarize_length),
+                owner=self.sm.get_conversation_id(),
+            )
+            self.job_component(job)
+            if job.status in (JobStatus.DONE, JobStatus.STOPPED) and job.result is not None:
+                result: SummaryResult = job.result
+                if job.claim(self.sm.get_conversation_id()):
+                    self.sm.add_cost(result.cost)
+                st.markdown(result.answer)
+                if result.stopped:
+                    self.stopped_component(job.key, result.stopped)
                 st.markdown("---")
                 st.markdown("## Original Text")
-                stoggle("Original Text", content)
+                from streamlit_extras.stoggle import stoggle  # 原文を表示するときだけ読み込む
+
+                stoggle("Original Text", result.source)
+                self.followup_component(llm, summarizer, url, result.source)
 
+        self.jobs_component()
         # 合計コストの再取得、表示
         self.total_cost_component()
+        self.trace_component()
@@ -1,18 +1,15 @@
-from typing import List, Tuple
+from dataclasses import replace
+from typing import Optional, Tuple
 
 import streamlit as st
 from chatgpt_app.const import SessionKey
-from chatgpt_app.langchain_wrapper import StreamlitCostCalcHandler, TokenCostProcess
+from chatgpt_app.jobs import Job, JobStatus, get_job_executor
 from chatgpt_app.logger import get_logger
-from chatgpt_app.pages.chatgpt.base_chatgpt import BaseChatGPTPage
+from chatgpt_app.pages.chatgpt.base_chatgpt import BaseChatGPTPage, SummaryResult
 from chatgpt_app.session import StreamlistSessionManager
-from langchain.chains.summarize import load_summarize_chain
+from chatgpt_app.summarize import YouTubeSummarizer, is_youtube_url
 from langchain.chat_models import ChatOpenAI
-from langchain.docstore.document import Document
-from langchain.document_loaders import YoutubeLoader
-from langchain.prompts import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from streamlit_extras.stoggle import stoggle
+from streamlit.delta_generator import DeltaGenerator
 
 logger = get_logger(__name__)
 
@@ -32,59 +29,82 @@ class YouTubeSummarizePage(BaseChatGPTPage):
         return url
 
     def validate_url(self, url: str) -> bool:
-        return "https://www.youtube.com/watch?" in url
+        return is_youtube_url(url)
 
-    def get_document(self, url: str) -> List[Document]:
-        with st.spinner("Fetching Content ..."):
-            loader = YoutubeLoader.from_youtube_url(url, add_video_info=True, language=["en", "ja"])
-            text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                model_name=self.sm.get_model_name(), chunk_size=self.sm.get_max_token(), chunk_overlap=0
+    def summarizer(self, llm: ChatOpenAI) -> YouTubeSummarizer:
+        return YouTubeSummarizer(llm, self.prompts_loader, chunk_size=self.sm.get_max_token())
+
+    def summarize_url(self, job: Job, summarizer: YouTubeSummarizer, url: str) -> SummaryResult:
+        """Background job: fetch and summarize the transcript, reporting each part's summary to ``job``.
+
+        The summary is shared through ``summary_cache`` with other sessions; a cached one costs 0.
+        """
+
+        def compute() -> SummaryResult:
+            job.update(message="Fetching transcript ...")
+            documents = summarizer.get_documents(url)
+            if not documents:
+                raise ValueError("no transcript to summarize")
+            job.update(progress=0.0, message=f"Summarizing {len(documents)} parts ...")
+
+            def on_result(index: int, text: str) -> None:
+                job.add_detail((index, text))
+                finished = len(job.details)
+                job.update(progress=finished / len(documents), message=f"Summarized {finished}/{len(documents)} parts")
+
+            budget = self.new_budget(summarizer.llm.model_name, job.cancel_event)
+            return summarizer.summarize_documents(
+                url, documents, on_result=on_result, on_token=job.append_answer, budget=budget
             )
-            return loader.load_and_split(text_splitter=text_splitter)
-
-    def summarize(self, llm: ChatOpenAI, docs: List[Document]) -> Tuple[str, float]:
-        prompt_template = self.prompts_loader.youtube_summarize_template()
-        PROMPT = PromptTemplate(template=prompt_template, input_variables=["text"])
-
-        chain = load_summarize_chain(
-            llm, chain_type="map_reduce", verbose=True, map_prompt=PROMPT, combine_prompt=PROMPT
-        )
-        token_cost_process = TokenCostProcess(llm.model_name)
-        st_callback = StreamlitCostCalcHandler(st.container(), token_cost_process)
-        response = chain(
-            {"input_documents": docs, "token_max": self.sm.get_max_token()},
-            return_only_outputs=True,
-            callbacks=[st_callback],
-        )
-
-        answer = response["output_text"]
-        cost = token_cost_process.total_cost
-        return answer, cost
+
+        result, computed = self.cached_summary(self.summary_key(url, summarizer.llm, summarizer.chunk_size), compute)
+        return result if computed else replace(result, cost=0.0)
 
     def render(self) -> None:
         llm = self.base_components()
 
-        url_container = st.container()
-        response_container = st.container()
-
-        document = None
-        with url_container:
-            url = self.get_url_input()
-            is_valid_url = self.validate_url(url)
-            if not is_valid_url:
-                st.write("Please input valid url")
-            else:
-                st.video(url)
-                document = self.get_document(url)
-
-        if document:
-            with response_container:
-                st.markdown("## Summary")
-                answer, cost = self.summarize(llm, document)
-                self.sm.add_cost(cost)
+        url = self.get_url_input()
+        is_valid_url = self.validate_url(url)
+        if not is_valid_url:
+            st.write("Please input valid url")
+        else:
+            st.video(url)
+
+        if is_valid_url:
+            st.markdown("## Summary")
+            # 要約はバックグラウンドのジョブで実行し、入力が同じなら実行中・完了済みのジョブにつなぎ直す
+            summarizer = self.summarizer(llm)
+            job = get_job_executor().submit(
+                (self.page_id, url, llm.model_name, llm.temperature, summarizer.chunk_size, *self.budget_key()),
+                f"Summarize {url}",
+                lambda job: self.summarize_url(job, summarizer, url),
+                owner=self.sm.get_conversation_id(),
+            )
+            partial_results: Optional[DeltaGenerator] = None
+
+            def render_part(detail: Tuple[int, str]) -> None:
+                nonlocal partial_results
+                if partial_results is None:
+                    partial_results = st.expander("Partial summaries", expanded=False)
+                index, text = detail
+                partial_results.markdown(f"**Part {index + 1}**: {text}")
+
+            self.job_component(job, render_detail=render_part)
+            if job.status in (JobStatus.DONE, JobStatus.STOPPED) and job.result is not None:
+                result: SummaryResult = job.result
+                if job.claim(self.sm.get_conversation_id()):
+                    self.sm.add_cost(result.cost)
+                st.markdown(result.answer)
+                if result.stopped:
+                    self.stopped_component(job.key, result.stopped)
                 st.markdown("---")
                 st.markdown("## Original Text")
-                stoggle("Original Text", document)
+                from streamlit_extras.stoggle import stoggle  # 原文を表示するときだけ読み込む
+
+                stoggle("Original Text", result.source)
+                self.followup_component(llm, summarizer, url, result.source)
 
+        self.jobs_component()
         # 合計コストの再取得、表示
         self.total_cost_component()
+        self.trace_component()
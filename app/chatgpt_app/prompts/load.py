@@ -4,11 +4,66 @@ class PromptsLoader:
 
 ========
 
-{content[:1000]}
+{content}
 
 ========
 
 日本語で書いください。
+"""
+        return prompt
+
+    def web_summarize_map(self, content: str) -> str:
+        prompt = f"""以下はとあるWebページのコンテンツの一部です。重要な情報を落とさないように簡潔に要約してください。
+
+========
+
+{content}
+
+========
+
+日本語で書いください。
+"""
+        return prompt
+
+    def web_summarize_reduce(self, summaries: str, n_chars: int = 300) -> str:
+        prompt = f"""以下はとあるWebページを分割してそれぞれ要約したものです。ページ全体の内容を{n_chars}字程度でわかりやすく要約してください。
+
+========
+
+{summaries}
+
+========
+
+日本語で書いください。
+"""
+        return prompt
+
+    def chat_summary(self, summary: str, conversation: str) -> str:
+        prompt = f"""Progressively summarize the lines of conversation provided, adding onto the previous summary.
+Keep every fact, name and decision that later turns may refer to, and keep the summary under 300 words.
+Write the summary in the language of the conversation.
+
+Previous summary:
+{summary or "(none)"}
+
+New lines of conversation:
+{conversation}
+
+New summary:
+"""
+        return prompt
+
+    def followup_question(self, passages: str, question: str) -> str:
+        prompt = f"""以下はとあるWebページ (または動画の文字起こし) から質問に関係しそうな部分を抜き出したものです。
+この内容だけをもとに質問に答えてください。書かれていないことは「ページには書かれていません」と答えてください。
+
+========
+
+{passages}
+
+========
+
+質問: {question}
 """
         return prompt
 
@@ -0,0 +1,124 @@
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import openai
+import requests
+from chatgpt_app.langchain_wrapper.rate_limit_scheduler import ScheduledChatCompletion, get_rate_limit_scheduler
+from chatgpt_app.logger import get_logger
+from chatgpt_app.settings import LLM_CLIENT_POOL_MAX_SIZE, OPENAI_API_BASE, OPENAI_HTTP_POOL_MAXSIZE
+from langchain.chat_models import ChatOpenAI
+from openai.api_requestor import MAX_CONNECTION_RETRIES, _requests_proxies_arg
+from requests.adapters import HTTPAdapter
+
+logger = get_logger(__name__)
+
+# (モデル名, temperature, ストリーミングか, 接続先)
+ClientKey = Tuple[str, float, bool, Optional[str]]
+
+
+class _SharedSession(requests.Session):
+    """Session handed to openai for every thread.
+
+    openai closes its per-thread session every few minutes; closing is a no-op here so that
+    the connections stay pooled until the resource pool itself shuts down.
+    """
+
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        super().close()
+
+
+class ResourcePool:
+    """Process-wide clients borrowed by every Streamlit session.
+
+    - ``ChatOpenAI`` clients keyed by their configuration (LRU, at most ``max_clients``). The clients hold
+      no per-request state (callbacks are passed per call), so sessions can share them. Their requests go
+      through the rate-limit scheduler.
+    - one HTTP connection pool used by every synchronous OpenAI request, so keep-alive connections (and
+      their TLS sessions) are reused across reruns, threads and users.
+
+    Tokenizers are shared through ``tokenizer_registry`` and web pages through ``get_http_fetcher()``.
+    """
+
+    def __init__(
+        self, max_clients: int = LLM_CLIENT_POOL_MAX_SIZE, http_pool_maxsize: int = OPENAI_HTTP_POOL_MAXSIZE
+    ) -> None:
+        self.max_clients = max_clients
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[ClientKey, ChatOpenAI]" = OrderedDict()
+        self._closed = False
+
+        self.http_session = _SharedSession()
+        # openai が自分で作るセッションと同じく、接続エラーの再試行と openai.proxy を設定する
+        proxies = _requests_proxies_arg(openai.proxy)
+        if proxies:
+            self.http_session.proxies = proxies
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=http_pool_maxsize, max_retries=MAX_CONNECTION_RETRIES)
+        self.http_session.mount("https://", adapter)
+        self.http_session.mount("http://", adapter)
+        # openai は requestssession が設定されていればスレッドごとのセッションを作らずにこれを使う
+        openai.requestssession = self.http_session
+
+    def chat_model(
+        self, model_name: str, temperature: float, streaming: bool = True, api_base: Optional[str] = OPENAI_API_BASE
+    ) -> ChatOpenAI:
+        key: ClientKey = (model_name, round(temperature, 2), streaming, api_base)
+        with self._lock:
+            llm = self._clients.get(key)
+            if llm is not None:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return llm
+            self.misses += 1
+
+        llm = ChatOpenAI(  # type: ignore
+            model_name=model_name,
+            temperature=key[1],
+            streaming=streaming,
+            openai_api_base=api_base,
+            # 再試行はスケジューラー側でまとめて行う
+            max_retries=1,
+        )
+        llm.client = ScheduledChatCompletion(get_rate_limit_scheduler(), llm.client)
+        with self._lock:
+            # 同時に作られた場合は先に登録された方を使う
+            llm = self._clients.setdefault(key, llm)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        return llm
+
+    @property
+    def num_clients(self) -> int:
+        return len(self._clients)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._clients.clear()
+        if openai.requestssession is self.http_session:
+            openai.requestssession = None
+        self.http_session.shutdown()
+        logger.info("resource pool closed")
+
+
+_resource_pool: Optional[ResourcePool] = None
+_resource_pool_lock = threading.Lock()
+
+
+def get_resource_pool() -> ResourcePool:
+    """Return the process-wide resource pool; it is closed when the process exits."""
+    global _resource_pool
+    with _resource_pool_lock:
+        if _resource_pool is None:
+            _resource_pool = ResourcePool()
+            atexit.register(_resource_pool.close)
+        return _resource_pool
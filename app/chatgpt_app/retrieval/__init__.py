@@ -0,0 +1,13 @@
+from chatgpt_app.retrieval.embedders import EMBEDDERS, Embedder, HashingEmbedder, OpenAIEmbedder, get_embedder
+from chatgpt_app.retrieval.vector_index import SearchHit, VectorIndex, get_vector_index
+
+__all__ = [
+    EMBEDDERS,
+    Embedder,
+    HashingEmbedder,
+    OpenAIEmbedder,
+    SearchHit,
+    VectorIndex,
+    get_embedder,
+    get_vector_index,
+]
@@ -0,0 +1,84 @@
+import abc
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Type
+
+import numpy as np
+from chatgpt_app.settings import VECTOR_INDEX_HASHING_DIM
+
+# 英数字は単語ごと、それ以外 (日本語など空白で区切らない文字) は文字の並びごとに拾う
+_WORD_RE = re.compile(r"[0-9a-z]+|[^\W\d_a-z]+")
+
+
+class Embedder(abc.ABC):
+    """Turns texts into ``dim``-dimensional float32 vectors with unit length."""
+
+    name: str
+    dim: int
+    # 索引したチャンク集合の IDF で重み付けし直してから比べるか (語の出現をそのまま表す疎なベクトル向け)
+    idf_weighting = False
+
+    @abc.abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return one row per text, in the order of ``texts``."""
+
+
+class HashingEmbedder(Embedder):
+    """Offline term-frequency vectors: words (and character bigrams of CJK text) hashed into ``dim`` buckets.
+
+    Term frequencies are dampened with ``1 + log(tf)``; the index applies IDF over the chunks of the
+    page at search time, so together they score like TF-IDF without a fitted vocabulary.
+    """
+
+    name = "hashing"
+    idf_weighting = True
+
+    def __init__(self, dim: int = VECTOR_INDEX_HASHING_DIM) -> None:
+        self.dim = dim
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        tokens = []
+        for word in _WORD_RE.findall(text.lower()):
+            if word.isascii() or len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+        return tokens
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token, count in Counter(self.tokenize(text)).items():
+                # hash() はプロセスごとに変わるので、保存したベクトルと比べられる crc32 を使う
+                h = zlib.crc32(token.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[row, h % self.dim] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class OpenAIEmbedder(Embedder):
+    """``text-embedding-ada-002`` through langchain's ``OpenAIEmbeddings`` (needs network access)."""
+
+    name = "openai"
+    dim = 1536
+
+    def __init__(self) -> None:
+        from langchain.embeddings import OpenAIEmbeddings
+
+        self._embeddings = OpenAIEmbeddings()  # type: ignore
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self._embeddings.embed_documents(texts), dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+EMBEDDERS: Dict[str, Type[Embedder]] = {embedder.name: embedder for embedder in (HashingEmbedder, OpenAIEmbedder)}
+
+
+def get_embedder(name: str) -> Embedder:
+    return EMBEDDERS[name]()
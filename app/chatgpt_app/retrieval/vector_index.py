@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+from chatgpt_app.logger import get_logger
+from chatgpt_app.retrieval.embedders import Embedder, get_embedder
+from chatgpt_app.settings import VECTOR_INDEX_DIR, VECTOR_INDEX_EMBEDDER, VECTOR_INDEX_MAX_URLS
+
+logger = get_logger(__name__)
+
+_VECTORS_FILE = "vectors.f32"
+_META_FILE = "meta.json"
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    # チャンクの位置 (0 始まり)
+    position: int
+    text: str
+    score: float
+
+
+class _Entry:
+    """Vectors of one URL memory-mapped read-only, plus what searching them needs."""
+
+    def __init__(self, directory: Path, meta: dict, embedder: Embedder) -> None:
+        self.fingerprint: str = meta["fingerprint"]
+        self.texts: List[str] = meta["texts"]
+        shape = (len(self.texts), embedder.dim)
+        self.vectors = np.memmap(directory / _VECTORS_FILE, dtype=np.float32, mode="r", shape=shape)
+        self.idf: Optional[np.ndarray] = None
+        self.norms: Optional[np.ndarray] = None
+        if embedder.idf_weighting:
+            # このページのチャンクを文書集合とした IDF と、重み付け後の各行の長さ
+            document_frequency = np.count_nonzero(self.vectors, axis=0)
+            self.idf = (np.log((1 + len(self.texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+            self.norms = np.maximum(np.linalg.norm(self.vectors * self.idf, axis=1), 1e-12)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        if self.idf is None:
+            return self.vectors @ query
+        weighted = query * self.idf
+        # cos(d * idf, q * idf) = d · (q * idf^2) / (|d * idf| |q * idf|)
+        return (self.vectors @ (weighted * self.idf)) / (self.norms * max(float(np.linalg.norm(weighted)), 1e-12))
+
+
+class VectorIndex:
+    """Chunks of fetched pages and transcripts with their embeddings, keyed by URL.
+
+    Each URL gets a directory under ``root/<embedder>-<dim>/`` holding the raw float32 matrix and a JSON
+    file with the chunk texts. Searches memory-map the matrix, so only the pages being asked about are
+    paged in; at most ``max_open`` of them stay mapped and at most ``max_urls`` are kept on disk.
+    """
+
+    def __init__(
+        self, root: Path, embedder: Embedder, max_urls: int = VECTOR_INDEX_MAX_URLS, max_open: int = 32
+    ) -> None:
+        self.embedder = embedder
+        self.root = root / f"{embedder.name}-{embedder.dim}"
+        self.max_urls = max_urls
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(texts: List[str]) -> str:
+        return hashlib.sha1("\0".join(texts).encode("utf-8")).hexdigest()
+
+    def _directory(self, url: str) -> Path:
+        return self.root / hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _load(self, url: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._open.get(url)
+            if entry is not None:
+                self._open.move_to_end(url)
+                return entry
+        directory = self._directory(url)
+        try:
+            meta = json.loads((directory / _META_FILE).read_text(encoding="utf-8"))
+            expected_bytes = len(meta["texts"]) * self.embedder.dim * 4
+            if not meta["texts"] or (directory / _VECTORS_FILE).stat().st_size != expected_bytes:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        entry = _Entry(directory, meta, self.embedder)
+        with self._lock:
+            self._open[url] = entry
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return entry
+
+    def add(self, url: str, texts: List[str], fingerprint: Optional[str] = None) -> None:
+        """Embed ``texts`` and store them as the chunks of ``url``, replacing what was there.
+
+        ``fingerprint`` identifies the source the chunks were made from (default: the chunks themselves).
+        """
+        if not texts:
+            raise ValueError("nothing to index")
+        vectors = self.embedder.embed(texts).astype(np.float32, copy=False)
+        directory = self._directory(url)
+        directory.mkdir(parents=True, exist_ok=True)
+        fingerprint = fingerprint or self.fingerprint(texts)
+        meta = {"url": url, "fingerprint": fingerprint, "texts": texts, "created_at": time.time()}
+        # 書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える (行列が先、メタデータが後)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        vectors.tofile(directory / (_VECTORS_FILE + suffix))
+        (directory / (_META_FILE + suffix)).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(directory / (_VECTORS_FILE + suffix), directory / _VECTORS_FILE)
+        os.replace(directory / (_META_FILE + suffix), directory / _META_FILE)
+        with self._lock:
+            self._open.pop(url, None)
+        logger.info(f"indexed {len(texts)} chunks of {url}")
+        self._prune()
+
+    def ensure(self, url: str, fingerprint: str, build: Callable[[], List[str]]) -> bool:
+        """Index ``build()`` unless ``url`` was indexed from the same ``fingerprint``; returns whether it indexed."""
+        entry = self._load(url)
+        if entry is not None and entry.fingerprint == fingerprint:
+            return False
+        self.add(url, build(), fingerprint)
+        return True
+
+    def search(self, url: str, query: str, k: int) -> List[SearchHit]:
+        """Return the ``k`` chunks of ``url`` most similar to ``query``, best first."""
+        entry = self._load(url)
+        if entry is None:
+            return []
+        scores = entry.scores(self.embedder.embed([query])[0])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [SearchHit(int(i), entry.texts[i], float(scores[i])) for i in top]
+
+    def remove(self, url: str) -> None:
+        with self._lock:
+            self._open.pop(url, None)
+        shutil.rmtree(self._directory(url), ignore_errors=True)
+
+    def _prune(self) -> None:
+        directories = [path for path in self.root.iterdir() if (path / _META_FILE).exists()]
+        if len(directories) <= self.max_urls:
+            return
+        # 古く索引したものから消す
+        directories.sort(key=lambda path: (path / _META_FILE).stat().st_mtime)
+        for directory in directories[: len(directories) - self.max_urls]:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+_vector_index: Optional[VectorIndex] = None
+_vector_index_lock = threading.Lock()
+
+
+def get_vector_index() -> VectorIndex:
+    """Return the process-wide vector index using the ``VECTOR_INDEX_EMBEDDER`` embedder."""
+    global _vector_index
+    with _vector_index_lock:
+        if _vector_index is None:
+            _vector_index = VectorIndex(VECTOR_INDEX_DIR, get_embedder(VECTOR_INDEX_EMBEDDER))
+        return _vector_index
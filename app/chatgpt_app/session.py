@@ -1,45 +1,99 @@
-from typing import List
+import uuid
+from typing import TYPE_CHECKING, Dict, Hashable, List, Optional, Tuple
 
 import streamlit as st
 from chatgpt_app.const import SessionKey
 from chatgpt_app.logger import get_logger
-from langchain.schema import BaseMessage
+from chatgpt_app.settings import CHAT_HISTORY_PAGE_SIZE, SESSION_FOLLOWUP_URLS, SESSION_RECENT_MESSAGES
+from chatgpt_app.storage import ChatRecord, get_conversation_store
+
+if TYPE_CHECKING:
+    from chatgpt_app.langchain_wrapper.conversation_context import ConversationContext
+    from chatgpt_app.langchain_wrapper.generation_budget import GenerationBudget
+    from langchain.schema import BaseMessage
 
 logger = get_logger()
 
 
 class StreamlistSessionManager:
-    def __init__(self) -> None:
+    def __init__(self, conversation_id: Optional[str] = None) -> None:
         self._session_state = st.session_state
-        self._session_state[SessionKey.MESSAGES.name] = []
-        self._session_state[SessionKey.COSTS.name] = []
+        self._store = get_conversation_store()
+        self._session_state[SessionKey.COSTS.name] = 0.0
         self._session_state[SessionKey.MODEL_NAME] = ""
         self._session_state[SessionKey.URL_INPUT.name] = ""
+        self._session_state[SessionKey.URL_LIST_INPUT.name] = ""
+        self._session_state[SessionKey.FOLLOWUPS.name] = {}
+        self._session_state[SessionKey.BATCH_JOB.name] = None
+        self._session_state[SessionKey.GENERATION.name] = None
         self._session_state[SessionKey.MAX_TOKEN.name] = 0
+        self.start_conversation(conversation_id)
+
+    # -----------------------
+    # conversation
+    # -----------------------
+    def get_conversation_id(self) -> str:
+        return self._session_state[SessionKey.CONVERSATION_ID.name]
+
+    def start_conversation(self, conversation_id: Optional[str] = None) -> None:
+        """Resume ``conversation_id`` from the store, or start a new conversation."""
+        if conversation_id is None:
+            conversation_id = uuid.uuid4().hex
+        # 全履歴はストアに置き、セッションには直近の数件だけを持つ
+        count = self._store.count(conversation_id)
+        recent = self._store.load(conversation_id, max(count - SESSION_RECENT_MESSAGES, 0)) if count else []
+        self._session_state[SessionKey.CONVERSATION_ID.name] = conversation_id
+        self._session_state[SessionKey.MESSAGES.name] = recent
+        self._session_state[SessionKey.MESSAGE_COUNT.name] = count
+        self._session_state[SessionKey.CHAT_CONTEXT.name] = None
+        self._session_state[SessionKey.HISTORY_WINDOW.name] = CHAT_HISTORY_PAGE_SIZE
+        # 再開した会話はそれまでにかかったコストから数える
+        self._session_state[SessionKey.COSTS.name] = self._store.total_cost(conversation_id)
+        st.experimental_set_query_params(conversation=conversation_id)
 
     # -----------------------
     # messages
     # -----------------------
-    def get_messages(self) -> List[BaseMessage]:
-        return self._session_state[SessionKey.MESSAGES.name]
+    def get_messages(self, start: int = 0) -> List["BaseMessage"]:
+        return [record.message for record in self.get_records(start)]
+
+    def get_records(self, start: int = 0) -> List[ChatRecord]:
+        recent = self._session_state[SessionKey.MESSAGES.name]
+        recent_start = self.count_messages() - len(recent)
+        if start >= recent_start:
+            return recent[start - recent_start :]
+        # 直近の範囲より前はストアから読む
+        return self._store.load(self.get_conversation_id(), start, recent_start - start) + recent
+
+    def count_messages(self) -> int:
+        return self._session_state[SessionKey.MESSAGE_COUNT.name]
 
-    def add_message(self, message: BaseMessage) -> None:
-        self._session_state[SessionKey.MESSAGES.name].append(message)
+    def add_message(self, message: "BaseMessage", cost: Optional[float] = None) -> None:
+        record = ChatRecord(message, cost)
+        self._store.append(self.get_conversation_id(), record)
+        recent = self._session_state[SessionKey.MESSAGES.name]
+        recent.append(record)
+        if len(recent) > SESSION_RECENT_MESSAGES:
+            del recent[0]
+        self._session_state[SessionKey.MESSAGE_COUNT.name] += 1
 
     def clear_messages(self) -> None:
-        self._session_state[SessionKey.MESSAGES.name] = []
+        # 保存済みの会話は残したまま、新しい会話を始める
+        self.start_conversation()
 
     # -----------------------
     # costs
     # -----------------------
-    def get_costs(self) -> List[float]:
+    def get_total_cost(self) -> float:
         return self._session_state[SessionKey.COSTS.name]
 
     def add_cost(self, cost: float) -> None:
-        self._session_state[SessionKey.COSTS.name].append(cost)
+        self._session_state[SessionKey.COSTS.name] += cost
+        # 再開したときに合計を戻せるよう、会話ごとの合計もストアに残す
+        self._store.add_cost(self.get_conversation_id(), cost)
 
     def clear_costs(self) -> None:
-        self._session_state[SessionKey.COSTS.name] = []
+        self._session_state[SessionKey.COSTS.name] = 0.0
 
     # -----------------------
     # model_name
@@ -50,11 +104,49 @@ class StreamlistSessionManager:
     def register_model_name(self, model_name: str) -> None:
         self._session_state[SessionKey.MODEL_NAME.name] = model_name
 
+    # -----------------------
+    # generation
+    # -----------------------
+    def get_generation(self) -> Optional["GenerationBudget"]:
+        """Budget of the last answer streamed by this session's script (see ``BaseChatGPTPage.generation()``)."""
+        return self._session_state[SessionKey.GENERATION.name]
+
+    def register_generation(self, budget: "GenerationBudget") -> None:
+        self._session_state[SessionKey.GENERATION.name] = budget
+
     # -----------------------
     # url_input
     # -----------------------
     def clear_url_input(self) -> None:
         self._session_state[SessionKey.URL_INPUT.name] = ""
+        self._session_state[SessionKey.URL_LIST_INPUT.name] = ""
+        self._session_state[SessionKey.FOLLOWUPS.name] = {}
+
+    # -----------------------
+    # batch_job
+    # -----------------------
+    def get_batch_job(self) -> Optional[Hashable]:
+        """Key of the last batch job started in this session (see ``get_job_executor()``)."""
+        return self._session_state[SessionKey.BATCH_JOB.name]
+
+    def register_batch_job(self, key: Hashable) -> None:
+        self._session_state[SessionKey.BATCH_JOB.name] = key
+
+    # -----------------------
+    # followups
+    # -----------------------
+    def get_followups(self, url: str) -> List[Tuple[str, str]]:
+        followups: Dict[str, List[Tuple[str, str]]] = self._session_state[SessionKey.FOLLOWUPS.name]
+        return followups.get(url, [])
+
+    def add_followup(self, url: str, question: str, answer: str) -> None:
+        followups: Dict[str, List[Tuple[str, str]]] = self._session_state[SessionKey.FOLLOWUPS.name]
+        # 最近質問した URL の、直近の質問だけを残す
+        recent = followups.pop(url, [])
+        recent.append((question, answer))
+        followups[url] = recent[-SESSION_RECENT_MESSAGES:]
+        while len(followups) > SESSION_FOLLOWUP_URLS:
+            del followups[next(iter(followups))]
 
     # -----------------------
     # max_token
@@ -64,3 +156,21 @@ class StreamlistSessionManager:
 
     def register_max_token(self, max_token_num: int) -> None:
         self._session_state[SessionKey.MAX_TOKEN.name] = max_token_num
+
+    # -----------------------
+    # history_window
+    # -----------------------
+    def get_history_window(self) -> int:
+        return self._session_state[SessionKey.HISTORY_WINDOW.name]
+
+    def extend_history_window(self) -> None:
+        self._session_state[SessionKey.HISTORY_WINDOW.name] += CHAT_HISTORY_PAGE_SIZE
+
+    # -----------------------
+    # chat_context
+    # -----------------------
+    def get_chat_context(self) -> Optional["ConversationContext"]:
+        return self._session_state[SessionKey.CHAT_CONTEXT.name]
+
+    def register_chat_context(self, context: "ConversationContext") -> None:
+        self._session_state[SessionKey.CHAT_CONTEXT.name] = context
@@ -0,0 +1,106 @@
+import os
+from pathlib import Path
+
+# アプリ全体で使うローカルキャッシュの置き場所
+CACHE_DIR = Path(os.environ.get("CHATGPT_APP_CACHE_DIR", Path.home() / ".cache" / "chatgpt_app"))
+
+# tiktoken の BPE ファイルのキャッシュ先。一度ダウンロードすれば以降の起動はネットワーク不要
+TIKTOKEN_CACHE_DIR = Path(os.environ.get("TIKTOKEN_CACHE_DIR", CACHE_DIR / "tiktoken"))
+
+# LLM の回答キャッシュ (SQLite)
+RESPONSE_CACHE_PATH = Path(os.environ.get("CHATGPT_APP_RESPONSE_CACHE_PATH", CACHE_DIR / "responses.sqlite3"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("CHATGPT_APP_RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("CHATGPT_APP_RESPONSE_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("CHATGPT_APP_RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+# この temperature 以下のリクエストだけキャッシュする (負の値でキャッシュ無効)
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.environ.get("CHATGPT_APP_RESPONSE_CACHE_MAX_TEMPERATURE", 0.0))
+
+# Webページ取得
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("CHATGPT_APP_HTTP_CONNECT_TIMEOUT", 5.0))
+HTTP_READ_TIMEOUT = float(os.environ.get("CHATGPT_APP_HTTP_READ_TIMEOUT", 15.0))
+HTTP_TOTAL_TIMEOUT = float(os.environ.get("CHATGPT_APP_HTTP_TOTAL_TIMEOUT", 30.0))
+HTTP_MAX_BYTES = int(os.environ.get("CHATGPT_APP_HTTP_MAX_BYTES", 5 * 1024 * 1024))
+HTTP_POOL_MAXSIZE = int(os.environ.get("CHATGPT_APP_HTTP_POOL_MAXSIZE", 32))
+HTTP_CACHE_MAX_ENTRIES = int(os.environ.get("CHATGPT_APP_HTTP_CACHE_MAX_ENTRIES", 256))
+# 本文抽出エンジン (auto / lxml / streaming / bs4)
+HTML_EXTRACTOR = os.environ.get("CHATGPT_APP_HTML_EXTRACTOR", "auto")
+
+# Webページ要約: 抽出する本文の上限文字数と回答用に空けておくトークン数
+WEB_SUMMARIZE_MAX_CHARS = int(os.environ.get("CHATGPT_APP_WEB_SUMMARIZE_MAX_CHARS", 100_000))
+WEB_SUMMARIZE_COMPLETION_TOKENS = int(os.environ.get("CHATGPT_APP_WEB_SUMMARIZE_COMPLETION_TOKENS", 1024))
+# map-reduce 要約で同時に投げるリクエスト数
+MAP_REDUCE_MAX_CONCURRENCY = int(os.environ.get("CHATGPT_APP_MAP_REDUCE_MAX_CONCURRENCY", 4))
+# 複数URLの一括要約: URL数の上限、同時取得数 (同一ホストへはさらに制限)、同時要約数
+WEB_BATCH_MAX_URLS = int(os.environ.get("CHATGPT_APP_WEB_BATCH_MAX_URLS", 50))
+WEB_BATCH_FETCH_CONCURRENCY = int(os.environ.get("CHATGPT_APP_WEB_BATCH_FETCH_CONCURRENCY", 8))
+WEB_BATCH_MAX_PER_HOST = int(os.environ.get("CHATGPT_APP_WEB_BATCH_MAX_PER_HOST", 2))
+WEB_BATCH_SUMMARIZE_CONCURRENCY = int(os.environ.get("CHATGPT_APP_WEB_BATCH_SUMMARIZE_CONCURRENCY", 4))
+
+# 要約したページ・文字起こしのベクトル索引。追加の質問には関連する上位 k 件のチャンクだけをプロンプトに入れる
+VECTOR_INDEX_DIR = Path(os.environ.get("CHATGPT_APP_VECTOR_INDEX_DIR", CACHE_DIR / "vectors"))
+# 埋め込み方法 (hashing: オフラインで動く語のハッシュ + TF-IDF / openai: OpenAI の埋め込み API)
+VECTOR_INDEX_EMBEDDER = os.environ.get("CHATGPT_APP_VECTOR_INDEX_EMBEDDER", "hashing")
+VECTOR_INDEX_HASHING_DIM = int(os.environ.get("CHATGPT_APP_VECTOR_INDEX_HASHING_DIM", 2048))
+VECTOR_INDEX_MAX_URLS = int(os.environ.get("CHATGPT_APP_VECTOR_INDEX_MAX_URLS", 500))
+VECTOR_INDEX_CHUNK_TOKENS = int(os.environ.get("CHATGPT_APP_VECTOR_INDEX_CHUNK_TOKENS", 200))
+VECTOR_INDEX_TOP_K = int(os.environ.get("CHATGPT_APP_VECTOR_INDEX_TOP_K", 4))
+
+# 要約をスクリプトのスレッドの外で実行するワーカー数 (全セッション共有) と、結果を残しておく完了済みジョブの数
+JOB_MAX_WORKERS = int(os.environ.get("CHATGPT_APP_JOB_MAX_WORKERS", 4))
+JOB_MAX_FINISHED = int(os.environ.get("CHATGPT_APP_JOB_MAX_FINISHED", 64))
+# 実行中のジョブの進み具合を描き直す間隔 (秒)
+JOB_POLL_INTERVAL = float(os.environ.get("CHATGPT_APP_JOB_POLL_INTERVAL", 0.25))
+
+# 1 回の回答 (チャットの返答・追加の質問・要約ジョブ) の回答トークン数とコスト (USD) の上限の初期値。0 なら上限なし
+# (サイドバーでページごとに変えられる)
+GENERATION_MAX_COMPLETION_TOKENS = int(os.environ.get("CHATGPT_APP_GENERATION_MAX_COMPLETION_TOKENS", 0))
+GENERATION_MAX_COST = float(os.environ.get("CHATGPT_APP_GENERATION_MAX_COST", 0.0))
+# Stop を押したあと、止めた回答が途中までの内容を記録し終えるのを待つ最長時間 (秒)
+GENERATION_STOP_WAIT = float(os.environ.get("CHATGPT_APP_GENERATION_STOP_WAIT", 3.0))
+
+# チャットで送る履歴のトークン数の上限 (コンテキスト長から回答分を引いた値とのうち小さい方)
+CHAT_CONTEXT_MAX_TOKENS = int(os.environ.get("CHATGPT_APP_CHAT_CONTEXT_MAX_TOKENS", 3000))
+CHAT_COMPLETION_TOKENS = int(os.environ.get("CHATGPT_APP_CHAT_COMPLETION_TOKENS", 1024))
+# チャット履歴を一度に表示する件数 ("Load older" を押すたびにこの件数ずつ増やす)
+CHAT_HISTORY_PAGE_SIZE = int(os.environ.get("CHATGPT_APP_CHAT_HISTORY_PAGE_SIZE", 20))
+
+# 会話履歴の保存先 (sqlite / memory)。セッションには直近の数件だけを置く
+CONVERSATION_STORE = os.environ.get("CHATGPT_APP_CONVERSATION_STORE", "sqlite")
+CONVERSATION_STORE_PATH = Path(
+    os.environ.get("CHATGPT_APP_CONVERSATION_STORE_PATH", CACHE_DIR / "conversations.sqlite3")
+)
+SESSION_RECENT_MESSAGES = int(os.environ.get("CHATGPT_APP_SESSION_RECENT_MESSAGES", 20))
+# 追加の質問をセッションに残す URL の数 (URL ごとの件数は SESSION_RECENT_MESSAGES まで)
+SESSION_FOLLOWUP_URLS = int(os.environ.get("CHATGPT_APP_SESSION_FOLLOWUP_URLS", 5))
+
+# LLM リクエストごとの使用量の記録 (JSON Lines) と Prometheus 形式のメトリクスの出力先 (未指定なら出力しない)
+USAGE_LEDGER_PATH = Path(os.environ.get("CHATGPT_APP_USAGE_LEDGER_PATH", CACHE_DIR / "usage.jsonl"))
+_usage_metrics_path = os.environ.get("CHATGPT_APP_USAGE_METRICS_PATH")
+USAGE_METRICS_PATH = Path(_usage_metrics_path) if _usage_metrics_path else None
+
+# サイドバーのデバッグパネルで見られるよう、直近いくつのトレースを保持するか
+TRACE_MAX_TRACES = int(os.environ.get("CHATGPT_APP_TRACE_MAX_TRACES", 20))
+# デバッグパネルを出すか (既定は出さない)。出すときも各セッションには自分のトレースだけを見せる
+TRACE_DEBUG_PANEL = os.environ.get("CHATGPT_APP_TRACE_DEBUG_PANEL", "0").lower() in ("1", "true", "yes")
+
+# ストリーミング表示の再描画: 間隔 (秒) かトークン数のどちらかに達し、かつ未表示分が表示済みの
+# この割合以上になったときだけ描き直す
+STREAM_FLUSH_INTERVAL = float(os.environ.get("CHATGPT_APP_STREAM_FLUSH_INTERVAL", 0.1))
+STREAM_FLUSH_TOKENS = int(os.environ.get("CHATGPT_APP_STREAM_FLUSH_TOKENS", 16))
+STREAM_FLUSH_GROWTH = float(os.environ.get("CHATGPT_APP_STREAM_FLUSH_GROWTH", 0.1))
+
+# OpenAI API の接続先。ローカルのスタブサーバーやプロキシを使うときに指定する (未指定なら OPENAI_API_BASE か既定値)
+OPENAI_API_BASE = os.environ.get("CHATGPT_APP_OPENAI_API_BASE", os.environ.get("OPENAI_API_BASE", "")) or None
+
+# セッション間で共有する ChatOpenAI の数 (設定ごとに 1 つ) と、OpenAI API への接続プールの大きさ
+LLM_CLIENT_POOL_MAX_SIZE = int(os.environ.get("CHATGPT_APP_LLM_CLIENT_POOL_MAX_SIZE", 16))
+OPENAI_HTTP_POOL_MAXSIZE = int(os.environ.get("CHATGPT_APP_OPENAI_HTTP_POOL_MAXSIZE", 64))
+
+# OpenAI のレート制限 (モデル名の先頭一致で "gpt-4=200:40000,gpt-3.5-turbo=3500:90000" のように requests/分:tokens/分
+# を上書きする)。回答のトークン数は max_tokens が無ければこの値で見積もる
+RATE_LIMITS = os.environ.get("CHATGPT_APP_RATE_LIMITS", "")
+RATE_LIMIT_EXPECTED_COMPLETION_TOKENS = int(os.environ.get("CHATGPT_APP_RATE_LIMIT_EXPECTED_COMPLETION_TOKENS", 512))
+# 429 やサーバーエラーのときの再試行回数と待ち時間 (秒, 指数的に増やしてランダムにずらす)
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get("CHATGPT_APP_RATE_LIMIT_MAX_RETRIES", 6))
+RATE_LIMIT_BACKOFF_BASE = float(os.environ.get("CHATGPT_APP_RATE_LIMIT_BACKOFF_BASE", 0.5))
+RATE_LIMIT_BACKOFF_MAX = float(os.environ.get("CHATGPT_APP_RATE_LIMIT_BACKOFF_MAX", 30.0))
@@ -0,0 +1,36 @@
+import threading
+from typing import Dict, Optional, Type
+
+from chatgpt_app.settings import CONVERSATION_STORE, CONVERSATION_STORE_PATH
+from chatgpt_app.storage.base import ChatRecord, ConversationStore
+from chatgpt_app.storage.memory_store import InMemoryConversationStore
+from chatgpt_app.storage.sqlite_store import SqliteConversationStore
+
+STORES: Dict[str, Type[ConversationStore]] = {
+    store.name: store for store in (SqliteConversationStore, InMemoryConversationStore)
+}
+
+_conversation_store: Optional[ConversationStore] = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Return the process-wide conversation store selected by ``CONVERSATION_STORE``."""
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            if CONVERSATION_STORE == SqliteConversationStore.name:
+                _conversation_store = SqliteConversationStore(CONVERSATION_STORE_PATH)
+            else:
+                _conversation_store = STORES[CONVERSATION_STORE]()
+        return _conversation_store
+
+
+__all__ = [
+    ChatRecord,
+    ConversationStore,
+    InMemoryConversationStore,
+    SqliteConversationStore,
+    STORES,
+    get_conversation_store,
+]
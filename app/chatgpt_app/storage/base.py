@@ -0,0 +1,56 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from langchain.schema import BaseMessage
+
+
+@dataclass
+class ChatRecord:
+    """A message of the conversation together with the cost of producing it."""
+
+    message: "BaseMessage"
+    cost: Optional[float] = None
+    _markdown: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def markdown(self) -> str:
+        # 再描画のたびに組み立て直さないよう、表示用の文字列を保持しておく
+        if self._markdown is None:
+            # 起動時に langchain を読み込まないよう、クラスではなく type で見分ける
+            if self.message.type in ("ai", "human"):
+                markdown = self.message.content
+            else:  # isinstance(message, SystemMessage):
+                markdown = f"System message: {self.message.content}"
+            if self.cost is not None:
+                markdown += f"\n\ncost: ${self.cost:.5f}"
+            self._markdown = markdown
+        return self._markdown
+
+
+class ConversationStore:
+    """Append-only storage of conversations, read back page by page."""
+
+    name = ""
+
+    def append(self, conversation_id: str, record: ChatRecord) -> int:
+        """Store ``record`` at the end of the conversation and return its position."""
+        raise NotImplementedError("Please overwrite append function.")
+
+    def count(self, conversation_id: str) -> int:
+        raise NotImplementedError("Please overwrite count function.")
+
+    def load(self, conversation_id: str, start: int = 0, limit: Optional[int] = None) -> List[ChatRecord]:
+        """Return up to ``limit`` records from position ``start`` in order."""
+        raise NotImplementedError("Please overwrite load function.")
+
+    def add_cost(self, conversation_id: str, cost: float) -> None:
+        """Charge ``cost`` to the conversation (answers, history summaries, page summaries, follow-ups)."""
+        raise NotImplementedError("Please overwrite add_cost function.")
+
+    def total_cost(self, conversation_id: str) -> float:
+        """Sum of the costs charged with ``add_cost``."""
+        raise NotImplementedError("Please overwrite total_cost function.")
+
+    def delete(self, conversation_id: str) -> None:
+        raise NotImplementedError("Please overwrite delete function.")
@@ -0,0 +1,44 @@
+import threading
+from typing import Dict, List, Optional
+
+from chatgpt_app.storage.base import ChatRecord, ConversationStore
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Process-local store; conversations are lost on restart."""
+
+    name = "memory"
+
+    def __init__(self) -> None:
+        self._conversations: Dict[str, List[ChatRecord]] = {}
+        self._costs: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def append(self, conversation_id: str, record: ChatRecord) -> int:
+        with self._lock:
+            records = self._conversations.setdefault(conversation_id, [])
+            records.append(record)
+            return len(records) - 1
+
+    def count(self, conversation_id: str) -> int:
+        with self._lock:
+            return len(self._conversations.get(conversation_id, []))
+
+    def load(self, conversation_id: str, start: int = 0, limit: Optional[int] = None) -> List[ChatRecord]:
+        with self._lock:
+            records = self._conversations.get(conversation_id, [])
+            end = len(records) if limit is None else start + limit
+            return records[start:end]
+
+    def add_cost(self, conversation_id: str, cost: float) -> None:
+        with self._lock:
+            self._costs[conversation_id] = self._costs.get(conversation_id, 0.0) + cost
+
+    def total_cost(self, conversation_id: str) -> float:
+        with self._lock:
+            return self._costs.get(conversation_id, 0.0)
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+            self._costs.pop(conversation_id, None)
@@ -0,0 +1,119 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from chatgpt_app.storage.base import ChatRecord, ConversationStore
+
+
+class SqliteConversationStore(ConversationStore):
+    """Conversations persisted in SQLite; one row per message, indexed by (conversation, position)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                message_count INTEGER NOT NULL,
+                cost REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                cost REAL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (conversation_id, position)
+            ) WITHOUT ROWID
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")]
+        if "cost" not in columns:
+            # cost 列より前に作った DB は、メッセージのコストの合計から始める
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN cost REAL NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "UPDATE conversations SET cost = "
+                "(SELECT COALESCE(SUM(cost), 0) FROM messages WHERE conversation_id = conversations.id)"
+            )
+        self._conn.commit()
+
+    def append(self, conversation_id: str, record: ChatRecord) -> int:
+        # langchain は重いので、起動時ではなく最初に使うときに読み込む
+        from langchain.schema import messages_to_dict
+
+        now = time.time()
+        message = json.dumps(messages_to_dict([record.message])[0], ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO conversations (id, message_count, created_at, updated_at) VALUES (?, 0, ?, ?)",
+                (conversation_id, now, now),
+            )
+            (position,) = self._conn.execute(
+                "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT INTO messages (conversation_id, position, message, cost, created_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, position, message, record.cost, now),
+            )
+            self._conn.execute(
+                "UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?",
+                (position + 1, now, conversation_id),
+            )
+            self._conn.commit()
+            return position
+
+    def count(self, conversation_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] if row is not None else 0
+
+    def load(self, conversation_id: str, start: int = 0, limit: Optional[int] = None) -> List[ChatRecord]:
+        from langchain.schema import messages_from_dict
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message, cost FROM messages WHERE conversation_id = ? AND position >= ? "
+                "ORDER BY position LIMIT ?",
+                (conversation_id, start, -1 if limit is None else limit),
+            ).fetchall()
+        messages = messages_from_dict([json.loads(message) for message, _ in rows])
+        return [ChatRecord(message, cost) for message, (_, cost) in zip(messages, rows)]
+
+    def add_cost(self, conversation_id: str, cost: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conversations (id, message_count, cost, created_at, updated_at) VALUES (?, 0, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET cost = cost + excluded.cost, updated_at = excluded.updated_at",
+                (conversation_id, cost, now, now),
+            )
+            self._conn.commit()
+
+    def total_cost(self, conversation_id: str) -> float:
+        with self._lock:
+            row = self._conn.execute("SELECT cost FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row is not None else 0.0
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self._conn.commit()
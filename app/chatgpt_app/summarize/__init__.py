@@ -0,0 +1,12 @@
+from chatgpt_app.summarize.base import SYSTEM_PROMPT, Summarizer, SummaryResult
+from chatgpt_app.summarize.web import WebSummarizer
+from chatgpt_app.summarize.youtube import YouTubeSummarizer, is_youtube_url
+
+__all__ = [
+    SYSTEM_PROMPT,
+    Summarizer,
+    SummaryResult,
+    WebSummarizer,
+    YouTubeSummarizer,
+    is_youtube_url,
+]
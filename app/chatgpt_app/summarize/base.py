@@ -0,0 +1,142 @@
+import abc
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+
+from chatgpt_app.const import PageId
+from chatgpt_app.langchain_wrapper.callbacks.generation_budget_handler import GenerationBudgetHandler
+from chatgpt_app.langchain_wrapper.callbacks.llm_timing_handler import LLMTimingHandler
+from chatgpt_app.langchain_wrapper.callbacks.token_cost_handler import TokenCostHandler
+from chatgpt_app.langchain_wrapper.generation_budget import GenerationAborted, GenerationBudget
+from chatgpt_app.langchain_wrapper.response_cache import get_response_cache
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
+from chatgpt_app.prompts import PromptsLoader
+from chatgpt_app.retrieval import SearchHit, VectorIndex, get_vector_index
+from chatgpt_app.settings import MAP_REDUCE_MAX_CONCURRENCY, RESPONSE_CACHE_MAX_TEMPERATURE, VECTOR_INDEX_TOP_K
+from chatgpt_app.tracing import tracer
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import BaseMessage, HumanMessage, SystemMessage
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+# ストリーミングされたトークンを受け取る
+TokenCallback = Callable[[str], None]
+
+
+@dataclass(frozen=True)
+class SummaryResult:
+    answer: str
+    cost: float
+    source: Any
+    # 途中で打ち切ったときの理由 (answer はそこまでの部分)
+    stopped: Optional[str] = None
+
+
+class _TokenForwarder(BaseCallbackHandler):
+    def __init__(self, on_token: Optional[TokenCallback]) -> None:
+        self.on_token = on_token
+        self.tokens: List[str] = []
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.tokens.append(token)
+        if self.on_token is not None:
+            self.on_token(token)
+
+
+class Summarizer(abc.ABC):
+    """Summarization steps shared by the Streamlit pages, background jobs and the batch CLI.
+
+    Nothing here draws to Streamlit, so every method is safe to call from worker threads. Progress is
+    reported through the optional callbacks instead.
+    """
+
+    page_id: PageId
+
+    def __init__(
+        self,
+        llm: ChatOpenAI,
+        prompts_loader: Optional[PromptsLoader] = None,
+        max_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY,
+    ) -> None:
+        self.llm = llm
+        self.prompts_loader = prompts_loader or PromptsLoader()
+        self.max_concurrency = max_concurrency
+
+    def system_message(self) -> SystemMessage:
+        return SystemMessage(content=SYSTEM_PROMPT)
+
+    def token_cost_process(self) -> TokenCostProcess:
+        return TokenCostProcess(self.llm.model_name, page=self.page_id.name)
+
+    def complete(
+        self,
+        messages: List[BaseMessage],
+        token_cost_process: TokenCostProcess,
+        on_token: Optional[TokenCallback] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> str:
+        """Run the final call, passing streamed tokens to ``on_token``.
+
+        Raises GenerationAborted, with the text streamed so far as ``partial_answer``, when ``budget`` stops it.
+        """
+        with tracer.span("llm", model=self.llm.model_name, page=self.page_id.name) as span:
+            # 同一リクエストはキャッシュから返す (コストは発生しない)
+            use_cache = self.llm.temperature <= RESPONSE_CACHE_MAX_TEMPERATURE
+            if use_cache:
+                response_cache = get_response_cache()
+                key = response_cache.make_key(self.llm.model_name, self.llm.temperature, messages)
+                cached_answer = response_cache.get(key)
+                if cached_answer is not None:
+                    span.set(cached=True)
+                    if on_token is not None:
+                        on_token(cached_answer)
+                    return cached_answer
+
+            forwarder = _TokenForwarder(on_token)
+            callbacks: List[BaseCallbackHandler] = [
+                TokenCostHandler(token_cost_process),
+                LLMTimingHandler(span),
+                forwarder,
+            ]
+            if budget is not None:
+                budget.check(messages)
+                callbacks.append(GenerationBudgetHandler(budget))
+            try:
+                answer = self.llm(messages, callbacks=callbacks).content
+            except GenerationAborted as e:
+                span.set(stopped=e.reason)
+                e.partial_answer = "".join(forwarder.tokens)
+                raise
+            if use_cache:
+                response_cache.put(key, self.llm.model_name, answer)
+            return answer
+
+    @abc.abstractmethod
+    def index_chunks(self, source: Any) -> List[str]:
+        """Texts of ``source`` (``SummaryResult.source``) to put in the vector index."""
+
+    def index_parameters(self) -> List[str]:
+        """Settings besides the source that ``index_chunks`` depends on (model, chunk size, ...)."""
+        return [self.llm.model_name]
+
+    def index_fingerprint(self, source: Any) -> str:
+        """Identifies the chunks ``index_chunks(source)`` would return, so unchanged sources are not re-indexed.
+
+        Built from the raw source and ``index_parameters()`` without chunking it, since it runs on every follow-up.
+        """
+        texts = [source] if isinstance(source, str) else [getattr(part, "page_content", str(part)) for part in source]
+        return VectorIndex.fingerprint([*texts, *self.index_parameters()])
+
+    def followup_prompt(
+        self, url: str, source: Any, question: str, k: int = VECTOR_INDEX_TOP_K
+    ) -> Tuple[List[BaseMessage], List[SearchHit]]:
+        """Prompt answering ``question`` from the ``k`` chunks of ``url`` closest to it, not all of ``source``."""
+        index = get_vector_index()
+        with tracer.span("retrieve", url=url, k=k) as span:
+            indexed = index.ensure(url, self.index_fingerprint(source), lambda: self.index_chunks(source))
+            hits = index.search(url, question, k)
+            span.set(indexed=indexed, parts=len(hits))
+        # 抜き出した部分は元の順に並べる
+        passages = "\n\n---\n\n".join(hit.text for hit in sorted(hits, key=lambda hit: hit.position))
+        prompt = self.prompts_loader.followup_question(passages, question)
+        return [self.system_message(), HumanMessage(content=prompt)], hits
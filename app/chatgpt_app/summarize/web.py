@@ -0,0 +1,134 @@
+from typing import Any, List, Optional
+
+from chatgpt_app.const import PageId
+from chatgpt_app.langchain_wrapper.generation_budget import GenerationAborted, GenerationBudget
+from chatgpt_app.langchain_wrapper.map_reduce import MapReduceSummarizer, ResultCallback
+from chatgpt_app.langchain_wrapper.token_chunker import TokenChunker
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess, context_window
+from chatgpt_app.langchain_wrapper.tokenizer import tokenizer_registry
+from chatgpt_app.prompts import PromptsLoader
+from chatgpt_app.settings import (
+    HTML_EXTRACTOR,
+    MAP_REDUCE_MAX_CONCURRENCY,
+    VECTOR_INDEX_CHUNK_TOKENS,
+    WEB_SUMMARIZE_COMPLETION_TOKENS,
+    WEB_SUMMARIZE_MAX_CHARS,
+)
+from chatgpt_app.summarize.base import Summarizer, SummaryResult, TokenCallback
+from chatgpt_app.tracing import tracer
+from chatgpt_app.web import HttpFetcher, get_extractor, get_http_fetcher
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import BaseMessage, HumanMessage
+
+
+class WebSummarizer(Summarizer):
+    page_id = PageId.WEB_SUMMARIZE
+
+    def __init__(
+        self,
+        llm: ChatOpenAI,
+        prompts_loader: Optional[PromptsLoader] = None,
+        max_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY,
+        fetcher: Optional[HttpFetcher] = None,
+    ) -> None:
+        super().__init__(llm, prompts_loader, max_concurrency)
+        # 未指定ならプロセス全体で共有する fetcher を使う
+        self.fetcher = fetcher
+
+    def fetch_content(self, url: str) -> str:
+        with tracer.span("fetch", url=url) as span:
+            page = (self.fetcher or get_http_fetcher()).fetch(url)
+            span.set(bytes=len(page.content), from_cache=page.from_cache, truncated=page.truncated)
+        # main > article > body の順で本文を探す
+        extractor = get_extractor(HTML_EXTRACTOR)
+        with tracer.span("parse", extractor=extractor.name) as span:
+            content = extractor.extract(page.text, max_chars=WEB_SUMMARIZE_MAX_CHARS)
+            span.set(chars=len(content))
+        return content
+
+    def summary_prompt(self, content: str, summarize_length: int) -> List[BaseMessage]:
+        prompt = self.prompts_loader.web_summarize(content, summarize_length)
+        return [self.system_message(), HumanMessage(content=prompt)]
+
+    def map_prompt(self, text: str) -> List[BaseMessage]:
+        return [self.system_message(), HumanMessage(content=self.prompts_loader.web_summarize_map(text))]
+
+    def reduce_prompt(self, text: str, summarize_length: int) -> List[BaseMessage]:
+        prompt = self.prompts_loader.web_summarize_reduce(text, summarize_length)
+        return [self.system_message(), HumanMessage(content=prompt)]
+
+    @property
+    def token_budget(self) -> int:
+        return context_window(self.llm.model_name) - WEB_SUMMARIZE_COMPLETION_TOKENS
+
+    def map_summaries(
+        self,
+        token_cost_process: TokenCostProcess,
+        content: str,
+        on_result: Optional[ResultCallback] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> List[str]:
+        """Split ``content`` and summarize the chunks in parallel until the summaries fit in the token budget."""
+        summarizer = MapReduceSummarizer(
+            self.llm, token_cost_process, max_concurrency=self.max_concurrency, budget=budget
+        )
+        # プロンプトの定型部分を除いた分を1チャンクの本文に使う
+        chunk_size = self.token_budget - token_cost_process.tokens_from_base_messages(self.map_prompt(""))
+        chunker = TokenChunker(token_cost_process.encoding, chunk_size=chunk_size)
+        with tracer.span("split", chunk_size=chunk_size) as span:
+            chunks = [chunk.text for chunk in chunker.split_text(content)]
+            span.set(parts=len(chunks))
+        summaries = summarizer.map(chunks, self.map_prompt, on_result=on_result)
+        return summarizer.collapse(summaries, self.map_prompt, chunk_size)
+
+    def final_prompt(
+        self,
+        token_cost_process: TokenCostProcess,
+        content: str,
+        summarize_length: int,
+        on_result: Optional[ResultCallback] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> List[BaseMessage]:
+        """Prompt of the last call. Content too long for one call is map-summarized first."""
+        messages = self.summary_prompt(content, summarize_length)
+        if token_cost_process.tokens_from_base_messages(messages) <= self.token_budget:
+            # コンテキストに収まるなら1回で要約する
+            return messages
+        summaries = self.map_summaries(token_cost_process, content, on_result, budget)
+        return self.reduce_prompt("\n\n".join(summaries), summarize_length)
+
+    def summarize_content(
+        self,
+        url: str,
+        content: str,
+        summarize_length: int,
+        on_result: Optional[ResultCallback] = None,
+        on_token: Optional[TokenCallback] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> SummaryResult:
+        """Summarize ``content``; if ``budget`` stops it, the result holds the partial answer and its cost."""
+        with tracer.span("web_summarize", url=url, model=self.llm.model_name):
+            token_cost_process = self.token_cost_process()
+            try:
+                messages = self.final_prompt(token_cost_process, content, summarize_length, on_result, budget)
+                answer = self.complete(messages, token_cost_process, on_token, budget)
+            except GenerationAborted as e:
+                return SummaryResult(e.partial_answer, token_cost_process.total_cost, content, stopped=e.reason)
+            return SummaryResult(answer=answer, cost=token_cost_process.total_cost, source=content)
+
+    def summarize_url(self, url: str, summarize_length: int) -> SummaryResult:
+        content = self.fetch_content(url)
+        if not content:
+            raise ValueError("no content to summarize")
+        return self.summarize_content(url, content, summarize_length)
+
+    def index_chunks(self, source: Any) -> List[str]:
+        encoding = tokenizer_registry.get_encoding(self.llm.model_name)
+        # 境界で答えが切れないよう少し重ねる
+        chunker = TokenChunker(
+            encoding, chunk_size=VECTOR_INDEX_CHUNK_TOKENS, chunk_overlap=VECTOR_INDEX_CHUNK_TOKENS // 10
+        )
+        return [chunk.text for chunk in chunker.split_text(source)]
+
+    def index_parameters(self) -> List[str]:
+        return [self.llm.model_name, str(VECTOR_INDEX_CHUNK_TOKENS)]
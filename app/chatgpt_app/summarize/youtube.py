@@ -0,0 +1,108 @@
+from typing import Any, List, Optional
+
+from chatgpt_app.const import PageId
+from chatgpt_app.langchain_wrapper.generation_budget import GenerationAborted, GenerationBudget
+from chatgpt_app.langchain_wrapper.map_reduce import MapReduceSummarizer, ResultCallback
+from chatgpt_app.langchain_wrapper.token_chunker import TokenChunker
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
+from chatgpt_app.langchain_wrapper.tokenizer import tokenizer_registry
+from chatgpt_app.prompts import PromptsLoader
+from chatgpt_app.settings import MAP_REDUCE_MAX_CONCURRENCY
+from chatgpt_app.summarize.base import Summarizer, SummaryResult, TokenCallback
+from chatgpt_app.tracing import tracer
+from langchain.chat_models import ChatOpenAI
+from langchain.docstore.document import Document
+from langchain.schema import BaseMessage, HumanMessage
+
+
+def is_youtube_url(url: str) -> bool:
+    return "https://www.youtube.com/watch?" in url
+
+
+class YouTubeSummarizer(Summarizer):
+    page_id = PageId.YOUTUBE_SUMMARIZE
+
+    def __init__(
+        self,
+        llm: ChatOpenAI,
+        prompts_loader: Optional[PromptsLoader] = None,
+        max_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY,
+        chunk_size: int = 300,
+    ) -> None:
+        super().__init__(llm, prompts_loader, max_concurrency)
+        # 1チャンクのトークン数。map の結果もこの大きさに収まるまでまとめる
+        self.chunk_size = chunk_size
+
+    def get_documents(self, url: str) -> List[Document]:
+        # youtube_transcript_api / pytube は YouTube の要約でしか使わない
+        from langchain.document_loaders import YoutubeLoader
+
+        loader = YoutubeLoader.from_youtube_url(url, add_video_info=True, language=["en", "ja"])
+        with tracer.span("fetch", url=url) as span:
+            transcripts = loader.load()
+            span.set(chars=sum(len(doc.page_content) for doc in transcripts))
+        return self.split_documents(transcripts)
+
+    def split_documents(self, transcripts: List[Document]) -> List[Document]:
+        """Split the transcripts into parts of ``chunk_size`` tokens."""
+        # 文字起こし全体を一度だけ encode してトークン列を切り分ける
+        encoding = tokenizer_registry.get_encoding(self.llm.model_name)
+        chunker = TokenChunker(encoding, chunk_size=self.chunk_size, chunk_overlap=0)
+        with tracer.span("split", chunk_size=self.chunk_size) as span:
+            documents = chunker.split_documents(transcripts)
+            span.set(parts=len(documents))
+        return documents
+
+    def build_prompt(self, text: str) -> List[BaseMessage]:
+        return [HumanMessage(content=self.prompts_loader.youtube_summarize_template().format(text=text))]
+
+    def final_prompt(
+        self,
+        token_cost_process: TokenCostProcess,
+        documents: List[Document],
+        on_result: Optional[ResultCallback] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> List[BaseMessage]:
+        """Prompt of the last call. Several parts are map-summarized first; ``on_result`` sees each part's summary."""
+        summaries = [doc.page_content for doc in documents]
+        if len(documents) > 1:
+            summarizer = MapReduceSummarizer(
+                self.llm, token_cost_process, max_concurrency=self.max_concurrency, budget=budget
+            )
+            # map: 各チャンクを並列に要約する
+            summaries = summarizer.map(summaries, self.build_prompt, on_result=on_result)
+            # collapse: まとめた要約が chunk_size に収まるまで並列にまとめる
+            summaries = summarizer.collapse(summaries, self.build_prompt, self.chunk_size)
+        return self.build_prompt("\n\n".join(summaries))
+
+    def summarize_documents(
+        self,
+        url: str,
+        documents: List[Document],
+        on_result: Optional[ResultCallback] = None,
+        on_token: Optional[TokenCallback] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> SummaryResult:
+        """Summarize the transcript; if ``budget`` stops it, the result holds the partial answer and its cost."""
+        with tracer.span("youtube_summarize", url=url, model=self.llm.model_name):
+            token_cost_process = self.token_cost_process()
+            try:
+                messages = self.final_prompt(token_cost_process, documents, on_result, budget)
+                with tracer.span("reduce"):
+                    answer = self.complete(messages, token_cost_process, on_token, budget)
+            except GenerationAborted as e:
+                return SummaryResult(e.partial_answer, token_cost_process.total_cost, documents, stopped=e.reason)
+            return SummaryResult(answer=answer, cost=token_cost_process.total_cost, source=documents)
+
+    def summarize_url(self, url: str) -> SummaryResult:
+        documents = self.get_documents(url)
+        if not documents:
+            raise ValueError("no transcript to summarize")
+        return self.summarize_documents(url, documents)
+
+    def index_chunks(self, source: Any) -> List[str]:
+        # 要約のために分割した文字起こしをそのまま使う
+        return [doc.page_content for doc in source]
+
+    def index_parameters(self) -> List[str]:
+        return [self.llm.model_name, str(self.chunk_size)]
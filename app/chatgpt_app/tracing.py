@@ -0,0 +1,164 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from chatgpt_app.logger import get_logger
+from chatgpt_app.settings import TRACE_MAX_TRACES
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    thread_id: int = 0
+    # トレースを始めたセッション (会話 ID)
+    session: str = ""
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_current_session: contextvars.ContextVar[str] = contextvars.ContextVar("trace_session", default="")
+
+
+def set_trace_session(session: str) -> None:
+    """Set the session that traces started from the current thread or task belong to."""
+    _current_session.set(session)
+
+
+class Tracer:
+    """Collect nested spans and keep the latest ``max_traces`` finished traces.
+
+    The current span is kept in a context variable, so spans opened inside asyncio tasks
+    (e.g. the parallel map calls) are attached to the span that was open when the tasks were created.
+    """
+
+    def __init__(self, max_traces: int = 20) -> None:
+        self._lock = threading.Lock()
+        self._active: Dict[str, List[Span]] = {}
+        self._finished: Deque[List[Span]] = deque(maxlen=max_traces)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent is not None else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent is not None else None,
+            start=time.time(),
+            thread_id=threading.get_ident(),
+            session=parent.session if parent is not None else _current_session.get(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.time()
+            self._finish(span)
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            spans = self._active.setdefault(span.trace_id, [])
+            spans.append(span)
+            if span.parent_id is None:
+                # ルートが閉じたらトレース完了
+                self._finished.append(sorted(self._active.pop(span.trace_id), key=lambda s: s.start))
+        if span.parent_id is None:
+            logger.info(f"trace {span.name}: {span.duration * 1000:.1f} ms")
+
+    def traces(self, session: Optional[str] = None) -> List[List[Span]]:
+        """Return the finished traces, newest first (only those of ``session`` if given)."""
+        with self._lock:
+            return [spans for spans in reversed(self._finished) if session is None or spans[0].session == session]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._finished.clear()
+
+    def to_json(self, session: Optional[str] = None) -> str:
+        return json.dumps(
+            [
+                {"trace_id": spans[0].trace_id, "spans": [asdict(span) for span in spans]}
+                for spans in self.traces(session)
+            ],
+            ensure_ascii=False,
+            default=str,
+        )
+
+    def to_chrome_trace(self, session: Optional[str] = None) -> str:
+        """Export in the Chrome trace-event format (chrome://tracing, Perfetto)."""
+        events: List[Dict[str, Any]] = []
+        pid = os.getpid()
+        for trace_index, spans in enumerate(self.traces(session)):
+            lanes = set()
+            for span, lane in _assign_lanes(spans):
+                # 並列に走るスパンは別の行 (tid) に並べる
+                tid = trace_index * 1000 + lane
+                if lane not in lanes:
+                    lanes.add(lane)
+                    thread_name = f"{spans[0].name} {spans[0].trace_id[:8]} #{lane}"
+                    events.append(
+                        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                    )
+                events.append(
+                    {
+                        "name": span.name,
+                        "cat": "chatgpt_app",
+                        "ph": "X",
+                        "ts": span.start * 1_000_000,
+                        "dur": span.duration * 1_000_000,
+                        "pid": pid,
+                        "tid": tid,
+                        "args": span.attributes,
+                    }
+                )
+        return json.dumps({"traceEvents": events}, ensure_ascii=False, default=str)
+
+
+def _assign_lanes(spans: List[Span]) -> List[Tuple[Span, int]]:
+    """Place spans on lanes so that the spans of each lane are properly nested."""
+    lanes: List[List[Span]] = []
+    assigned: List[Tuple[Span, int]] = []
+    for span in sorted(spans, key=lambda s: (s.start, -s.duration)):
+        for lane, stack in enumerate(lanes):
+            while stack and stack[-1].start + stack[-1].duration <= span.start:
+                stack.pop()
+            if not stack or stack[-1].start + stack[-1].duration >= span.start + span.duration:
+                stack.append(span)
+                assigned.append((span, lane))
+                break
+        else:
+            lanes.append([span])
+            assigned.append((span, len(lanes) - 1))
+    return assigned
+
+
+tracer = Tracer(max_traces=TRACE_MAX_TRACES)
@@ -0,0 +1,19 @@
+from chatgpt_app.web.batch import BatchItem, HostLimiter, run_batch
+from chatgpt_app.web.extract import HtmlExtractor, get_extractor
+from chatgpt_app.web.fetch import FetchedPage, FetchError, HttpFetcher, get_http_fetcher
+from chatgpt_app.web.sitemap import expand_sitemap, is_sitemap_url, parse_sitemap
+
+__all__ = [
+    BatchItem,
+    FetchedPage,
+    FetchError,
+    HostLimiter,
+    HtmlExtractor,
+    HttpFetcher,
+    expand_sitemap,
+    get_extractor,
+    get_http_fetcher,
+    is_sitemap_url,
+    parse_sitemap,
+    run_batch,
+]
@@ -0,0 +1,88 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Iterator, List, Optional, TypeVar
+from urllib.parse import urlparse
+
+from chatgpt_app.logger import get_logger
+
+logger = get_logger(__name__)
+
+F = TypeVar("F")
+T = TypeVar("T")
+
+
+class HostLimiter:
+    """Allow at most ``max_per_host`` concurrent requests to the same host."""
+
+    def __init__(self, max_per_host: int) -> None:
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.Semaphore] = {}
+
+    @contextmanager
+    def limit(self, url: str) -> Iterator[None]:
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.Semaphore(self.max_per_host))
+        with semaphore:
+            yield
+
+
+@dataclass(frozen=True)
+class BatchItem(Generic[T]):
+    index: int
+    url: str
+    result: Optional[T]
+    error: Optional[str]
+    seconds: float
+
+
+def run_batch(
+    urls: List[str],
+    fetch: Callable[[str], F],
+    process: Callable[[str, F], T],
+    fetch_concurrency: int = 8,
+    max_per_host: int = 2,
+    process_concurrency: int = 4,
+) -> Iterator[BatchItem[T]]:
+    """Fetch and process every URL concurrently and yield the results in completion order.
+
+    At most ``fetch_concurrency`` fetches run at once (``max_per_host`` per host) and at most
+    ``process_concurrency`` ``process`` calls (e.g. LLM requests). A URL starts processing as soon as
+    its own fetch has finished, so fetching and summarizing overlap. Failures are reported per item.
+    The caller's context variables (current trace span, rate-limit session) are visible in the workers.
+    """
+    host_limiter = HostLimiter(max_per_host)
+    fetch_slots = threading.Semaphore(fetch_concurrency)
+    process_slots = threading.Semaphore(process_concurrency)
+
+    def run(index: int, url: str) -> BatchItem[T]:
+        started_at = time.perf_counter()
+        try:
+            with fetch_slots, host_limiter.limit(url):
+                fetched = fetch(url)
+            with process_slots:
+                result = process(url, fetched)
+            return BatchItem(index, url, result, None, time.perf_counter() - started_at)
+        except Exception as e:
+            logger.warning(f"batch item {url} failed: {e!r}")
+            return BatchItem(index, url, None, str(e) or repr(e), time.perf_counter() - started_at)
+
+    if not urls:
+        return
+    with ThreadPoolExecutor(
+        max_workers=min(len(urls), fetch_concurrency + process_concurrency), thread_name_prefix="batch"
+    ) as executor:
+        # タスクごとに呼び出し元のコンテキストを複製して渡す (同じ Context は複数スレッドで同時に使えない)
+        futures = [executor.submit(contextvars.copy_context().run, run, index, url) for index, url in enumerate(urls)]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # 途中で打ち切られた (rerun など) ときは、まだ始まっていない URL を捨てる
+            for future in futures:
+                future.cancel()
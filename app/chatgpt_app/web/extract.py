@@ -0,0 +1,217 @@
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple, Type
+
+from chatgpt_app.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml は任意依存
+    lxml = None
+
+# 本文ではないので丸ごと捨てる要素
+BOILERPLATE_TAGS = (
+    "head",
+    "title",
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "iframe",
+    "nav",
+    "header",
+    "footer",
+    "aside",
+    "form",
+    "button",
+)
+# 本文とみなす要素 (優先度順)
+CONTENT_TAGS = ("main", "article", "body")
+# 子要素を持たない要素 (HTMLParser 側で終了タグが来ない)
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+_SPACES = re.compile(r"[ \t\r\f\v　]+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse runs of spaces and drop blank lines."""
+    lines = (_SPACES.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+class HtmlExtractor:
+    """Extract the main text of an HTML document.
+
+    ``max_chars`` is a hint that the caller only needs the first ``max_chars`` characters;
+    extractors may stop parsing as soon as they have that much main-content text.
+    """
+
+    name = ""
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> str:
+        raise NotImplementedError("Please overwrite extract function.")
+
+
+class BeautifulSoupExtractor(HtmlExtractor):
+    """Reference implementation built on a full BeautifulSoup tree."""
+
+    name = "bs4"
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> str:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "lxml" if lxml is not None else "html.parser")
+        for element in soup.find_all(BOILERPLATE_TAGS):
+            element.decompose()
+        for tag in CONTENT_TAGS:
+            node = soup.find(tag)
+            if node is not None:
+                return normalize_text(node.get_text("\n"))[:max_chars]
+        return normalize_text(soup.get_text("\n"))[:max_chars]
+
+
+class LxmlExtractor(HtmlExtractor):
+    """Fast path: parse with libxml2 and read the text of the first content element."""
+
+    name = "lxml"
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> str:
+        if lxml is None:
+            raise ImportError("lxml is not installed")
+        if not html.strip():
+            return ""
+
+        try:
+            root = lxml.html.fromstring(html)
+        except ValueError:
+            # XML 宣言で encoding を指定している文書は bytes で渡す必要がある
+            root = lxml.html.fromstring(html.encode("utf-8"))
+        etree.strip_elements(root, *BOILERPLATE_TAGS, etree.Comment, with_tail=False)
+        node = root
+        for tag in CONTENT_TAGS:
+            found = root.find(f".//{tag}") if root.tag != tag else root
+            if found is not None:
+                node = found
+                break
+        return normalize_text("\n".join(node.itertext()))[:max_chars]
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _StreamingParser(HTMLParser):
+    def __init__(self, max_chars: Optional[int]) -> None:
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        # 要素名 -> [収集したテキスト片, 文字数]
+        self._texts: Dict[str, Tuple[List[str], List[int]]] = {tag: ([], [0]) for tag in CONTENT_TAGS}
+        self._open: Dict[str, int] = {tag: 0 for tag in CONTENT_TAGS}
+        self._seen: Dict[str, bool] = {tag: False for tag in CONTENT_TAGS}
+        # 読み飛ばしている定型要素と、その要素自身の入れ子の深さ
+        # (中の <li> や <p> は閉じられないことがあるので数えない)
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        # lxml の itertext と同じく、タグの境目でテキストを区切る
+        self._append("\n")
+        if tag in VOID_TAGS:
+            return
+        if tag in BOILERPLATE_TAGS:
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return
+        if tag in self._open:
+            # 最初に現れた main/article だけを本文として扱う
+            if not self._seen[tag] or self._open[tag]:
+                self._seen[tag] = True
+                self._open[tag] += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in VOID_TAGS:
+            return
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+                return
+            if tag not in ("body", "html"):
+                return
+            # 閉じられなかった定型要素は body の終わりで閉じる
+            self._skip_tag = None
+        self._append("\n")
+        if self._open.get(tag):
+            self._open[tag] -= 1
+            if tag != "body" and self._open[tag] == 0:
+                # main/article を読み終えたらそれ以上は不要
+                raise _StopParsing()
+
+    def handle_data(self, data: str) -> None:
+        if self._skip_tag is None:
+            self._append(data)
+
+    def _append(self, data: str) -> None:
+        for tag in CONTENT_TAGS:
+            # body は main/article が無かったときの予備なので常に集める
+            if tag == "body" or self._open[tag]:
+                chunks, length = self._texts[tag]
+                chunks.append(data)
+                length[0] += len(data)
+                if tag != "body" and self.max_chars is not None and length[0] >= self.max_chars * 2:
+                    # 空白の正規化で縮む分を見込んで多めに集めたら打ち切る
+                    raise _StopParsing()
+
+    def result(self) -> str:
+        for tag in CONTENT_TAGS:
+            if self._seen[tag] or tag == "body":
+                text = normalize_text("".join(self._texts[tag][0]))
+                if text or tag == "body":
+                    return text
+        return ""
+
+
+class StreamingExtractor(HtmlExtractor):
+    """SAX-style extractor on the standard library parser.
+
+    The document is fed in slices and parsing stops as soon as the first ``<main>``/``<article>``
+    has been read completely or has produced enough text for ``max_chars``, so unlike the tree
+    based extractors an ``<article>`` that precedes ``<main>`` wins.
+    All body text is kept as the fallback for pages without either element.
+    """
+
+    name = "streaming"
+
+    def __init__(self, feed_size: int = 16 * 1024) -> None:
+        self.feed_size = feed_size
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> str:
+        parser = _StreamingParser(max_chars)
+        try:
+            for start in range(0, len(html), self.feed_size):
+                parser.feed(html[start : start + self.feed_size])
+            parser.close()
+        except _StopParsing:
+            pass
+        return parser.result()[:max_chars]
+
+
+EXTRACTORS: Dict[str, Type[HtmlExtractor]] = {
+    extractor.name: extractor for extractor in (LxmlExtractor, StreamingExtractor, BeautifulSoupExtractor)
+}
+
+
+def get_extractor(name: str = "auto") -> HtmlExtractor:
+    """Return the extractor called ``name``; ``auto`` picks lxml when it is installed."""
+    if name == "auto":
+        name = LxmlExtractor.name if lxml is not None else StreamingExtractor.name
+    return EXTRACTORS[name]()
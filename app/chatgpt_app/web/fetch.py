@@ -0,0 +1,228 @@
+import atexit
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+import requests
+from chatgpt_app.logger import get_logger
+from chatgpt_app.settings import (
+    HTTP_CACHE_MAX_ENTRIES,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_BYTES,
+    HTTP_POOL_MAXSIZE,
+    HTTP_READ_TIMEOUT,
+    HTTP_TOTAL_TIMEOUT,
+)
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = get_logger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (compatible; chatgpt-app/0.1)"
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+_CHUNK_SIZE = 64 * 1024
+
+
+class FetchError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class FetchedPage:
+    url: str
+    status_code: int
+    # ヘッダー名の大文字小文字は区別しない (Etag と ETag など)
+    headers: Mapping[str, str]
+    content: bytes
+    encoding: str
+    truncated: bool = False
+    from_cache: bool = False
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+
+@dataclass
+class _CacheEntry:
+    page: FetchedPage
+    expires_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class HttpFetcher:
+    """Bounded HTTP GET with a shared connection pool and a private HTTP cache.
+
+    - connect/read timeouts plus an overall deadline for the whole download
+    - the body is streamed and cut off at ``max_bytes``
+    - responses are cached according to Cache-Control/Expires and revalidated with ETag/Last-Modified
+    """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        total_timeout: float = HTTP_TOTAL_TIMEOUT,
+        max_bytes: int = HTTP_MAX_BYTES,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        cache_max_entries: int = HTTP_CACHE_MAX_ENTRIES,
+    ) -> None:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+        self.session = session
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.cache_max_entries = cache_max_entries
+        self._cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str) -> FetchedPage:
+        now = time.time()
+        entry = self._get_cache_entry(url)
+        if entry is not None and entry.expires_at > now:
+            return replace(entry.page, from_cache=True)
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            with self.session.get(
+                url, headers=headers, stream=True, timeout=(self.connect_timeout, self.read_timeout)
+            ) as response:
+                if response.status_code == 304 and entry is not None:
+                    # 変更なし: 手元のコピーを鮮度を更新して返す
+                    entry.expires_at = _expires_at(response.headers, now)
+                    return replace(entry.page, from_cache=True)
+                response.raise_for_status()
+                content, truncated = self._read_body(response, now)
+                page = FetchedPage(
+                    url=response.url,
+                    status_code=response.status_code,
+                    headers=CaseInsensitiveDict(response.headers),
+                    content=content,
+                    encoding=_detect_encoding(response, content),
+                    truncated=truncated,
+                )
+        except requests.RequestException as e:
+            raise FetchError(f"failed to fetch {url}: {e}") from e
+
+        self._store(url, page, now)
+        return page
+
+    def _read_body(self, response: requests.Response, started_at: float) -> Tuple[bytes, bool]:
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.max_bytes:
+                logger.warning(f"{response.url} is larger than {self.max_bytes} bytes. Truncating.")
+                return b"".join(chunks)[: self.max_bytes], True
+            if time.time() - started_at > self.total_timeout:
+                raise FetchError(f"{response.url} did not finish within {self.total_timeout} seconds")
+        return b"".join(chunks), False
+
+    def _get_cache_entry(self, url: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is not None:
+                self._cache.move_to_end(url)
+            return entry
+
+    def _store(self, url: str, page: FetchedPage, now: float) -> None:
+        cache_control = _parse_cache_control(page.headers.get("Cache-Control", ""))
+        if "no-store" in cache_control:
+            return
+        etag = page.headers.get("ETag")
+        last_modified = page.headers.get("Last-Modified")
+        expires_at = _expires_at(page.headers, now)
+        if expires_at <= now and etag is None and last_modified is None:
+            # 鮮度も再検証手段もないものはキャッシュしても使えない
+            return
+
+        with self._lock:
+            self._cache[url] = _CacheEntry(page=page, expires_at=expires_at, etag=etag, last_modified=last_modified)
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def _expires_at(headers: Mapping[str, str], now: float) -> float:
+    cache_control = _parse_cache_control(headers.get("Cache-Control", ""))
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return now
+    max_age = cache_control.get("max-age")
+    if max_age is not None:
+        try:
+            age = float(headers.get("Age", 0))
+            return now + max(float(max_age) - age, 0.0)
+        except ValueError:
+            return now
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return now
+    return now
+
+
+def _detect_encoding(response: requests.Response, content: bytes) -> str:
+    # Content-Type に charset が明示されていればそれを使う (requests の text/* 既定値 ISO-8859-1 は使わない)
+    if "charset" in response.headers.get("Content-Type", "").lower() and response.encoding:
+        return response.encoding
+    match = _META_CHARSET.search(content[:4096])
+    if match:
+        encoding = match.group(1).decode("ascii")
+        try:
+            "".encode(encoding)
+            return encoding
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+_http_fetcher: Optional[HttpFetcher] = None
+_http_fetcher_lock = threading.Lock()
+
+
+def get_http_fetcher() -> HttpFetcher:
+    """Return the process-wide fetcher shared by every session."""
+    global _http_fetcher
+    with _http_fetcher_lock:
+        if _http_fetcher is None:
+            _http_fetcher = HttpFetcher()
+            atexit.register(_http_fetcher.close)
+        return _http_fetcher
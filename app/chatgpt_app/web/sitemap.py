@@ -0,0 +1,57 @@
+import xml.etree.ElementTree as ET
+from typing import List, Tuple
+
+from chatgpt_app.logger import get_logger
+from chatgpt_app.web.fetch import HttpFetcher
+
+logger = get_logger(__name__)
+
+SITEMAP_NAMESPACE = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def _is_sitemap_tag(element: ET.Element, name: str) -> bool:
+    # 名前空間なしか sitemap の名前空間のものだけ (<image:loc> などは除く)
+    return element.tag in (name, SITEMAP_NAMESPACE + name)
+
+
+def parse_sitemap(xml_text: str) -> Tuple[List[str], List[str]]:
+    """Return ``(page URLs, nested sitemap URLs)`` of a ``<urlset>`` or ``<sitemapindex>`` document."""
+    try:
+        root = ET.fromstring(xml_text)
+    except ET.ParseError as e:
+        raise ValueError(f"invalid sitemap: {e}") from e
+    entry = "sitemap" if _is_sitemap_tag(root, "sitemapindex") else "url"
+    locs = [
+        loc.text.strip()
+        for element in root
+        if _is_sitemap_tag(element, entry)
+        for loc in element
+        if _is_sitemap_tag(loc, "loc") and loc.text and loc.text.strip()
+    ]
+    if entry == "sitemap":
+        return [], locs
+    return locs, []
+
+
+def is_sitemap_url(url: str) -> bool:
+    path = url.split("?", 1)[0].lower()
+    return path.endswith(".xml") or "sitemap" in path.rsplit("/", 1)[-1]
+
+
+def expand_sitemap(fetcher: HttpFetcher, url: str, max_urls: int, max_depth: int = 2) -> List[str]:
+    """Collect up to ``max_urls`` page URLs from a sitemap, following sitemap indexes ``max_depth`` levels deep."""
+    urls: List[str] = []
+    pending = [(url, 0)]
+    seen = set()
+    while pending and len(urls) < max_urls:
+        sitemap_url, depth = pending.pop(0)
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        pages, sitemaps = parse_sitemap(fetcher.fetch(sitemap_url).text)
+        urls.extend(pages[: max_urls - len(urls)])
+        if depth < max_depth:
+            pending.extend((child, depth + 1) for child in sitemaps)
+        elif sitemaps:
+            logger.warning(f"{sitemap_url}: ignoring {len(sitemaps)} sitemaps nested deeper than {max_depth}")
+    return urls
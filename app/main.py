@@ -1,6 +1,18 @@
-import streamlit as st
-from chatgpt_app.init_app import init_app, init_pages, init_session
-from chatgpt_app.logger import get_logger
+import time
+
+_import_started_at = time.perf_counter()
+
+import streamlit as st  # noqa: E402
+from chatgpt_app.init_app import (  # noqa: E402
+    init_app,
+    init_pages,
+    init_session,
+    init_tokenizers,
+    report_startup_imports,
+)
+from chatgpt_app.logger import get_logger  # noqa: E402
+
+_import_seconds = time.perf_counter() - _import_started_at
 
 logger = get_logger(__name__)
 
@@ -8,8 +20,10 @@ logger = get_logger(__name__)
 if __name__ == "__main__":
     st.set_page_config(page_title="My Great ChatGPT", page_icon="🤗")
     if not st.session_state.get("is_started", False):  # 初期化しているかの確認
+        report_startup_imports(_import_seconds)
+        init_tokenizers()
         sm = init_session()
-        pages = init_pages(sm)
+        pages = init_pages()
         app = init_app(sm, pages)
         st.session_state["is_started"] = True
         st.session_state["app"] = app
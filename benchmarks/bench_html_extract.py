@@ -0,0 +1,66 @@
+"""Benchmark the HTML extractors against the saved pages in ``corpus/html``.
+
+    python benchmarks/bench_html_extract.py [--repeat 20] [--max-chars 1000]
+
+The baseline is what ``WebSummarizePage.get_content`` used to do: a full ``BeautifulSoup(html, "html.parser")``
+tree followed by ``get_text()`` of ``<main>``/``<article>``/``<body>``.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from chatgpt_app.web.extract import EXTRACTORS, lxml  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus" / "html"
+
+
+def baseline(html: str, max_chars: Optional[int] = None) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    if soup.main:
+        return soup.main.get_text()
+    elif soup.article:
+        return soup.article.get_text()
+    else:
+        return soup.body.get_text()
+
+
+def measure(func: Callable[[str, Optional[int]], str], html: str, max_chars: Optional[int], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html, max_chars)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-chars", type=int, default=1000)
+    args = parser.parse_args()
+
+    candidates: Dict[str, Callable[[str, Optional[int]], str]] = {"baseline(html.parser)": baseline}
+    for name, extractor_cls in EXTRACTORS.items():
+        if name == "lxml" and lxml is None:
+            continue
+        extractor = extractor_cls()
+        candidates[name] = extractor.extract
+        candidates[f"{name}(max_chars={args.max_chars})"] = lambda html, _, e=extractor: e.extract(html, args.max_chars)
+
+    for path in sorted(CORPUS_DIR.glob("*.html")):
+        html = path.read_text(encoding="utf-8")
+        print(f"{path.name} ({len(html) // 1024} KiB)")
+        base = measure(baseline, html, None, args.repeat)
+        for name, func in candidates.items():
+            elapsed = measure(func, html, None, args.repeat)
+            print(f"  {name:32} {elapsed * 1000:8.2f} ms  x{base / elapsed:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Chat model that streams a canned answer at a fixed rate, for benchmarks that must not touch the network."""
+import asyncio
+import time
+from typing import Any, List, Optional
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from langchain.schema.messages import BaseMessage
+
+
+class FakeStreamingChat(BaseChatModel):
+    """Answer with ``answer_tokens`` words taken from the prompt.
+
+    The first token arrives after ``first_token_latency`` seconds and the following ones at
+    ``tokens_per_second``. Exposes ``model_name``/``temperature`` like ``ChatOpenAI`` so that
+    the app's token counting works unchanged.
+    """
+
+    model_name: str = "gpt-3.5-turbo"
+    temperature: float = 0.0
+    streaming: bool = True
+    first_token_latency: float = 0.2
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 100
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        words = messages[-1].content.split() or ["summary"]
+        return [f"{words[i % len(words)]} " for i in range(self.answer_tokens)]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        started_at = time.perf_counter()
+        for i, token in enumerate(tokens):
+            # 締め切り基準で待つので、待ち時間の誤差が積み重ならない
+            delay = started_at + self.first_token_latency + i / self.tokens_per_second - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        started_at = time.perf_counter()
+        for i, token in enumerate(tokens):
+            delay = started_at + self.first_token_latency + i / self.tokens_per_second - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
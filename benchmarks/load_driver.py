@@ -0,0 +1,212 @@
+"""Headless load driver: N concurrent users running the chatbot and both summarizers.
+
+    python benchmarks/load_driver.py --users 20 --duration 60 --mix chat=3,web=1,youtube=1
+    python benchmarks/load_driver.py --users 20 --api-base http://127.0.0.1:8765/v1   # an already running stub
+
+Unless ``--api-base`` is given, an OpenAI stub (see ``openai_stub_server.py``) is started in-process and
+configured with the stub options. Every user runs the pages' LLM work (``scenarios.py``) through a real
+``ChatOpenAI`` client borrowed from the app's resource pool, so retries, streaming, connection reuse and
+token counting behave as in the app.
+Reports p50/p95/p99 latency and throughput per scenario, and optionally writes them as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "app"))
+
+# アプリの使用量台帳・キャッシュを汚さないよう、書き込み先を一時ディレクトリに向ける
+_tmp_dir = Path(tempfile.mkdtemp(prefix="chatgpt_app_load_"))
+os.environ.setdefault("CHATGPT_APP_USAGE_LEDGER_PATH", str(_tmp_dir / "usage.jsonl"))
+os.environ.setdefault("CHATGPT_APP_RESPONSE_CACHE_PATH", str(_tmp_dir / "responses.sqlite3"))
+# 毎回モデルを呼ぶよう回答キャッシュは使わない
+os.environ.setdefault("CHATGPT_APP_RESPONSE_CACHE_MAX_TEMPERATURE", "-1")
+os.environ.setdefault("CHATGPT_APP_CONVERSATION_STORE_PATH", str(_tmp_dir / "conversations.sqlite3"))
+# スタブはどのキーでも受け付ける
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from chatgpt_app.langchain_wrapper import ConversationContext, get_usage_ledger, tokenizer_registry  # noqa: E402
+from chatgpt_app.langchain_wrapper.token_cost_process import context_window  # noqa: E402
+from chatgpt_app.resource_pool import get_resource_pool  # noqa: E402
+from chatgpt_app.settings import TIKTOKEN_CACHE_DIR  # noqa: E402
+from chatgpt_app.web import HttpFetcher  # noqa: E402
+from fixture_server import serve_directory  # noqa: E402
+from langchain.chat_models import ChatOpenAI  # noqa: E402
+from openai_stub_server import add_config_arguments, config_from_args, serve  # noqa: E402
+from scenarios import COMPLETION_TOKENS, chat_turn, summarize_transcript, summarize_url  # noqa: E402
+
+HTML_DIR = BENCHMARKS_DIR / "corpus" / "html"
+TRANSCRIPT_DIR = BENCHMARKS_DIR / "corpus" / "transcripts"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, scenario: str, latency: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.latencies[scenario].append(latency)
+            else:
+                self.errors[scenario] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        scenarios = {}
+        for scenario in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[scenario])
+            scenarios[scenario] = {
+                "completed": len(latencies),
+                "errors": self.errors[scenario],
+                "throughput_per_second": len(latencies) / elapsed,
+                "p50_seconds": percentile(latencies, 50),
+                "p95_seconds": percentile(latencies, 95),
+                "p99_seconds": percentile(latencies, 99),
+                "max_seconds": latencies[-1] if latencies else 0.0,
+            }
+        return scenarios
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def run_user(
+    user_id: int,
+    llm: ChatOpenAI,
+    scenarios: Dict[str, Callable[[Dict[str, Any]], Any]],
+    mix: Dict[str, float],
+    deadline: float,
+    recorder: Recorder,
+    think_time: float,
+) -> None:
+    rng = random.Random(user_id)
+    # チャットの会話状態はユーザーごとに持ち回る
+    user_state: Dict[str, Any] = {"context": ConversationContext(llm.model_name, chat_budget(llm.model_name))}
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            scenarios[scenario](user_state)
+            recorder.record(scenario, time.perf_counter() - start, ok=True)
+        except Exception as e:
+            recorder.record(scenario, time.perf_counter() - start, ok=False)
+            print(f"user {user_id}: {scenario} failed: {e!r}", file=sys.stderr)
+        if think_time > 0:
+            time.sleep(rng.uniform(0, 2 * think_time))
+
+
+def chat_budget(model: str) -> int:
+    return min(context_window(model) - COMPLETION_TOKENS, 3000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--mix", default="chat=3,web=1,youtube=1")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean pause between actions (seconds)")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--api-base", default=None, help="use a running server instead of starting the stub")
+    parser.add_argument("--output", type=Path, default=None)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    tokenizer_registry.set_cache_dir(TIKTOKEN_CACHE_DIR)
+    mix = parse_mix(args.mix)
+    transcripts = [path.read_text(encoding="utf-8") for path in sorted(TRANSCRIPT_DIR.glob("*.txt"))]
+    pages = sorted(path.name for path in HTML_DIR.glob("*.html"))
+
+    with ExitStack() as stack:
+        stub = None
+        api_base = args.api_base
+        if api_base is None:
+            stub = stack.enter_context(serve(config_from_args(args)))
+            api_base = stub.api_base
+        base_url = stack.enter_context(serve_directory(HTML_DIR))
+        fetcher = HttpFetcher()
+
+        # アプリと同じく、全ユーザーでクライアントと接続プールを共有する
+        llm = get_resource_pool().chat_model(args.model, 0.0, api_base=api_base)
+        scenarios: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "chat": lambda state: chat_turn(llm, state["context"], "Please tell me more about that."),
+            "web": lambda state: summarize_url(llm, f"{base_url}/{random.choice(pages)}", fetcher),
+            "youtube": lambda state: summarize_transcript(llm, random.choice(transcripts)),
+        }
+        unknown = set(mix) - set(scenarios)
+        if unknown:
+            parser.error(f"unknown scenarios in --mix: {', '.join(sorted(unknown))}")
+
+        recorder = Recorder()
+        ledger = get_usage_ledger()
+        started_at = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(
+                target=run_user, args=(user_id, llm, scenarios, mix, deadline, recorder, args.think_time), daemon=True
+            )
+            for user_id in range(args.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+        fetcher.close()
+
+        usage = ledger.totals
+        report: Dict[str, Any] = {
+            "users": args.users,
+            "elapsed_seconds": elapsed,
+            "mix": mix,
+            "scenarios": recorder.report(elapsed),
+            "llm": {
+                "requests": usage.requests,
+                "requests_per_second": usage.requests / elapsed,
+                "completion_tokens_per_second": usage.completion_tokens / elapsed,
+                "mean_request_seconds": usage.duration / usage.requests if usage.requests else 0.0,
+            },
+        }
+        if stub is not None:
+            report["stub"] = dict(stub.counts)
+
+    for scenario, stats in report["scenarios"].items():
+        print(
+            f"{scenario:8} done={stats['completed']:5} errors={stats['errors']:4} "
+            f"{stats['throughput_per_second']:6.2f}/s  p50={stats['p50_seconds']:6.2f}s "
+            f"p95={stats['p95_seconds']:6.2f}s  p99={stats['p99_seconds']:6.2f}s"
+        )
+    print(json.dumps(report["llm"]))
+    if "stub" in report:
+        print(json.dumps(report["stub"]))
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Local stand-in for the OpenAI chat-completions API.
+
+    python benchmarks/openai_stub_server.py --port 8765 --first-token-latency 0.3 --tokens-per-second 40 \
+        --error-rate 0.01 --rate-limit-rate 0.05 --max-concurrency 64
+
+Point the app at it with ``CHATGPT_APP_OPENAI_API_BASE=http://127.0.0.1:8765/v1`` (any API key works).
+``POST /v1/chat/completions`` answers with words taken from the last message, streamed as server-sent
+events when ``"stream": true``. Failures are injected as 500 (``--error-rate``) and 429 (``--rate-limit-rate``,
+or whenever more than ``--max-concurrency`` requests are in flight).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+
+@dataclass
+class StubConfig:
+    first_token_latency: float = 0.3
+    # 最初のトークンまでの時間に加えるゆらぎ (秒, 一様分布)
+    latency_jitter: float = 0.1
+    tokens_per_second: float = 40.0
+    answer_tokens: int = 100
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    max_concurrency: Optional[int] = None
+
+
+class StubState:
+    def __init__(self, config: StubConfig) -> None:
+        self.config = config
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counts = {"connections": 0, "requests": 0, "errors": 0, "rate_limited": 0}
+        # ChatOpenAI の openai_api_base に渡す URL
+        self.api_base = ""
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counts[name] += 1
+
+
+def _make_handler(state: StubState) -> type:
+    config = state.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def setup(self) -> None:
+            super().setup()
+            # 接続の使い回しを確認できるよう、張られた接続の数を数える
+            state.count("connections")
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model"}]})
+            else:
+                self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+                return
+
+            state.count("requests")
+            with state.lock:
+                over_limit = config.max_concurrency is not None and state.in_flight >= config.max_concurrency
+                rate_limited = over_limit or random.random() < config.rate_limit_rate
+                if not rate_limited:
+                    state.in_flight += 1
+            if rate_limited:
+                state.count("rate_limited")
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}})
+                return
+            try:
+                if random.random() < config.error_rate:
+                    state.count("errors")
+                    self._send_json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+                    return
+                self._complete(body)
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _complete(self, body: Dict[str, Any]) -> None:
+            model = body.get("model", "gpt-3.5-turbo")
+            messages = body.get("messages") or [{"content": ""}]
+            words = str(messages[-1].get("content", "")).split() or ["ok"]
+            tokens = [
+                f"{words[i % len(words)]} " for i in range(min(body.get("max_tokens") or 10**9, config.answer_tokens))
+            ]
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            started_at = time.perf_counter()
+            first_token_at = started_at + config.first_token_latency + random.uniform(0, config.latency_jitter)
+
+            if not body.get("stream"):
+                time.sleep(max(0.0, first_token_at + len(tokens) / config.tokens_per_second - time.perf_counter()))
+                prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+                self._send_json(
+                    200,
+                    {
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": "".join(tokens)},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": len(tokens),
+                            "total_tokens": prompt_tokens + len(tokens),
+                        },
+                    },
+                )
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            # 本物の API と同じく chunked で返し、接続は keep-alive のままにする
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write(data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def chunk(delta: Dict[str, str], finish_reason: Optional[str] = None) -> None:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+            time.sleep(max(0.0, first_token_at - time.perf_counter()))
+            chunk({"role": "assistant"})
+            for i, token in enumerate(tokens):
+                # 締め切り基準で待つので、待ち時間の誤差が積み重ならない
+                time.sleep(max(0.0, first_token_at + i / config.tokens_per_second - time.perf_counter()))
+                chunk({"content": token})
+            chunk({}, finish_reason="stop")
+            write(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+@contextmanager
+def serve(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> Iterator[StubState]:
+    """Run the stub in a background thread and yield its state (``state.api_base`` is the URL to use)."""
+    state = StubState(config)
+    server = _Server((host, port), _make_handler(state))
+    state.api_base = f"http://{host}:{server.server_port}/v1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--latency-jitter", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        first_token_latency=args.first_token_latency,
+        latency_jitter=args.latency_jitter,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrency=args.max_concurrency,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with serve(config_from_args(args), args.host, args.port) as state:
+        print(f"serving the OpenAI stub at {state.api_base}  (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(10)
+                print(json.dumps(state.counts))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
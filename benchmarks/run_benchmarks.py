@@ -0,0 +1,351 @@
+"""Offline benchmark suite.
+
+    python benchmarks/run_benchmarks.py [--repeat 5] [--only tokens,callbacks] [--output out.json] [--compare old.json]
+
+Nothing here touches the network: LLM calls go to ``FakeStreamingChat`` and web pages are served from
+``corpus/html`` by a local HTTP server. The tiktoken BPE files must already be in ``TIKTOKEN_CACHE_DIR``
+(start the app once, or run ``init_tokenizers()`` with network access).
+
+Results are written as JSON; pass a previous result file to ``--compare`` to print the ratio per benchmark.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "app"))
+
+# アプリの使用量台帳・キャッシュを汚さないよう、書き込み先を一時ディレクトリに向ける
+_tmp_dir = Path(tempfile.mkdtemp(prefix="chatgpt_app_bench_"))
+os.environ.setdefault("CHATGPT_APP_USAGE_LEDGER_PATH", str(_tmp_dir / "usage.jsonl"))
+os.environ.setdefault("CHATGPT_APP_RESPONSE_CACHE_PATH", str(_tmp_dir / "responses.sqlite3"))
+# 毎回モデルを呼ぶよう回答キャッシュは使わない
+os.environ.setdefault("CHATGPT_APP_RESPONSE_CACHE_MAX_TEMPERATURE", "-1")
+os.environ.setdefault("CHATGPT_APP_CONVERSATION_STORE_PATH", str(_tmp_dir / "conversations.sqlite3"))
+os.environ.setdefault("CHATGPT_APP_VECTOR_INDEX_DIR", str(_tmp_dir / "vectors"))
+
+import streamlit as st  # noqa: E402
+from chatgpt_app.langchain_wrapper import (  # noqa: E402
+    ConversationContext,
+    StreamlitCostCalcHandler,
+    TokenChunker,
+    TokenCostHandler,
+    TokenCostProcess,
+    tokenizer_registry,
+)
+from chatgpt_app.langchain_wrapper.token_cost_process import (  # noqa: E402
+    _num_tokens_from_message,
+    context_window,
+    num_tokens_from_messages,
+)
+from chatgpt_app.settings import TIKTOKEN_CACHE_DIR  # noqa: E402
+from chatgpt_app.summarize import WebSummarizer  # noqa: E402
+from chatgpt_app.web import HttpFetcher, get_extractor  # noqa: E402
+from chatgpt_app.web.extract import EXTRACTORS, lxml  # noqa: E402
+from fake_llm import FakeStreamingChat  # noqa: E402
+from fixture_server import serve_directory  # noqa: E402
+from langchain.callbacks.base import BaseCallbackHandler  # noqa: E402
+from langchain.schema import AIMessage, ChatGeneration, HumanMessage, LLMResult, SystemMessage  # noqa: E402
+from langchain.schema.messages import BaseMessage  # noqa: E402
+from langchain.text_splitter import RecursiveCharacterTextSplitter  # noqa: E402
+from scenarios import COMPLETION_TOKENS, chat_turn, history_summarizer, summarize_url  # noqa: E402
+
+HTML_DIR = BENCHMARKS_DIR / "corpus" / "html"
+TRANSCRIPT_DIR = BENCHMARKS_DIR / "corpus" / "transcripts"
+MODEL = "gpt-3.5-turbo"
+
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Run ``func`` ``repeat`` times (after ``warmup`` untimed runs) and return timing statistics in milliseconds."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "min_ms": timings[0],
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "repeat": repeat,
+    }
+
+
+def result(name: str, params: Dict[str, Any], stats: Dict[str, float], **extra: Any) -> Dict[str, Any]:
+    return {"name": name, "params": params, **stats, **extra}
+
+
+def corpus_words() -> List[str]:
+    return (TRANSCRIPT_DIR / "lecture_en.txt").read_text(encoding="utf-8").split()
+
+
+def chat_history(num_messages: int, words: List[str], words_per_message: int = 40) -> List[BaseMessage]:
+    messages: List[BaseMessage] = [SystemMessage(content="You are a helpful assistant.")]
+    for i in range(num_messages):
+        start = (i * words_per_message) % (len(words) - words_per_message)
+        content = " ".join(words[start : start + words_per_message]) + f" ({i})"
+        messages.append(HumanMessage(content=content) if i % 2 == 0 else AIMessage(content=content))
+    return messages
+
+
+# -----------------------
+# benchmarks
+# -----------------------
+def bench_tokens(repeat: int) -> List[Dict[str, Any]]:
+    words = corpus_words()
+    process = TokenCostProcess(MODEL)
+    results = []
+    for num_messages in (10, 100, 1000):
+        messages = chat_history(num_messages, words)
+
+        def cold() -> None:
+            _num_tokens_from_message.cache_clear()
+            process.tokens_from_base_messages(messages)
+
+        params = {"messages": num_messages}
+        results.append(result("num_tokens_from_messages/cold", params, measure(cold, repeat)))
+        process.tokens_from_base_messages(messages)
+        warm = measure(lambda: process.tokens_from_base_messages(messages), repeat)
+        results.append(result("num_tokens_from_messages/warm", params, warm))
+    # 辞書を直接渡す経路 (キャッシュ済み)
+    dicts = [{"role": "user", "content": " ".join(words[i : i + 40])} for i in range(0, 4000, 40)]
+    results.append(
+        result(
+            "num_tokens_from_messages/dicts",
+            {"messages": len(dicts)},
+            measure(lambda: num_tokens_from_messages(dicts, MODEL), repeat),
+        )
+    )
+    return results
+
+
+def _drive_handler(handler: BaseCallbackHandler, tokens: List[str]) -> None:
+    run_id = uuid.uuid4()
+    messages = [[HumanMessage(content="benchmark")]]
+    try:
+        handler.on_chat_model_start({}, messages, run_id=run_id)
+    except NotImplementedError:
+        # CallbackManager と同じく on_llm_start にフォールバックする
+        handler.on_llm_start({}, ["benchmark"], run_id=run_id)
+    for token in tokens:
+        handler.on_llm_new_token(token, run_id=run_id)
+    answer = "".join(tokens)
+    handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content=answer))]]), run_id=run_id)
+
+
+def bench_callbacks(repeat: int) -> List[Dict[str, Any]]:
+    words = corpus_words()
+    factories: Dict[str, Callable[[], BaseCallbackHandler]] = {
+        "TokenCostHandler": lambda: TokenCostHandler(TokenCostProcess(MODEL)),
+        "StreamlitCostCalcHandler": lambda: StreamlitCostCalcHandler(st.container(), TokenCostProcess(MODEL)),
+        # バッファリングしない (トークンごとに描き直す) 場合との比較用
+        "StreamlitCostCalcHandler/unbuffered": lambda: StreamlitCostCalcHandler(
+            st.container(), TokenCostProcess(MODEL), flush_tokens=1, flush_growth=0.0
+        ),
+    }
+    results = []
+    for num_tokens in (500, 2000):
+        tokens = [f"{word} " for word in words[:num_tokens]]
+        for name, factory in factories.items():
+            stats = measure(lambda: _drive_handler(factory(), tokens), repeat)
+            per_token_us = stats["median_ms"] * 1000 / num_tokens
+            results.append(result(f"callback/{name}", {"tokens": num_tokens}, stats, per_token_us=per_token_us))
+    return results
+
+
+def bench_html(repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for path in sorted(HTML_DIR.glob("*.html")):
+        html = path.read_text(encoding="utf-8")
+        for name in EXTRACTORS:
+            if name == "lxml" and lxml is None:
+                continue
+            extractor = get_extractor(name)
+            params = {"page": path.name, "extractor": name}
+            results.append(result("html_extract", params, measure(lambda: extractor.extract(html), repeat)))
+    return results
+
+
+def bench_split(repeat: int) -> List[Dict[str, Any]]:
+    encoding = tokenizer_registry.get_encoding(MODEL)
+    results = []
+    for path in sorted(TRANSCRIPT_DIR.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+        for chunk_size in (300, 2000):
+            params = {"transcript": path.name, "chunk_size": chunk_size}
+            chunker = TokenChunker(encoding, chunk_size=chunk_size)
+            stats = measure(lambda: chunker.split_text(text), repeat)
+            results.append(result("transcript_split/TokenChunker", params, stats, chunks=len(chunker.split_text(text))))
+            # 以前の YouTube ページの分割方法
+            splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                model_name=MODEL, chunk_size=chunk_size, chunk_overlap=0
+            )
+            stats = measure(lambda: splitter.split_text(text), repeat)
+            results.append(result("transcript_split/RecursiveCharacterTextSplitter", params, stats))
+    return results
+
+
+def bench_summarize(repeat: int, llm: FakeStreamingChat) -> List[Dict[str, Any]]:
+    results = []
+    # キャッシュ無しの fetcher で毎回ローカルサーバーから取得する
+    fetcher = HttpFetcher(cache_max_entries=0)
+    with serve_directory(HTML_DIR) as base_url:
+        for path in sorted(HTML_DIR.glob("*.html")):
+            url = f"{base_url}/{path.name}"
+            calls = summarize_url(llm, url, fetcher)
+            stats = measure(lambda: summarize_url(llm, url, fetcher), repeat)
+            results.append(result("summarize_url", {"page": path.name}, stats, llm_calls=calls))
+    fetcher.close()
+    return results
+
+
+def bench_chat(repeat: int, llm: FakeStreamingChat) -> List[Dict[str, Any]]:
+    words = corpus_words()
+    budget = min(context_window(MODEL) - COMPLETION_TOKENS, 3000)
+    user_input = " ".join(words[:40])
+
+    results = []
+    for num_messages in (10, 100, 1000):
+        history = chat_history(num_messages, words)
+
+        def resume() -> None:
+            # 保存済みの会話を再開したときの最初のターン: 全履歴を取り込む
+            context = ConversationContext(MODEL, budget)
+            context.extend(history)
+            chat_turn(llm, context, user_input)
+
+        context = ConversationContext(MODEL, budget)
+        context.extend(history)
+        context.fold(history_summarizer(llm))
+
+        params = {"history_messages": num_messages}
+        results.append(result("chat_turn/resume", params, measure(resume, repeat)))
+        # 質問と回答の2件ずつ増えていく通常のターン
+        results.append(result("chat_turn/next", params, measure(lambda: chat_turn(llm, context, user_input), repeat)))
+    return results
+
+
+def bench_followup(repeat: int, llm: FakeStreamingChat) -> List[Dict[str, Any]]:
+    """A follow-up question about a transcript: the whole text in the prompt vs. the top-k indexed chunks."""
+    question = "What does the speaker say about the streaming output? ストリーミング出力について何と言っていますか？"
+    summarizer = WebSummarizer(llm)  # type: ignore
+    token_cost_process = TokenCostProcess(MODEL)
+    results = []
+    for path in sorted(TRANSCRIPT_DIR.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+
+        def full() -> List[BaseMessage]:
+            prompt = summarizer.prompts_loader.followup_question(text, question)
+            messages = [summarizer.system_message(), HumanMessage(content=prompt)]
+            llm(messages)
+            return messages
+
+        def retrieval() -> List[BaseMessage]:
+            # 最初の1回で索引を作り、以降は検索だけ
+            messages, _ = summarizer.followup_prompt(f"file:///{path.name}", text, question)
+            llm(messages)
+            return messages
+
+        for name, func in (("full", full), ("retrieval", retrieval)):
+            prompt_tokens = token_cost_process.tokens_from_base_messages(func())
+            stats = measure(func, repeat)
+            results.append(result(f"followup/{name}", {"transcript": path.name}, stats, prompt_tokens=prompt_tokens))
+    return results
+
+
+# -----------------------
+# runner
+# -----------------------
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+
+    def key(r: Dict[str, Any]) -> str:
+        return f"{r['name']} {json.dumps(r['params'], sort_keys=True)}"
+
+    previous = {key(r): r for r in baseline["results"]}
+    for r in results:
+        old = previous.get(key(r))
+        if old is not None and old["median_ms"] > 0:
+            ratio = r["median_ms"] / old["median_ms"]
+            print(f"{key(r):90} {old['median_ms']:10.2f} -> {r['median_ms']:10.2f} ms  x{ratio:5.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default="", help="comma separated benchmark names (default: all)")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None, help="previous result file to compare with")
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    tokenizer_registry.set_cache_dir(TIKTOKEN_CACHE_DIR)
+    llm = FakeStreamingChat(
+        model_name=MODEL,
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+    )
+    benchmarks: Dict[str, Callable[[], List[Dict[str, Any]]]] = {
+        "tokens": lambda: bench_tokens(args.repeat),
+        "callbacks": lambda: bench_callbacks(args.repeat),
+        "html": lambda: bench_html(args.repeat),
+        "split": lambda: bench_split(args.repeat),
+        "summarize": lambda: bench_summarize(args.repeat, llm),
+        "chat": lambda: bench_chat(args.repeat, llm),
+        "followup": lambda: bench_followup(args.repeat, llm),
+    }
+    selected = [name.strip() for name in args.only.split(",") if name.strip()] or list(benchmarks)
+
+    results = []
+    for name in selected:
+        print(f"running {name} ...", file=sys.stderr)
+        for r in benchmarks[name]():
+            print(f"  {r['name']:50} {json.dumps(r['params'], ensure_ascii=False):50} {r['median_ms']:10.2f} ms")
+            results.append(r)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": {key: str(value) for key, value in vars(args).items()},
+        },
+        "results": results,
+    }
+    output = args.output or BENCHMARKS_DIR / "results" / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"wrote {output}", file=sys.stderr)
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""The LLM work of each page without the Streamlit UI, shared by the benchmarks and the load driver."""
+from typing import Callable, List
+
+from chatgpt_app.langchain_wrapper import ConversationContext, TokenCostHandler, TokenCostProcess
+from chatgpt_app.summarize import WebSummarizer, YouTubeSummarizer
+from chatgpt_app.web import HttpFetcher
+from langchain.chat_models.base import BaseChatModel
+from langchain.docstore.document import Document
+from langchain.schema import HumanMessage
+from langchain.schema.messages import BaseMessage
+
+COMPLETION_TOKENS = 1024
+# Website Summarizer のスライダーの初期値
+SUMMARIZE_LENGTH = 300
+
+
+def summarize_url(llm: BaseChatModel, url: str, fetcher: HttpFetcher, summarize_length: int = SUMMARIZE_LENGTH) -> int:
+    """Fetch and summarize ``url`` with the Website Summarizer; return the number of final and map calls."""
+    summarizer = WebSummarizer(llm, fetcher=fetcher)  # type: ignore
+    content = summarizer.fetch_content(url)
+    parts: List[int] = []
+    summarizer.summarize_content(url, content, summarize_length, on_result=lambda index, _: parts.append(index))
+    return 1 + len(parts)
+
+
+def summarize_transcript(llm: BaseChatModel, text: str, chunk_size: int = 300) -> int:
+    """Split and summarize a transcript with the YouTube Summarizer; return the number of final and map calls."""
+    summarizer = YouTubeSummarizer(llm, chunk_size=chunk_size)  # type: ignore
+    documents = summarizer.split_documents([Document(page_content=text)])
+    parts: List[int] = []
+    summarizer.summarize_documents("transcript", documents, on_result=lambda index, _: parts.append(index))
+    return 1 + len(parts)
+
+
+def history_summarizer(llm: BaseChatModel) -> Callable[[str, List[BaseMessage]], str]:
+    def summarize(summary: str, messages: List[BaseMessage]) -> str:
+        conversation = "\n".join(message.content for message in messages)
+        return llm([HumanMessage(content=f"{summary}\n\n{conversation}")]).content
+
+    return summarize
+
+
+def chat_turn(llm: BaseChatModel, context: ConversationContext, user_input: str) -> List[BaseMessage]:
+    """Run one chat turn like the Chat Bot page and return the messages appended to the conversation."""
+    process = TokenCostProcess(llm.model_name, page="CHATBOT")
+    question = HumanMessage(content=user_input)
+    context.extend([question])
+    context.fold(history_summarizer(llm))
+    answer = llm(context.build_messages(), callbacks=[TokenCostHandler(process)])
+    context.extend([answer])
+    return [question, answer]
@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# アプリのパッケージは app/ 以下にある (streamlit run app/main.py と同じ import パス)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+# 設定は import 時に読まれるので、キャッシュや台帳の置き場所を先にテスト用へ向けておく
+os.environ.setdefault("CHATGPT_APP_CACHE_DIR", tempfile.mkdtemp(prefix="chatgpt_app_tests_"))
+os.environ.setdefault("CHATGPT_APP_RATE_LIMITS", "gpt=0:0,gpt-3.5-turbo=0:0,gpt-4=0:0")
+
+
+def _install_offline_encoding() -> None:
+    """Use a byte-level encoding when tiktoken cannot download its BPE files (no network).
+
+    Token counts then differ from the real ones, so tests only compare counts with each other.
+    """
+    import tiktoken
+    import tiktoken.registry
+
+    try:
+        tiktoken.get_encoding("cl100k_base")
+        return
+    except Exception:
+        pass
+    encoding = tiktoken.Encoding(
+        name="cl100k_base",
+        pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={"<|endoftext|>": 256},
+    )
+    for name in ("cl100k_base", "p50k_base", "r50k_base"):
+        tiktoken.registry.ENCODINGS[name] = encoding
+
+
+_install_offline_encoding()
+
+
+@pytest.fixture
+def encoding():
+    import tiktoken
+
+    return tiktoken.get_encoding("cl100k_base")
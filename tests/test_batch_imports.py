@@ -0,0 +1,13 @@
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+def test_batch_does_not_import_streamlit() -> None:
+    # テストのプロセスでは streamlit が読み込み済みなので、新しいインタープリターで確かめる
+    code = "import sys, chatgpt_app.batch; print('streamlit' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, capture_output=True, text=True, check=True)
+
+    assert output.stdout.strip() == "False"
@@ -0,0 +1,93 @@
+from typing import Any, List, Optional
+
+import pytest
+from chatgpt_app.const import PageId
+from chatgpt_app.langchain_wrapper import ConversationContext, GenerationBudget
+from chatgpt_app.pages.chatgpt import chatbot
+from chatgpt_app.pages.chatgpt.chatbot import ChatBotPage
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult, HumanMessage
+
+SUMMARY_TOKENS = [f"point{i} " for i in range(20)]
+
+
+class FakeSummaryChat(ChatOpenAI):
+    """ChatOpenAI that streams a fixed summary instead of calling the API, and counts its calls."""
+
+    calls: int = 0
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.calls += 1
+        for token in SUMMARY_TOKENS:
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(SUMMARY_TOKENS)))])
+
+
+class FakeSessionManager:
+    def __init__(self, messages: List[BaseMessage]) -> None:
+        self.messages = messages
+        self.context: Optional[ConversationContext] = None
+
+    def get_chat_context(self) -> Optional[ConversationContext]:
+        return self.context
+
+    def register_chat_context(self, context: ConversationContext) -> None:
+        self.context = context
+
+    def get_messages(self, start: int = 0) -> List[BaseMessage]:
+        return self.messages[start:]
+
+
+@pytest.fixture
+def llm() -> FakeSummaryChat:
+    # temperature > 0 なので要約はキャッシュされない
+    return FakeSummaryChat(model_name="gpt-3.5-turbo", temperature=1.0, openai_api_key="test", streaming=True)
+
+
+@pytest.fixture
+def page(monkeypatch: pytest.MonkeyPatch) -> ChatBotPage:
+    # 予算からあふれるよう、文脈の上限を小さくする
+    monkeypatch.setattr(chatbot, "CHAT_CONTEXT_MAX_TOKENS", 200)
+    messages: List[BaseMessage] = []
+    for i in range(20):
+        messages.append(HumanMessage(content=f"Question {i} about a fairly long topic of conversation."))
+        messages.append(AIMessage(content=f"Answer {i} that explains the topic in a few more words."))
+    return ChatBotPage(PageId.CHATBOT, "test", sm=FakeSessionManager(messages))
+
+
+def test_history_summary_counts_against_the_budget(llm: FakeSummaryChat, page: ChatBotPage) -> None:
+    budget = GenerationBudget(llm.model_name)
+
+    messages, cost = page.build_context(llm, budget)
+
+    assert llm.calls == 1 and cost > 0
+    assert "".join(SUMMARY_TOKENS) in messages[0].content
+    assert budget.completion_tokens == len(SUMMARY_TOKENS)
+
+
+def test_history_summary_stops_at_the_completion_cap(llm: FakeSummaryChat, page: ChatBotPage) -> None:
+    budget = GenerationBudget(llm.model_name, max_completion_tokens=5)
+
+    messages, cost = page.build_context(llm, budget)
+
+    assert llm.calls == 1 and budget.completion_tokens < len(SUMMARY_TOKENS)
+    # 要約はされず、あふれた発言はこのターンでは送らない
+    assert page.sm.context.summary == "" and page.sm.context.has_evicted
+    assert all("point0" not in message.content for message in messages)
+
+
+def test_stopped_turn_does_not_summarize(llm: FakeSummaryChat, page: ChatBotPage) -> None:
+    budget = GenerationBudget(llm.model_name)
+    budget.cancel()
+
+    page.build_context(llm, budget)
+
+    assert llm.calls == 0 and page.sm.context.has_evicted
@@ -0,0 +1,108 @@
+from typing import List
+
+from chatgpt_app.langchain_wrapper.conversation_context import ConversationContext
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+MODEL = "gpt-3.5-turbo"
+SYSTEM = SystemMessage(content="You are a helpful assistant.")
+
+
+def turns(count: int) -> List[BaseMessage]:
+    messages: List[BaseMessage] = []
+    for i in range(count):
+        messages.append(HumanMessage(content=f"Question number {i} about something fairly long."))
+        messages.append(AIMessage(content=f"Answer number {i} explaining that thing in a few words."))
+    return messages
+
+
+def tokens(messages: List[BaseMessage]) -> int:
+    return TokenCostProcess(MODEL).tokens_from_base_messages(messages)
+
+
+def test_history_within_budget_is_sent_as_is() -> None:
+    context = ConversationContext(MODEL, token_budget=10_000)
+    messages = [SYSTEM, *turns(3)]
+    context.extend(messages)
+
+    assert context.build_messages() == messages
+    assert context.total_tokens == tokens(messages)
+    assert not context.has_evicted and context.num_messages == 7
+
+
+def test_oldest_messages_are_evicted_to_fit_the_budget() -> None:
+    messages = [SYSTEM, *turns(10)]
+    budget = tokens(messages) // 2
+    context = ConversationContext(MODEL, token_budget=budget)
+    context.extend(messages)
+
+    built = context.build_messages()
+    assert context.has_evicted
+    assert built[0] is SYSTEM and built[-2:] == messages[-2:]
+    assert built[1:] == messages[len(messages) - len(built) + 1 :]
+    assert context.total_tokens == tokens(built) <= budget
+
+
+def test_recent_messages_are_kept_even_over_budget() -> None:
+    context = ConversationContext(MODEL, token_budget=1, min_recent_messages=2)
+    messages = [SYSTEM, *turns(2)]
+    context.extend(messages)
+
+    assert context.build_messages() == [SYSTEM, *messages[-2:]]
+
+
+def test_extending_turn_by_turn_matches_extending_at_once() -> None:
+    messages = [SYSTEM, *turns(10)]
+    budget = tokens(messages) // 2
+    at_once = ConversationContext(MODEL, token_budget=budget)
+    at_once.extend(messages)
+    by_turn = ConversationContext(MODEL, token_budget=budget)
+    for i in range(0, len(messages), 2):
+        by_turn.extend(messages[i : i + 2])
+
+    assert by_turn.build_messages() == at_once.build_messages()
+    assert by_turn.total_tokens == at_once.total_tokens
+
+
+def test_fold_summarizes_the_evicted_messages() -> None:
+    messages = [SYSTEM, *turns(10)]
+    context = ConversationContext(MODEL, token_budget=tokens(messages) // 2)
+    context.extend(messages)
+    folded: List[List[BaseMessage]] = []
+
+    def summarize(summary: str, evicted: List[BaseMessage]) -> str:
+        folded.append(evicted)
+        return "They talked about questions."
+
+    context.fold(summarize)
+    built = context.build_messages()
+
+    assert folded[0] == messages[1 : len(folded[0]) + 1]
+    assert context.summary == "They talked about questions."
+    assert built[0] is SYSTEM and "They talked about questions." in built[1].content
+    assert context.total_tokens == tokens(built) <= context.token_budget
+
+    # 要約が増えた分で追い出されたメッセージは次の fold で続きから畳み込む
+    context.fold(summarize)
+    assert folded[1:] == [] or folded[1][0] is messages[len(folded[0]) + 1]
+    assert not context.has_evicted
+
+
+def test_fold_without_evicted_messages_does_nothing() -> None:
+    context = ConversationContext(MODEL, token_budget=10_000)
+    context.extend([SYSTEM, *turns(1)])
+
+    context.fold(lambda summary, evicted: "unused")
+
+    assert context.summary == ""
+
+
+def test_rebudget_evicts_for_a_smaller_budget() -> None:
+    messages = [SYSTEM, *turns(10)]
+    context = ConversationContext(MODEL, token_budget=10_000)
+    context.extend(messages)
+
+    context.rebudget(MODEL, tokens(messages) // 2)
+
+    assert context.has_evicted
+    assert context.total_tokens <= context.token_budget
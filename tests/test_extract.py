@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pytest
+from chatgpt_app.web.extract import get_extractor
+
+lxml = pytest.importorskip("lxml")
+
+CORPUS = sorted((Path(__file__).resolve().parent.parent / "benchmarks" / "corpus" / "html").glob("*.html"))
+
+DOCUMENTS = {
+    "unclosed_li_in_nav": "<nav><ul><li>Home<li>About</ul></nav><main><p>Important article text here.</p></main>",
+    "unclosed_p_in_header": "<body><header><p>Site name<p>Tagline</header><p>Body text.</p></body>",
+    "nested_boilerplate": (
+        "<body><header><nav><ul><li>Home</ul></nav><div>Logo</div></header>"
+        "<article><h1>Title</h1><p>First<p>Second</article></body>"
+    ),
+    "nested_same_tag": "<body><div><div>Ad</div></div><aside>One<aside>Two</aside>Three</aside><p>Text</p></body>",
+    "unclosed_boilerplate": "<html><body><p>Text</p><footer><p>Copyright</body></html>",
+    "no_content_element": "<html><body><nav>Menu</nav><p>Just a paragraph.</p><footer>Footer</footer></body></html>",
+}
+
+
+@pytest.mark.parametrize("html", DOCUMENTS.values(), ids=DOCUMENTS.keys())
+def test_streaming_matches_lxml(html: str) -> None:
+    assert get_extractor("streaming").extract(html) == get_extractor("lxml").extract(html)
+
+
+def test_streaming_keeps_main_after_unclosed_nav_items() -> None:
+    html = DOCUMENTS["unclosed_li_in_nav"]
+    assert get_extractor("streaming").extract(html) == "Important article text here."
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=[path.name for path in CORPUS])
+def test_streaming_matches_lxml_on_corpus(path: Path) -> None:
+    html = path.read_text(encoding="utf-8")
+    assert get_extractor("streaming").extract(html) == get_extractor("lxml").extract(html)
+
+
+def test_max_chars() -> None:
+    html = "<main>" + "<p>word</p>" * 1000 + "</main>"
+    for name in ("lxml", "streaming"):
+        assert get_extractor(name).extract(html, max_chars=20) == "word\nword\nword\nword\n"[:20]
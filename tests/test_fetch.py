@@ -0,0 +1,139 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Tuple
+
+import pytest
+from chatgpt_app.web.fetch import FetchError, HttpFetcher
+
+BODY = b"<html><body><p>hello</p></body></html>"
+
+
+class Server:
+    """Local HTTP server whose response headers are set per test; it records the request headers."""
+
+    def __init__(self) -> None:
+        self.response_headers: List[Tuple[str, str]] = []
+        self.not_modified_if: Dict[str, str] = {}
+        self.status = 200
+        self.body = BODY
+        self.requests: List[Dict[str, str]] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                server.requests.append(dict(self.headers))
+                not_modified = any(self.headers.get(name) == value for name, value in server.not_modified_if.items())
+                self.send_response(304 if not_modified else server.status)
+                for name, value in server.response_headers:
+                    # ヘッダー名はテストで指定したとおりの大文字小文字で送る
+                    self.send_header(name, value)
+                body = b"" if not_modified else server.body
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/page"
+
+
+@pytest.fixture
+def server() -> Iterator[Server]:
+    server = Server()
+    thread = threading.Thread(target=server.httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def fetcher() -> Iterator[HttpFetcher]:
+    fetcher = HttpFetcher()
+    yield fetcher
+    fetcher.close()
+
+
+@pytest.mark.parametrize("etag_header", ["ETag", "Etag", "etag"])
+def test_revalidates_with_etag(server: Server, fetcher: HttpFetcher, etag_header: str) -> None:
+    server.response_headers = [(etag_header, '"v1"'), ("cache-control", "no-cache")]
+    server.not_modified_if = {"If-None-Match": '"v1"'}
+
+    first = fetcher.fetch(server.url)
+    second = fetcher.fetch(server.url)
+
+    assert first.content == BODY and not first.from_cache
+    assert second.content == BODY and second.from_cache
+    assert len(server.requests) == 2
+    assert server.requests[1].get("If-None-Match") == '"v1"'
+
+
+def test_revalidates_with_last_modified(server: Server, fetcher: HttpFetcher) -> None:
+    last_modified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    server.response_headers = [("last-modified", last_modified)]
+    server.not_modified_if = {"If-Modified-Since": last_modified}
+
+    fetcher.fetch(server.url)
+    second = fetcher.fetch(server.url)
+
+    assert second.from_cache
+    assert server.requests[1].get("If-Modified-Since") == last_modified
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [[("cache-control", "max-age=60")], [("EXPIRES", "Fri, 01 Jan 2100 00:00:00 GMT")]],
+    ids=["max-age", "expires"],
+)
+def test_fresh_response_is_served_from_cache(server: Server, fetcher: HttpFetcher, headers: List) -> None:
+    server.response_headers = headers
+
+    fetcher.fetch(server.url)
+    second = fetcher.fetch(server.url)
+
+    assert second.from_cache and second.content == BODY
+    assert len(server.requests) == 1
+
+
+def test_no_store_is_not_cached(server: Server, fetcher: HttpFetcher) -> None:
+    server.response_headers = [("Etag", '"v1"'), ("cache-control", "no-store")]
+    server.not_modified_if = {"If-None-Match": '"v1"'}
+
+    fetcher.fetch(server.url)
+    second = fetcher.fetch(server.url)
+
+    assert not second.from_cache
+    assert "If-None-Match" not in server.requests[1]
+
+
+def test_changed_response_replaces_cached_copy(server: Server, fetcher: HttpFetcher) -> None:
+    server.response_headers = [("Etag", '"v1"')]
+    fetcher.fetch(server.url)
+    server.response_headers = [("Etag", '"v2"')]
+    server.body = b"<p>changed</p>"
+    server.not_modified_if = {"If-None-Match": '"v2"'}
+
+    second = fetcher.fetch(server.url)
+
+    assert second.content == b"<p>changed</p>" and not second.from_cache
+    assert fetcher.fetch(server.url).from_cache
+
+
+def test_body_is_truncated(server: Server) -> None:
+    server.body = b"x" * 1000
+    fetcher = HttpFetcher(max_bytes=100)
+    try:
+        page = fetcher.fetch(server.url)
+    finally:
+        fetcher.close()
+
+    assert page.truncated and page.content == b"x" * 100
+
+
+def test_error_status_raises(server: Server, fetcher: HttpFetcher) -> None:
+    server.status = 404
+
+    with pytest.raises(FetchError):
+        fetcher.fetch(server.url)
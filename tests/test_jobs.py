@@ -0,0 +1,163 @@
+import threading
+from typing import Any, Callable, Iterator
+
+import pytest
+from chatgpt_app.jobs import Job, JobExecutor, JobStatus
+
+
+@pytest.fixture
+def executor() -> Iterator[JobExecutor]:
+    executor = JobExecutor(max_workers=2, max_finished=3)
+    yield executor
+    executor.shutdown()
+
+
+def wait_done(job: Job, timeout: float = 5.0) -> None:
+    for _ in range(int(timeout / 0.01)):
+        if job.done:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job {job.title!r} did not finish")
+
+
+def blocking(release: threading.Event, result: Any = "partial") -> Callable[[Job], Any]:
+    """Job function that runs until it is cancelled or released, like a summary checking its budget."""
+
+    def func(job: Job) -> Any:
+        while not release.is_set() and not job.cancelled:
+            threading.Event().wait(0.01)
+        return result
+
+    return func
+
+
+def test_submit_attaches_to_the_running_job(executor: JobExecutor) -> None:
+    calls = []
+    release = threading.Event()
+
+    def func(job: Job) -> str:
+        calls.append(job.id)
+        release.wait(5)
+        return "summary"
+
+    first = executor.submit("key", "title", func, owner="a")
+    second = executor.submit("key", "title", func, owner="b")
+    release.set()
+    wait_done(first)
+
+    assert first is second and len(calls) == 1
+    assert first.status is JobStatus.DONE and first.result == "summary"
+
+
+def test_failed_job_is_replaced(executor: JobExecutor) -> None:
+    def fail(job: Job) -> None:
+        raise RuntimeError("boom")
+
+    failed = executor.submit("key", "title", fail, owner="a")
+    wait_done(failed)
+    retried = executor.submit("key", "title", lambda job: "ok", owner="a")
+    wait_done(retried)
+
+    assert failed.status is JobStatus.FAILED and failed.error == "boom"
+    assert retried is not failed and retried.result == "ok"
+
+
+def test_cancel_stops_a_job_of_one_session(executor: JobExecutor) -> None:
+    job = executor.submit("key", "title", blocking(threading.Event()), owner="a")
+
+    assert executor.cancel("a") == 1
+    wait_done(job)
+
+    assert job.status is JobStatus.STOPPED and job.result == "partial"
+    assert executor.cancel("a") == 0
+
+
+def test_shared_job_runs_until_every_session_cancels(executor: JobExecutor) -> None:
+    job = executor.submit("key", "title", blocking(threading.Event()), owner="a")
+    executor.submit("key", "title", blocking(threading.Event()), owner="b")
+
+    executor.cancel("a")
+    threading.Event().wait(0.05)
+    assert not job.done and not job.cancelled
+
+    executor.cancel("b")
+    wait_done(job)
+    assert job.status is JobStatus.STOPPED
+
+
+def test_cancel_ignores_jobs_of_other_sessions(executor: JobExecutor) -> None:
+    release = threading.Event()
+    job = executor.submit("key", "title", blocking(release), owner="a")
+
+    assert executor.cancel("b") == 0
+    release.set()
+    wait_done(job)
+
+    assert job.status is JobStatus.DONE
+
+
+def test_stopped_job_is_kept_for_its_sessions_and_rerun_for_others(executor: JobExecutor) -> None:
+    stopped = executor.submit("key", "title", blocking(threading.Event()), owner="a")
+    executor.cancel("a")
+    wait_done(stopped)
+
+    assert executor.submit("key", "title", lambda job: "full", owner="a") is stopped
+    rerun = executor.submit("key", "title", lambda job: "full", owner="b")
+    wait_done(rerun)
+
+    assert rerun is not stopped and rerun.status is JobStatus.DONE and rerun.result == "full"
+
+
+def test_discard_runs_a_stopped_job_again(executor: JobExecutor) -> None:
+    stopped = executor.submit("key", "title", blocking(threading.Event()), owner="a")
+    executor.cancel("a")
+    wait_done(stopped)
+
+    executor.discard("key")
+    rerun = executor.submit("key", "title", lambda job: "full", owner="a")
+    wait_done(rerun)
+
+    assert rerun is not stopped and rerun.result == "full"
+
+
+def test_pending_job_cancelled_before_start_never_runs(executor: JobExecutor) -> None:
+    release = threading.Event()
+    busy = [executor.submit(f"busy{i}", "busy", blocking(release), owner="other") for i in range(2)]
+    calls = []
+    pending = executor.submit("key", "title", lambda job: calls.append(job), owner="a")
+
+    executor.cancel("a")
+    release.set()
+    wait_done(pending)
+
+    assert pending.status is JobStatus.STOPPED and pending.result is None and not calls
+    assert all(job.status is JobStatus.DONE for job in busy)
+
+
+def test_claim_once_for_the_owner(executor: JobExecutor) -> None:
+    job = executor.submit("key", "title", lambda job: "summary", owner="a")
+    wait_done(job)
+
+    assert not job.claim("b")
+    assert job.claim("a")
+    assert not job.claim("a")
+
+
+def test_claim_needs_a_result(executor: JobExecutor) -> None:
+    job = executor.submit("key", "title", lambda job: None, owner="a")
+    wait_done(job)
+
+    assert not job.claim("a")
+
+
+def test_prune_keeps_the_latest_finished_jobs(executor: JobExecutor) -> None:
+    for i in range(5):
+        wait_done(executor.submit(i, f"job{i}", lambda job: "ok", owner="a"))
+    # 完了した worker が最後に刈り込むのを待つ
+    for _ in range(100):
+        if len(executor.jobs()) <= 3:
+            break
+        threading.Event().wait(0.01)
+
+    assert [job.key for job in executor.jobs()] == [2, 3, 4]
+    assert executor.get(0) is None
@@ -0,0 +1,71 @@
+from typing import Callable, List, Tuple
+
+import pytest
+from chatgpt_app.langchain_wrapper.map_reduce import MapReduceSummarizer
+from chatgpt_app.langchain_wrapper.token_cost_process import TokenCostProcess
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import HumanMessage
+
+
+def build_prompt(text: str) -> List[HumanMessage]:
+    return [HumanMessage(content=text)]
+
+
+def summarizer(
+    monkeypatch: pytest.MonkeyPatch, summarize: Callable[[str], str]
+) -> Tuple[MapReduceSummarizer, List[int]]:
+    """MapReduceSummarizer whose map calls ``summarize`` on each text instead of the API."""
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", openai_api_key="test")
+    summarizer = MapReduceSummarizer(llm, TokenCostProcess("gpt-3.5-turbo"))
+    # map ごとの呼び出し件数
+    calls: List[int] = []
+
+    def map(texts: List[str], *args: object, **kwargs: object) -> List[str]:
+        calls.append(len(texts))
+        return [summarize(text) for text in texts]
+
+    monkeypatch.setattr(summarizer, "map", map)
+    return summarizer, calls
+
+
+def tokens(summarizer: MapReduceSummarizer, texts: List[str]) -> int:
+    return sum(summarizer.token_cost_process.tokens_from_string(text) for text in texts)
+
+
+def test_summaries_within_budget_are_kept(monkeypatch: pytest.MonkeyPatch) -> None:
+    mr, calls = summarizer(monkeypatch, lambda text: "short")
+    summaries = ["one", "two"]
+
+    assert mr.collapse(summaries, build_prompt, 100) == summaries
+    assert calls == []
+
+
+def test_groups_are_merged_until_they_fit(monkeypatch: pytest.MonkeyPatch) -> None:
+    mr, calls = summarizer(monkeypatch, lambda text: text[:10])
+    summaries = ["x" * 40] * 8
+
+    result = mr.collapse(summaries, build_prompt, 100)
+
+    assert tokens(mr, result) <= 100
+    assert calls[0] == 4
+
+
+def test_summaries_too_long_to_group_are_truncated_and_paired(monkeypatch: pytest.MonkeyPatch) -> None:
+    # 要約が入力をそのまま返しても、切り詰めて2件ずつまとめるので必ず終わる
+    mr, calls = summarizer(monkeypatch, lambda text: text)
+    summaries = ["y" * 90] * 5
+
+    result = mr.collapse(summaries, build_prompt, 100)
+
+    assert tokens(mr, result) <= 100
+    assert calls[0] == 3
+
+
+def test_single_summary_over_budget_is_truncated(monkeypatch: pytest.MonkeyPatch) -> None:
+    mr, calls = summarizer(monkeypatch, lambda text: text)
+
+    result = mr.collapse(["z" * 500], build_prompt, 100)
+
+    assert len(result) == 1 and tokens(mr, result) <= 100
+    assert "z" * 500 != result[0] and ("z" * 500).startswith(result[0])
+    assert calls == []
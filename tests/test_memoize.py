@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from chatgpt_app.memoize import SingleFlightCache
+
+
+def test_concurrent_misses_compute_once() -> None:
+    cache: SingleFlightCache[str] = SingleFlightCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls: List[int] = []
+
+    def compute() -> str:
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "summary"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        first = pool.submit(cache.get_or_compute, "key", compute)
+        started.wait(5)
+        others = [pool.submit(cache.get_or_compute, "key", compute) for _ in range(3)]
+        release.set()
+        results = [first.result(5)] + [future.result(5) for future in others]
+
+    assert len(calls) == 1
+    assert results[0] == ("summary", True)
+    assert results[1:] == [("summary", False)] * 3
+
+
+def test_cached_value_is_returned_without_computing() -> None:
+    cache: SingleFlightCache[str] = SingleFlightCache()
+    cache.get_or_compute("key", lambda: "summary")
+
+    assert cache.get("key") == "summary"
+    assert cache.get_or_compute("key", lambda: "other") == ("summary", False)
+
+
+def test_failed_compute_is_retried_by_a_waiter() -> None:
+    cache: SingleFlightCache[str] = SingleFlightCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def interrupted() -> Optional[str]:
+        started.set()
+        release.wait(5)
+        raise RuntimeError("rerun")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(cache.get_or_compute, "key", interrupted)
+        started.wait(5)
+        waiter = pool.submit(cache.get_or_compute, "key", lambda: "summary")
+        release.set()
+
+        assert isinstance(first.exception(5), RuntimeError)
+        # 待っていた側が自分で計算し直す
+        assert waiter.result(5) == ("summary", True)
+    assert cache.get("key") == "summary"
+
+
+def test_none_is_not_cached() -> None:
+    cache: SingleFlightCache[str] = SingleFlightCache()
+
+    assert cache.get_or_compute("key", lambda: None) == (None, True)
+    assert cache.get("key") is None
+    assert cache.get_or_compute("key", lambda: "summary") == ("summary", True)
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    cache: SingleFlightCache[str] = SingleFlightCache(max_entries=2)
+    cache.get_or_compute("a", lambda: "A")
+    cache.get_or_compute("b", lambda: "B")
+    cache.get("a")
+    cache.get_or_compute("c", lambda: "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
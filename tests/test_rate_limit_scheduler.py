@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, List
+
+import openai
+import pytest
+from chatgpt_app.langchain_wrapper import rate_limit_scheduler
+from chatgpt_app.langchain_wrapper.rate_limit_scheduler import (
+    RateLimitScheduler,
+    ScheduledChatCompletion,
+    parse_rate_limits,
+    set_rate_limit_session,
+)
+
+MODEL = "gpt-3.5-turbo"
+
+
+@pytest.fixture
+def max_jitter(monkeypatch: pytest.MonkeyPatch) -> None:
+    # jitter の上限を返すようにして待ち時間を決め打ちにする
+    monkeypatch.setattr(rate_limit_scheduler.random, "uniform", lambda low, high: high)
+
+
+def test_parse_rate_limits() -> None:
+    assert parse_rate_limits("gpt-4=200:40000, gpt-3.5-turbo=3500:90000,") == {
+        "gpt-4": (200.0, 40000.0),
+        "gpt-3.5-turbo": (3500.0, 90000.0),
+    }
+
+
+def test_limits_match_the_longest_model_prefix() -> None:
+    scheduler = RateLimitScheduler({"gpt-4": (10, 0), "gpt-4-32k": (5, 0)})
+
+    assert scheduler._get_limiter("gpt-4-32k-0613").requests.capacity == 5
+    assert scheduler._get_limiter("gpt-4-0613").requests.capacity == 10
+    assert scheduler._get_limiter("other").requests.unlimited
+
+
+def test_waiting_requests_take_turns_across_sessions() -> None:
+    # 20 requests/秒。バケツを空にしてから並べるので 1 件ずつ順番に通る
+    scheduler = RateLimitScheduler({MODEL: (1200, 0)}, backoff_base=0)
+    scheduler.report_rate_limited(MODEL)
+    granted: List[str] = []
+
+    async def request(session: str) -> None:
+        set_rate_limit_session(session)
+        await scheduler.aacquire(MODEL, 1)
+        granted.append(session)
+
+    async def main() -> None:
+        await asyncio.gather(*(request(session) for session in ["a", "a", "a", "b"]))
+
+    asyncio.run(main())
+
+    assert granted == ["a", "b", "a", "a"]
+
+
+def test_rate_limit_pauses_the_model(max_jitter: None) -> None:
+    scheduler = RateLimitScheduler({MODEL: (0, 0)}, backoff_base=0.05, backoff_max=1)
+
+    backoff = scheduler.report_rate_limited(MODEL)
+    waited = scheduler.acquire(MODEL, 1)
+
+    assert backoff == pytest.approx(0.1)
+    assert waited >= 0.09
+    assert scheduler.acquire(MODEL, 1) < 0.05
+
+
+def test_backoff_grows_until_a_success(max_jitter: None) -> None:
+    scheduler = RateLimitScheduler(backoff_base=0.01, backoff_max=0.05)
+
+    first = scheduler.report_rate_limited(MODEL)
+    # 同じ待ちの間に返ってきた 429 では待ち時間を延ばさない
+    parallel = scheduler.report_rate_limited(MODEL)
+    scheduler.acquire(MODEL, 1)
+    second = scheduler.report_rate_limited(MODEL)
+    scheduler.acquire(MODEL, 1)
+    third = scheduler.report_rate_limited(MODEL)
+    scheduler.report_success(MODEL)
+    scheduler.acquire(MODEL, 1)
+    after_success = scheduler.report_rate_limited(MODEL)
+
+    assert first == pytest.approx(0.02)
+    assert parallel <= first
+    assert second == pytest.approx(0.04)
+    assert third == pytest.approx(0.05)
+    assert after_success == pytest.approx(0.02)
+    assert scheduler.rate_limited == 5
+
+
+def test_retry_after_header_is_the_minimum_pause(max_jitter: None) -> None:
+    scheduler = RateLimitScheduler(backoff_base=0.01, backoff_max=0.05)
+
+    assert scheduler.report_rate_limited(MODEL, retry_after=0.2) == pytest.approx(0.2)
+
+
+class FlakyClient:
+    """``openai.ChatCompletion`` stand-in that fails with the given errors before answering."""
+
+    def __init__(self, errors: List[Exception]) -> None:
+        self.errors = errors
+        self.calls = 0
+
+    def create(self, **kwargs: Any) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "response"
+
+
+def rate_limit_error(retry_after: str = "0") -> openai.error.RateLimitError:
+    return openai.error.RateLimitError("rate limited", headers={"retry-after": retry_after})
+
+
+def test_scheduled_completion_retries_after_rate_limit(max_jitter: None) -> None:
+    scheduler = RateLimitScheduler(backoff_base=0.001, backoff_max=0.01)
+    client = FlakyClient([rate_limit_error(), openai.error.APIConnectionError("reset")])
+    completion = ScheduledChatCompletion(scheduler, client, max_retries=3)
+
+    assert completion.create(model=MODEL, messages=[{"role": "user", "content": "hi"}]) == "response"
+    assert client.calls == 3 and scheduler.rate_limited == 1
+
+
+def test_scheduled_completion_gives_up_after_max_retries(max_jitter: None) -> None:
+    scheduler = RateLimitScheduler(backoff_base=0.001, backoff_max=0.01)
+    client = FlakyClient([rate_limit_error(), rate_limit_error()])
+    completion = ScheduledChatCompletion(scheduler, client, max_retries=2)
+
+    with pytest.raises(openai.error.RateLimitError):
+        completion.create(model=MODEL, messages=[{"role": "user", "content": "hi"}])
+    assert client.calls == 2
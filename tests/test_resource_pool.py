@@ -0,0 +1,40 @@
+import openai
+import pytest
+from chatgpt_app.resource_pool import ResourcePool
+from openai.api_requestor import MAX_CONNECTION_RETRIES
+
+
+@pytest.fixture
+def restore_openai_session():
+    session, proxy = openai.requestssession, openai.proxy
+    yield
+    openai.requestssession, openai.proxy = session, proxy
+
+
+def test_http_session_matches_openai_defaults(restore_openai_session, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(openai, "proxy", "http://proxy.example:3128")
+    pool = ResourcePool(http_pool_maxsize=8)
+    try:
+        session = pool.http_session
+        assert openai.requestssession is session
+        assert session.proxies == {"http": "http://proxy.example:3128", "https": "http://proxy.example:3128"}
+        adapter = session.get_adapter("https://api.openai.com/v1")
+        assert adapter.max_retries.total == MAX_CONNECTION_RETRIES
+        assert adapter._pool_maxsize == 8
+    finally:
+        pool.close()
+
+
+def test_chat_models_are_shared_per_configuration(restore_openai_session, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    pool = ResourcePool(max_clients=2)
+    try:
+        first = pool.chat_model("gpt-3.5-turbo", 0.0)
+        assert pool.chat_model("gpt-3.5-turbo", 0.001) is first
+        pool.chat_model("gpt-3.5-turbo", 1.0)
+        pool.chat_model("gpt-4", 0.0)
+        # 上限を超えたら最も古いクライアントから捨てる
+        assert pool.chat_model("gpt-3.5-turbo", 0.0) is not first
+        assert (pool.hits, pool.misses) == (1, 4)
+    finally:
+        pool.close()
@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pytest
+from chatgpt_app.langchain_wrapper import response_cache
+from chatgpt_app.langchain_wrapper.response_cache import ResponseCache
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+def test_key_ignores_surrounding_whitespace_only() -> None:
+    messages = [SystemMessage(content="Be brief."), HumanMessage(content="Hello")]
+    key = ResponseCache.make_key("gpt-3.5-turbo", 0.0, messages)
+
+    assert key == ResponseCache.make_key("gpt-3.5-turbo", 0.0, [SystemMessage(content=" Be brief.\n"), messages[1]])
+    assert key != ResponseCache.make_key("gpt-4", 0.0, messages)
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", 0.5, messages)
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", 0.0, [messages[0], AIMessage(content="Hello")])
+
+
+def test_hit_and_miss_are_counted(tmp_path: Path, clock: Clock) -> None:
+    cache = ResponseCache(tmp_path / "responses.sqlite3")
+    cache.put("key", "gpt-3.5-turbo", "answer")
+
+    assert cache.get("key") == "answer"
+    assert cache.get("other") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl(tmp_path: Path, clock: Clock) -> None:
+    cache = ResponseCache(tmp_path / "responses.sqlite3", ttl_seconds=60)
+    cache.put("key", "gpt-3.5-turbo", "answer")
+
+    clock.now += 60
+    assert cache.get("key") == "answer"
+    clock.now += 1
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path: Path, clock: Clock) -> None:
+    cache = ResponseCache(tmp_path / "responses.sqlite3", max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, "gpt-3.5-turbo", key.upper())
+        clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.put("c", "gpt-3.5-turbo", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+
+
+def test_entries_are_evicted_past_max_bytes(tmp_path: Path, clock: Clock) -> None:
+    cache = ResponseCache(tmp_path / "responses.sqlite3", max_bytes=10)
+    cache.put("a", "gpt-3.5-turbo", "x" * 6)
+    clock.now += 1
+    cache.put("b", "gpt-3.5-turbo", "y" * 6)
+
+    assert cache.get("a") is None and cache.get("b") == "y" * 6
+
+
+def test_entries_survive_reopening(tmp_path: Path, clock: Clock) -> None:
+    ResponseCache(tmp_path / "responses.sqlite3").put("key", "gpt-3.5-turbo", "answer")
+
+    assert ResponseCache(tmp_path / "responses.sqlite3").get("key") == "answer"
@@ -0,0 +1,62 @@
+import pytest
+from chatgpt_app.web.sitemap import is_sitemap_url, parse_sitemap
+
+URLSET = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"
+        xmlns:video="http://www.google.com/schemas/sitemap-video/1.1">
+  <url>
+    <loc> https://example.com/a </loc>
+    <image:image><image:loc>https://example.com/a.png</image:loc></image:image>
+  </url>
+  <url>
+    <loc>https://example.com/b</loc>
+    <video:video><video:content_loc>https://example.com/b.mp4</video:content_loc></video:video>
+  </url>
+</urlset>
+"""
+
+SITEMAP_INDEX = """<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.com/sitemap1.xml</loc></sitemap>
+  <sitemap><loc>https://example.com/sitemap2.xml</loc><lastmod>2023-01-01</lastmod></sitemap>
+</sitemapindex>
+"""
+
+
+def test_urlset_ignores_image_and_video_locations() -> None:
+    assert parse_sitemap(URLSET) == (["https://example.com/a", "https://example.com/b"], [])
+
+
+def test_sitemap_index() -> None:
+    assert parse_sitemap(SITEMAP_INDEX) == (
+        [],
+        ["https://example.com/sitemap1.xml", "https://example.com/sitemap2.xml"],
+    )
+
+
+def test_without_namespace() -> None:
+    xml = "<urlset><url><loc>https://example.com/a</loc></url><url><loc></loc></url></urlset>"
+    assert parse_sitemap(xml) == (["https://example.com/a"], [])
+
+
+def test_loc_outside_url_is_ignored() -> None:
+    xml = "<urlset><loc>https://example.com/stray</loc><url><loc>https://example.com/a</loc></url></urlset>"
+    assert parse_sitemap(xml) == (["https://example.com/a"], [])
+
+
+def test_invalid_xml() -> None:
+    with pytest.raises(ValueError):
+        parse_sitemap("<urlset><url>")
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://example.com/sitemap.xml", True),
+        ("https://example.com/sitemap_index?page=2", True),
+        ("https://example.com/feed.XML", True),
+        ("https://example.com/blog/post", False),
+    ],
+)
+def test_is_sitemap_url(url: str, expected: bool) -> None:
+    assert is_sitemap_url(url) is expected
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+def loaded_modules(module: str, names: tuple) -> list:
+    """Import ``module`` in a fresh interpreter and return which of ``names`` it loaded."""
+    code = f"import sys, {module}; print(','.join(name for name in {names!r} if name in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, capture_output=True, text=True, check=True)
+    return [name for name in output.stdout.strip().split(",") if name]
+
+
+def test_startup_does_not_import_deferred_modules() -> None:
+    from chatgpt_app.init_app import DEFERRED_MODULES
+
+    assert loaded_modules("chatgpt_app.init_app", DEFERRED_MODULES) == []
+
+
+def test_package_exports_are_imported_on_use() -> None:
+    from chatgpt_app.langchain_wrapper import TokenChunker
+    from chatgpt_app.langchain_wrapper.token_chunker import TokenChunker as Direct
+
+    assert TokenChunker is Direct
@@ -0,0 +1,139 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from chatgpt_app import session
+from chatgpt_app.session import StreamlistSessionManager
+from chatgpt_app.storage import ChatRecord, ConversationStore, InMemoryConversationStore, SqliteConversationStore
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+RECORDS = [
+    ChatRecord(SystemMessage(content="You are a helpful assistant.")),
+    ChatRecord(HumanMessage(content="こんにちは")),
+    ChatRecord(AIMessage(content="Hello!"), 0.002),
+    ChatRecord(HumanMessage(content="Tell me more")),
+    ChatRecord(AIMessage(content="More."), 0.001),
+]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request: pytest.FixtureRequest, tmp_path: Path) -> ConversationStore:
+    if request.param == "sqlite":
+        return SqliteConversationStore(tmp_path / "conversations.sqlite3")
+    return InMemoryConversationStore()
+
+
+def test_round_trip(store: ConversationStore) -> None:
+    positions = [store.append("c1", record) for record in RECORDS]
+    store.append("c2", ChatRecord(HumanMessage(content="other"), 1.0))
+
+    assert positions == list(range(len(RECORDS)))
+    assert store.count("c1") == len(RECORDS)
+    assert store.load("c1") == RECORDS
+    assert store.load("c1", 1, 2) == RECORDS[1:3]
+    assert store.load("c1", 3) == RECORDS[3:]
+    assert store.load("c1", 10) == []
+
+
+def test_costs_are_charged_per_conversation(store: ConversationStore) -> None:
+    store.append("c1", RECORDS[2])
+    store.add_cost("c1", 0.002)
+    # メッセージを伴わないコスト (履歴の要約やページの要約) も数える
+    store.add_cost("c1", 0.0005)
+    store.add_cost("c2", 1.0)
+
+    assert store.total_cost("c1") == pytest.approx(0.0025)
+    assert store.total_cost("c2") == pytest.approx(1.0) and store.count("c2") == 0
+    store.delete("c1")
+    assert store.total_cost("c1") == 0.0
+
+
+def test_unknown_conversation(store: ConversationStore) -> None:
+    assert store.count("missing") == 0
+    assert store.load("missing") == []
+    assert store.total_cost("missing") == 0.0
+
+
+def test_delete(store: ConversationStore) -> None:
+    store.append("c1", RECORDS[1])
+    store.append("c2", RECORDS[2])
+    store.delete("c1")
+
+    assert store.count("c1") == 0 and store.load("c1") == []
+    # 消した会話の位置は 0 からやり直す
+    assert store.append("c1", RECORDS[3]) == 0
+    assert store.load("c2") == [RECORDS[2]]
+
+
+def test_sqlite_persists_across_connections(tmp_path: Path) -> None:
+    path = tmp_path / "conversations.sqlite3"
+    for record in RECORDS:
+        store = SqliteConversationStore(path)
+        store.append("c1", record)
+        store.add_cost("c1", record.cost or 0.0)
+
+    reopened = SqliteConversationStore(path)
+    assert reopened.load("c1") == RECORDS
+    assert reopened.total_cost("c1") == pytest.approx(0.003)
+
+
+def test_sqlite_migrates_costs_of_an_older_database(tmp_path: Path) -> None:
+    path = tmp_path / "conversations.sqlite3"
+    store = SqliteConversationStore(path)
+    for record in RECORDS:
+        store.append("c1", record)
+    # cost 列を足す前の DB にする
+    store._conn.execute("ALTER TABLE conversations DROP COLUMN cost")
+    store._conn.commit()
+
+    # メッセージのコストの合計から始める
+    assert SqliteConversationStore(path).total_cost("c1") == pytest.approx(0.003)
+
+
+@pytest.fixture
+def memory_store(monkeypatch: pytest.MonkeyPatch) -> Iterator[InMemoryConversationStore]:
+    # Streamlit の外なので、セッション状態はただの dict で代用する
+    monkeypatch.setattr(session.st, "session_state", {})
+    monkeypatch.setattr(session.st, "experimental_set_query_params", lambda **params: None)
+    store = InMemoryConversationStore()
+    monkeypatch.setattr(session, "get_conversation_store", lambda: store)
+    yield store
+
+
+def test_resumed_conversation_restores_costs(memory_store: InMemoryConversationStore) -> None:
+    sm = StreamlistSessionManager()
+    sm.add_message(SystemMessage(content="system"))
+    sm.add_message(HumanMessage(content="question"))
+    sm.add_message(AIMessage(content="answer"), 0.25)
+    sm.add_cost(0.25)
+    # 履歴の要約のコストはその回の回答と一緒に、ページの要約はメッセージなしで計上される
+    sm.add_message(HumanMessage(content="next question"))
+    sm.add_message(AIMessage(content="next answer"), 0.1 + 0.05)
+    sm.add_cost(0.1 + 0.05)
+    sm.add_cost(0.5)
+
+    resumed = StreamlistSessionManager(sm.get_conversation_id())
+    assert resumed.count_messages() == 5
+    assert resumed.get_messages()[-1].content == "next answer"
+    assert resumed.get_total_cost() == pytest.approx(sm.get_total_cost()) == pytest.approx(0.9)
+
+    resumed.clear_messages()
+    assert resumed.count_messages() == 0 and resumed.get_total_cost() == 0.0
+
+
+def test_followups_keep_only_recent_questions_and_urls(
+    monkeypatch: pytest.MonkeyPatch, memory_store: InMemoryConversationStore
+) -> None:
+    monkeypatch.setattr(session, "SESSION_RECENT_MESSAGES", 3)
+    monkeypatch.setattr(session, "SESSION_FOLLOWUP_URLS", 2)
+    sm = StreamlistSessionManager()
+    for i in range(5):
+        sm.add_followup("https://a.example", f"q{i}", f"a{i}")
+    sm.add_followup("https://b.example", "q", "a")
+    sm.add_followup("https://a.example", "q5", "a5")
+    sm.add_followup("https://c.example", "q", "a")
+
+    assert sm.get_followups("https://a.example") == [("q3", "a3"), ("q4", "a4"), ("q5", "a5")]
+    # 一番前に質問した URL から消える
+    assert sm.get_followups("https://b.example") == []
+    assert sm.get_followups("https://c.example") == [("q", "a")]
@@ -0,0 +1,104 @@
+from typing import Any, List, Optional
+
+import pytest
+from chatgpt_app.const import PageId
+from chatgpt_app.langchain_wrapper import GenerationBudget, get_usage_ledger
+from chatgpt_app.pages.chatgpt.base_chatgpt import BaseChatGPTPage
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.callbacks.streamlit.streamlit_callback_handler import StreamlitCallbackHandler
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult, HumanMessage
+from streamlit.runtime.scriptrunner import RerunData, RerunException, StopException
+
+TOKENS = [f"word{i} " for i in range(40)]
+
+
+class FakeStreamingChat(ChatOpenAI):
+    """ChatOpenAI that streams TOKENS instead of calling the API."""
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        for token in TOKENS:
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(TOKENS)))])
+
+
+@pytest.fixture
+def llm() -> ChatOpenAI:
+    # temperature > 0 なので回答はキャッシュされない
+    return FakeStreamingChat(model_name="gpt-3.5-turbo", temperature=1.0, openai_api_key="test", streaming=True)
+
+
+@pytest.fixture
+def page() -> BaseChatGPTPage:
+    return BaseChatGPTPage(PageId.CHATBOT, "test", sm=None)
+
+
+def interrupt_on_redraw(monkeypatch: pytest.MonkeyPatch, interrupt: BaseException, redraws: int) -> None:
+    """Make the ``redraws``-th redraw of the streamed answer raise like a script stopped by Streamlit."""
+    calls = []
+    original = StreamlitCallbackHandler.on_llm_new_token
+
+    def on_llm_new_token(self: StreamlitCallbackHandler, token: str, **kwargs: Any) -> None:
+        calls.append(token)
+        if len(calls) == redraws:
+            raise interrupt
+        original(self, token, **kwargs)
+
+    monkeypatch.setattr(StreamlitCallbackHandler, "on_llm_new_token", on_llm_new_token)
+
+
+@pytest.mark.parametrize("interrupt", [StopException(), RerunException(RerunData())], ids=["stop", "rerun"])
+def test_interrupted_stream_records_partial_answer(
+    monkeypatch: pytest.MonkeyPatch, llm: ChatOpenAI, page: BaseChatGPTPage, interrupt: BaseException
+) -> None:
+    interrupt_on_redraw(monkeypatch, interrupt, redraws=2)
+    recorded = []
+    ledger = get_usage_ledger()
+    records_before = len(ledger.recent_records())
+
+    with pytest.raises(type(interrupt)):
+        page.get_streaming_answer(
+            llm, [HumanMessage(content="hello")], lambda answer, cost: recorded.append((answer, cost))
+        )
+
+    assert len(recorded) == 1
+    answer, cost = recorded[0]
+    assert answer and "".join(TOKENS).startswith(answer) and answer != "".join(TOKENS)
+    assert cost > 0
+    usage = ledger.recent_records()[records_before:]
+    assert len(usage) == 1 and usage[0].error and usage[0].completion_tokens > 0
+
+
+def test_interrupted_stream_with_budget(
+    monkeypatch: pytest.MonkeyPatch, llm: ChatOpenAI, page: BaseChatGPTPage
+) -> None:
+    interrupt_on_redraw(monkeypatch, StopException(), redraws=2)
+    budget = GenerationBudget(llm.model_name)
+    recorded = []
+
+    with pytest.raises(StopException):
+        page.get_streaming_answer(
+            llm, [HumanMessage(content="hello")], lambda answer, cost: recorded.append((answer, cost)), budget
+        )
+
+    assert len(recorded) == 1
+    assert 0 < budget.completion_tokens < len(TOKENS)
+
+
+def test_completion_cap_returns_partial_answer(llm: ChatOpenAI, page: BaseChatGPTPage) -> None:
+    budget = GenerationBudget(llm.model_name, max_completion_tokens=5)
+    recorded = []
+
+    answer, cost = page.get_streaming_answer(
+        llm, [HumanMessage(content="hello")], lambda answer, cost: recorded.append((answer, cost)), budget
+    )
+
+    assert answer == "".join(TOKENS[:5])
+    assert recorded == [(answer, cost)]
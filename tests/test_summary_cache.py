@@ -0,0 +1,80 @@
+from typing import Any, Iterator, List, Optional
+
+import pytest
+from chatgpt_app.const import PageId
+from chatgpt_app.jobs import Job
+from chatgpt_app.pages.chatgpt.base_chatgpt import summary_cache
+from chatgpt_app.pages.chatgpt.web_summarize import WebSummarizePage
+from chatgpt_app.summarize import SummaryResult
+from langchain.chat_models import ChatOpenAI
+
+URL = "https://example.com/page"
+
+
+class FakeWebSummarizer:
+    """WebSummarizer stand-in that counts fetches and summaries; ``stop`` makes the summaries partial."""
+
+    def __init__(self, stop: Optional[str] = None) -> None:
+        self.llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.0, openai_api_key="test")
+        self.stop = stop
+        self.fetched: List[str] = []
+        self.summarized: List[str] = []
+
+    def fetch_content(self, url: str) -> str:
+        self.fetched.append(url)
+        return f"content of {url}"
+
+    def summarize_content(self, url: str, content: str, summarize_length: int, **kwargs: Any) -> SummaryResult:
+        self.summarized.append(url)
+        return SummaryResult(answer=f"summary of {url}", cost=0.01, source=content, stopped=self.stop)
+
+
+@pytest.fixture(autouse=True)
+def clear_summary_cache() -> Iterator[None]:
+    summary_cache.clear()
+    yield
+    summary_cache.clear()
+
+
+@pytest.fixture
+def page() -> WebSummarizePage:
+    return WebSummarizePage(PageId.WEB_SUMMARIZE, "test", sm=None)
+
+
+def test_single_summary_is_reused_by_later_jobs(page: WebSummarizePage) -> None:
+    summarizer = FakeWebSummarizer()
+
+    first = page.summarize_url(Job("a", "first", "a"), summarizer, URL, 300)
+    second = page.summarize_url(Job("b", "second", "b"), summarizer, URL, 300)
+
+    assert summarizer.summarized == [URL] and summarizer.fetched == [URL]
+    assert first.cost == 0.01 and second.answer == first.answer and second.cost == 0.0
+
+
+def test_batch_mode_reuses_a_single_summary(page: WebSummarizePage) -> None:
+    summarizer = FakeWebSummarizer()
+    page.summarize_url(Job("a", "single", "a"), summarizer, URL, 300)
+
+    items = page.summarize_batch(Job("b", "batch", "b"), summarizer, [URL], 300)
+
+    assert summarizer.summarized == [URL] and summarizer.fetched == [URL]
+    result, computed = items[0].result
+    assert result.answer == f"summary of {URL}" and not computed
+
+
+def test_other_length_is_summarized_again(page: WebSummarizePage) -> None:
+    summarizer = FakeWebSummarizer()
+    page.summarize_url(Job("a", "short", "a"), summarizer, URL, 300)
+    page.summarize_url(Job("b", "long", "b"), summarizer, URL, 600)
+
+    assert summarizer.summarized == [URL, URL]
+
+
+def test_stopped_summary_is_not_cached(page: WebSummarizePage) -> None:
+    stopped = FakeWebSummarizer(stop="cost limit reached")
+    result = page.summarize_url(Job("a", "stopped", "a"), stopped, URL, 300)
+    summarizer = FakeWebSummarizer()
+    again = page.summarize_url(Job("b", "again", "b"), summarizer, URL, 300)
+
+    assert result.stopped and result.cost == 0.01
+    assert not again.stopped and summarizer.summarized == [URL]
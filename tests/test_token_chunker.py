@@ -0,0 +1,70 @@
+import pytest
+from chatgpt_app.langchain_wrapper.token_chunker import TokenChunker
+from langchain.docstore.document import Document
+
+SENTENCES = "".join(f"Short sentence {i}. " for i in range(60))
+
+
+def test_chunks_cover_the_text_without_overlap(encoding) -> None:
+    chunks = TokenChunker(encoding, chunk_size=64).split_text(SENTENCES)
+
+    assert len(chunks) > 1
+    assert "".join(chunk.text for chunk in chunks) == SENTENCES
+    assert all(0 < chunk.token_count <= 64 for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.end_index == chunk.start_index
+
+
+def test_chunks_end_after_a_sentence(encoding) -> None:
+    chunks = TokenChunker(encoding, chunk_size=64).split_text(SENTENCES)
+
+    assert all(chunk.text.rstrip().endswith(".") for chunk in chunks)
+
+
+def test_chunks_end_before_a_word_without_sentence_endings(encoding) -> None:
+    text = " ".join(f"word{i}" for i in range(300))
+    chunks = TokenChunker(encoding, chunk_size=64).split_text(text)
+
+    assert all(chunk.text.startswith(" ") for chunk in chunks[1:])
+
+
+def test_overlap_repeats_the_end_of_the_previous_chunk(encoding) -> None:
+    chunker = TokenChunker(encoding, chunk_size=64, chunk_overlap=16)
+    chunks = chunker.split_text(SENTENCES)
+
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.start_index < previous.end_index
+        assert previous.text.endswith(SENTENCES[chunk.start_index : previous.end_index])
+    # 次のチャンクは前のチャンクの末尾 16 トークンから始まる
+    total_tokens = len(encoding.encode_ordinary(SENTENCES))
+    assert sum(chunk.token_count for chunk in chunks) - 16 * (len(chunks) - 1) == total_tokens
+    assert chunks[-1].end_index == len(SENTENCES)
+
+
+def test_offsets_are_characters_in_multibyte_text(encoding) -> None:
+    text = "これは日本語の文です。" * 40
+    chunks = TokenChunker(encoding, chunk_size=50).split_text(text)
+
+    assert "".join(chunk.text for chunk in chunks) == text
+    assert all(text[chunk.start_index : chunk.end_index] == chunk.text for chunk in chunks)
+
+
+def test_empty_text_has_no_chunks(encoding) -> None:
+    assert TokenChunker(encoding, chunk_size=10).split_text("") == []
+
+
+def test_overlap_must_be_smaller_than_chunk_size(encoding) -> None:
+    with pytest.raises(ValueError):
+        TokenChunker(encoding, chunk_size=10, chunk_overlap=10)
+
+
+def test_documents_keep_their_metadata(encoding) -> None:
+    documents = TokenChunker(encoding, chunk_size=64).split_documents(
+        [Document(page_content=SENTENCES, metadata={"source": "video"})]
+    )
+
+    assert len(documents) > 1
+    assert all(document.metadata["source"] == "video" for document in documents)
+    assert documents[0].metadata["start_index"] == 0
+    assert documents[-1].metadata["end_index"] == len(SENTENCES)
@@ -0,0 +1,52 @@
+import json
+import threading
+
+from chatgpt_app.tracing import Tracer, set_trace_session
+
+
+def run_in_session(session: str, func) -> None:
+    # セッションはコンテキスト変数なので、別スレッドで設定してもテスト本体には影響しない
+    thread = threading.Thread(target=lambda: (set_trace_session(session), func()))
+    thread.start()
+    thread.join()
+
+
+def test_nested_spans_form_one_trace() -> None:
+    tracer = Tracer()
+    with tracer.span("root", page="chat"):
+        with tracer.span("child") as child:
+            child.set(tokens=3)
+
+    (spans,) = tracer.traces()
+    root, child = spans
+    assert [root.name, child.name] == ["root", "child"]
+    assert child.parent_id == root.span_id and child.trace_id == root.trace_id
+    assert child.attributes == {"tokens": 3}
+
+
+def test_traces_are_filtered_by_session() -> None:
+    tracer = Tracer()
+
+    def trace(name: str) -> None:
+        with tracer.span(name):
+            with tracer.span("llm"):
+                pass
+
+    run_in_session("a", lambda: trace("chat a"))
+    run_in_session("b", lambda: trace("chat b"))
+
+    assert [spans[0].name for spans in tracer.traces()] == ["chat b", "chat a"]
+    assert [spans[0].name for spans in tracer.traces("a")] == ["chat a"]
+    assert all(span.session == "a" for span in tracer.traces("a")[0])
+    assert [trace["spans"][0]["name"] for trace in json.loads(tracer.to_json("b"))] == ["chat b"]
+    events = json.loads(tracer.to_chrome_trace("b"))["traceEvents"]
+    assert {event["name"] for event in events if event["ph"] == "X"} == {"chat b", "llm"}
+
+
+def test_only_the_latest_traces_are_kept() -> None:
+    tracer = Tracer(max_traces=2)
+    for name in ("first", "second", "third"):
+        with tracer.span(name):
+            pass
+
+    assert [spans[0].name for spans in tracer.traces()] == ["third", "second"]
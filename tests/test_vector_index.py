@@ -0,0 +1,130 @@
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+from chatgpt_app.retrieval import HashingEmbedder, VectorIndex
+from chatgpt_app.summarize import Summarizer, WebSummarizer, YouTubeSummarizer
+from chatgpt_app.summarize import base as summarize_base
+from langchain.chat_models import ChatOpenAI
+from langchain.docstore.document import Document
+
+URL = "https://example.com/page"
+TEXTS = [
+    "Python is a programming language with dynamic typing.",
+    "The weather today is sunny with a light breeze.",
+    "Tokyo is the capital city of Japan.",
+    "東京は日本の首都です。",
+]
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> VectorIndex:
+    return VectorIndex(tmp_path, HashingEmbedder(dim=1024))
+
+
+def test_search_returns_the_most_similar_chunks_first(index: VectorIndex) -> None:
+    index.add(URL, TEXTS)
+
+    hits = index.search(URL, "What is the capital of Japan?", k=2)
+
+    assert len(hits) == 2
+    assert hits[0].position == 2 and hits[0].text == TEXTS[2]
+    assert hits[0].score >= hits[1].score
+
+
+def test_search_matches_japanese_text(index: VectorIndex) -> None:
+    index.add(URL, TEXTS)
+
+    assert index.search(URL, "日本の首都はどこ", k=1)[0].position == 3
+
+
+def test_k_larger_than_the_chunks(index: VectorIndex) -> None:
+    index.add(URL, TEXTS)
+
+    assert sorted(hit.position for hit in index.search(URL, "python", k=10)) == [0, 1, 2, 3]
+
+
+def test_unknown_url_has_no_hits(index: VectorIndex) -> None:
+    assert index.search(URL, "python", k=3) == []
+
+
+def test_ensure_skips_an_unchanged_fingerprint(index: VectorIndex) -> None:
+    builds: List[int] = []
+
+    def build() -> List[str]:
+        builds.append(1)
+        return TEXTS
+
+    assert index.ensure(URL, "v1", build)
+    assert not index.ensure(URL, "v1", build)
+    assert index.ensure(URL, "v2", build)
+    assert len(builds) == 2
+
+
+def test_index_is_reused_after_reopening(tmp_path: Path) -> None:
+    VectorIndex(tmp_path, HashingEmbedder(dim=1024)).add(URL, TEXTS, fingerprint="v1")
+    reopened = VectorIndex(tmp_path, HashingEmbedder(dim=1024))
+
+    assert not reopened.ensure(URL, "v1", lambda: pytest.fail("should not rebuild"))
+    assert reopened.search(URL, "sunny weather", k=1)[0].position == 1
+
+
+def test_add_replaces_the_chunks(index: VectorIndex) -> None:
+    index.add(URL, TEXTS)
+    index.search(URL, "python", k=1)
+    index.add(URL, ["Only one chunk about cooking pasta."])
+
+    hits = index.search(URL, "python", k=3)
+    assert [hit.text for hit in hits] == ["Only one chunk about cooking pasta."]
+
+
+def test_oldest_urls_are_pruned(tmp_path: Path) -> None:
+    index = VectorIndex(tmp_path, HashingEmbedder(dim=64), max_urls=2)
+    for i in range(3):
+        index.add(f"{URL}/{i}", TEXTS)
+
+    assert index.search(f"{URL}/0", "python", k=1) == []
+    assert index.search(f"{URL}/2", "python", k=1)
+
+
+def test_remove(index: VectorIndex) -> None:
+    index.add(URL, TEXTS)
+    index.remove(URL)
+
+    assert index.search(URL, "python", k=1) == []
+
+
+def test_nothing_to_index(index: VectorIndex) -> None:
+    with pytest.raises(ValueError):
+        index.add(URL, [])
+
+
+@pytest.mark.parametrize("kind", ["web", "youtube"])
+def test_followups_chunk_the_source_only_when_it_changes(
+    monkeypatch: pytest.MonkeyPatch, index: VectorIndex, kind: str
+) -> None:
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", openai_api_key="test")
+    if kind == "web":
+        summarizer: Summarizer = WebSummarizer(llm)
+        source: Any = " ".join(TEXTS)
+        changed: Any = source + " Pasta is cooked in boiling water."
+    else:
+        summarizer = YouTubeSummarizer(llm)
+        source = [Document(page_content=text) for text in TEXTS]
+        changed = [*source, Document(page_content="Pasta is cooked in boiling water.")]
+    monkeypatch.setattr(summarize_base, "get_vector_index", lambda: index)
+    calls: List[Any] = []
+    index_chunks = summarizer.index_chunks
+
+    def counting_index_chunks(source: Any) -> List[str]:
+        calls.append(source)
+        return index_chunks(source)
+
+    monkeypatch.setattr(summarizer, "index_chunks", counting_index_chunks)
+
+    summarizer.followup_prompt(URL, source, "What is the capital of Japan?")
+    _, hits = summarizer.followup_prompt(URL, source, "What is the weather like?")
+    assert len(calls) == 1 and hits
+
+    summarizer.followup_prompt(URL, changed, "How is pasta cooked?")
+    assert len(calls) == 2